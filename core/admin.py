@@ -1,6 +1,6 @@
 from django.contrib import admin, messages
 # Register your models here.
-from .models import MessageContact, Slider, Actualite, Logo, ActualiteImage, QuickBlock, Faq, FaqStep, FaqStepImage, FaqSection, Forfait, Produit, ZoneCouverture, Commune, Categorie, SousCategorie, Agence, Order, OrderItem, WifiTicketType, WifiTicket
+from .models import MessageContact, Slider, Actualite, Logo, ActualiteImage, QuickBlock, Faq, FaqStep, FaqStepImage, FaqSection, Forfait, Produit, ZoneCouverture, Commune, Categorie, SousCategorie, Agence, Order, OrderItem, WifiTicketType, WifiTicket, EmailSortant
 
 from django import forms
 from django.core.exceptions import ValidationError
@@ -8,7 +8,7 @@ import re
 
 from django.contrib import admin
 from .models import Order, OrderItem
-from .views import envoyer_email_avec_logo  # Ajout de l'import
+from .emails import envoyer_email_avec_logo
 
 
 class OrderItemInline(admin.TabularInline):
@@ -209,3 +209,11 @@ class WifiTicketAdmin(admin.ModelAdmin):
         return obj.is_expired()
     is_expired.short_description = "Expiré ?"
     is_expired.boolean = True
+
+
+@admin.register(EmailSortant)
+class EmailSortantAdmin(admin.ModelAdmin):
+    list_display = ('sujet', 'statut', 'tentatives', 'prochain_essai', 'date_creation', 'date_envoi')
+    list_filter = ('statut',)
+    search_fields = ('sujet',)
+    readonly_fields = ('date_creation', 'date_envoi', 'derniere_erreur')
@@ -0,0 +1,293 @@
+import json
+import os
+import statistics
+import threading
+import time
+import tracemalloc
+import uuid
+import zlib
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, NamedTuple
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .jetons_google import DUREE_PAR_DEFAUT, oublier_cles
+from .models import Panier, PanierItem, Produit, SousCategorie
+from .panier import recalculer, resume_tenu
+
+# Références et budgets versionnés avec le code (voir la commande bench_vues)
+FICHIER_REFERENCES = Path(__file__).resolve().parent / 'bench_vues.json'
+SEUIL = 0.25
+# Marges absolues : sous ces écarts la mesure n'est que du bruit
+MARGE_MS = 5
+MARGE_KO = 64
+LIGNES_PANIER = 5
+
+INFOS_COMMANDE = {
+    'nom': 'Client Bench',
+    'telephone': '0700000000',
+    'email': 'bench@example.com',
+    'adresse': 'Rue du bench',
+    'choix_retrait': 'livraison',
+    'region_id': None,
+    'commune_id': None,
+}
+CLIENT_ID_BENCH = 'bench.apps.googleusercontent.com'
+
+
+class Donnees(NamedTuple):
+    user: User
+    produit: Produit
+    sous_categorie: SousCategorie
+    produits_panier: list
+
+
+class Scenario(NamedTuple):
+    nom: str
+    url: Callable  # donnees -> url
+    connecte: bool = False
+    methode: str = 'get'
+    preparer: Callable = None  # (client, donnees) -> None, hors mesure
+    contexte: Callable = None  # () -> gestionnaire de contexte autour de toutes les requêtes
+    corps: Callable = None  # (donnees, valeur du contexte) -> données POST
+
+
+class Mesure(NamedTuple):
+    nom: str
+    requetes: int
+    temps_ms: float
+    memoire_ko: float
+
+
+def donnees_bench():
+    """Objets utilisés par les scénarios, pris dans la base déjà peuplée (seed_scale)."""
+    user = User.objects.annotate(nb=Count('order')).order_by('-nb', 'pk').first()
+    produits = list(Produit.objects.filter(quantite__gt=0).order_by('pk')[:LIGNES_PANIER])
+    sous_categorie = (
+        SousCategorie.objects.annotate(nb=Count('produits')).order_by('-nb', 'pk').first()
+    )
+    if not user or not produits or not sous_categorie:
+        raise ValueError("Base vide : lancer d'abord seed_scale")
+    return Donnees(user, produits[0], sous_categorie, produits)
+
+
+def remplir_panier(client, donnees):
+    panier, _ = Panier.objects.get_or_create(user=donnees.user)
+    with resume_tenu():
+        PanierItem.objects.filter(panier=panier).delete()
+    PanierItem.objects.bulk_create([
+        PanierItem(panier=panier, produit=produit, quantite=1) for produit in donnees.produits_panier
+    ])
+    recalculer(panier)
+
+
+def preparer_commande(client, donnees):
+    remplir_panier(client, donnees)
+    session = client.session
+    session['commande_infos'] = INFOS_COMMANDE
+    session.save()
+
+
+class ModeTest:
+    """
+    Paire de clés RSA locale et faux point de certificats (serveur HTTP sur
+    127.0.0.1) : la connexion Google complète (core/jetons_google.py),
+    téléchargement des clés compris, sans accès au réseau. Pour les tests et
+    les mesures hors ligne :
+        with ModeTest() as google, override_settings(GOOGLE_CERTS_URL=google.url):
+            client.post(reverse('auth_receiver'), {'credential': google.jeton(email, client_id)})
+    """
+
+    def __init__(self, max_age=DUREE_PAR_DEFAUT):
+        self.cle_privee = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = uuid.uuid4().hex
+        self.max_age = max_age
+        self.telechargements = 0
+        self.url = None
+
+    def jwks(self):
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.cle_privee.public_key()))
+        jwk.update(kid=self.kid, alg='RS256', use='sig')
+        return {'keys': [jwk]}
+
+    def jeton(self, email, client_id, **revendications):
+        maintenant = int(time.time())
+        contenu = {
+            'iss': 'https://accounts.google.com',
+            'aud': client_id,
+            'sub': str(zlib.crc32(email.encode())),
+            'email': email,
+            'email_verified': True,
+            'name': email.split('@')[0],
+            'iat': maintenant,
+            'exp': maintenant + 3600,
+            **revendications,
+        }
+        return jwt.encode(contenu, self.cle_privee, algorithm='RS256', headers={'kid': self.kid})
+
+    def __enter__(self):
+        mode = self
+
+        class Certificats(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mode.telechargements += 1
+                corps = json.dumps(mode.jwks()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', f'public, max-age={mode.max_age}, must-revalidate')
+                self.send_header('Content-Length', str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        self._serveur = ThreadingHTTPServer(('127.0.0.1', 0), Certificats)
+        threading.Thread(target=self._serveur.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._serveur.server_port}/oauth2/v3/certs"
+        return self
+
+    def __exit__(self, *exc):
+        self._serveur.shutdown()
+        self._serveur.server_close()
+
+
+@contextmanager
+def google_hors_ligne():
+    """Connexion Google sur une paire de clés locale (ModeTest), caches de clés vidés au départ."""
+    with ModeTest() as google, override_settings(GOOGLE_CERTS_URL=google.url), \
+            mock.patch.dict(os.environ, {'GOOGLE_OAUTH_CLIENT_ID': CLIENT_ID_BENCH}):
+        oublier_cles()
+        yield google
+
+
+def deconnecter(client, donnees):
+    client.logout()
+
+
+SCENARIOS = (
+    Scenario('accueil', lambda d: reverse('accueil')),
+    Scenario('equipements', lambda d: reverse('equipements')),
+    Scenario('sous_categorie_detail', lambda d: reverse('sous_categorie_detail', args=[d.sous_categorie.pk])),
+    Scenario('produit_detail', lambda d: reverse('produit_detail', args=[d.produit.pk])),
+    Scenario('voir_panier', lambda d: reverse('panier'), connecte=True, preparer=remplir_panier),
+    Scenario('commande_confirmation', lambda d: reverse('commande_confirmation'),
+             connecte=True, preparer=preparer_commande),
+    Scenario('commande_confirmation (POST)', lambda d: reverse('commande_confirmation'),
+             connecte=True, methode='post', preparer=preparer_commande),
+    Scenario('mes_commandes', lambda d: reverse('mes_commandes'), connecte=True),
+    Scenario('zone_couverture', lambda d: reverse('zone_couverture')),
+    Scenario('faq', lambda d: reverse('faq')),
+    Scenario('tickets', lambda d: reverse('tickets')),
+    # La chauffe télécharge les clés ; les tours mesurés les lisent en mémoire
+    Scenario('auth_receiver (POST)', lambda d: reverse('auth_receiver'), methode='post',
+             preparer=deconnecter, contexte=google_hors_ligne,
+             corps=lambda d, google: {'credential': google.jeton(d.user.email, CLIENT_ID_BENCH)}),
+)
+
+
+def _requete(client, scenario, url, corps=None):
+    reponse = getattr(client, scenario.methode)(url, corps)
+    if reponse.status_code >= 400 or (scenario.methode == 'get' and reponse.status_code != 200):
+        raise AssertionError(f"{scenario.nom} : réponse {reponse.status_code} pour {url}")
+    return reponse
+
+
+def mesurer(client, scenario, donnees, repetitions=5):
+    """
+    Une requête de chauffe (caches, templates compilés), puis `repetitions`
+    requêtes mesurées : médiane du temps, nombre de requêtes SQL de la
+    dernière. La mémoire (pic alloué par Python) est mesurée sur une requête
+    à part, tracemalloc ralentissant fortement l'exécution.
+    Le cache de pages anonymes est coupé : on mesure la vue, pas une copie en cache.
+    """
+    with override_settings(PAGE_CACHE_TTL=0), (scenario.contexte or nullcontext)() as contexte:
+        return _mesurer(client, scenario, donnees, repetitions, contexte)
+
+
+def _mesurer(client, scenario, donnees, repetitions, contexte=None):
+    url = scenario.url(donnees)
+    if scenario.connecte:
+        client.force_login(donnees.user)
+    else:
+        client.logout()
+
+    durees = []
+    requetes = 0
+    # Tour 0 : chauffe, non retenu
+    for tour in range(max(repetitions, 1) + 1):
+        if scenario.preparer:
+            scenario.preparer(client, donnees)
+        corps = scenario.corps(donnees, contexte) if scenario.corps else None
+        with CaptureQueriesContext(connection) as capture:
+            debut = time.perf_counter()
+            _requete(client, scenario, url, corps)
+            duree = time.perf_counter() - debut
+        if tour:
+            durees.append(duree)
+            requetes = len(capture)
+
+    if scenario.preparer:
+        scenario.preparer(client, donnees)
+    corps = scenario.corps(donnees, contexte) if scenario.corps else None
+    tracemalloc.start()
+    try:
+        _requete(client, scenario, url, corps)
+        pic = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return Mesure(scenario.nom, requetes, round(statistics.median(durees) * 1000, 2), round(pic / 1024, 1))
+
+
+def charger_references(chemin=FICHIER_REFERENCES):
+    try:
+        with open(chemin, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def enregistrer_references(mesures, chemin=FICHIER_REFERENCES):
+    """Écrit les mesures comme nouvelles références. Les budgets existants sont conservés."""
+    references = charger_references(chemin)
+    for mesure in mesures:
+        budget = references.get(mesure.nom, {}).get('budget_requetes', mesure.requetes)
+        references[mesure.nom] = {
+            'budget_requetes': budget,
+            'requetes': mesure.requetes,
+            'temps_ms': mesure.temps_ms,
+            'memoire_ko': mesure.memoire_ko,
+        }
+    with open(chemin, 'w', encoding='utf-8') as f:
+        json.dump(references, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return references
+
+
+def comparer(mesures, references, seuil=SEUIL):
+    """
+    Liste des dépassements : budget de requêtes (strict), puis temps et
+    mémoire au-delà de `seuil` (0.25 = +25 %) par rapport à la référence.
+    """
+    echecs = []
+    for mesure in mesures:
+        reference = references.get(mesure.nom)
+        if not reference:
+            continue
+        if mesure.requetes > reference['budget_requetes']:
+            echecs.append(f"{mesure.nom} : {mesure.requetes} requêtes pour un budget de {reference['budget_requetes']}")
+        if mesure.temps_ms > reference['temps_ms'] * (1 + seuil) + MARGE_MS:
+            echecs.append(f"{mesure.nom} : {mesure.temps_ms} ms au lieu de {reference['temps_ms']} ms")
+        if mesure.memoire_ko > reference['memoire_ko'] * (1 + seuil) + MARGE_KO:
+            echecs.append(f"{mesure.nom} : {mesure.memoire_ko} Ko au lieu de {reference['memoire_ko']} Ko")
+    return echecs
@@ -0,0 +1,73 @@
+import hashlib
+
+from django.core.cache import cache
+
+# Durée de vie par défaut des entrées versionnées : l'invalidation se fait
+# par changement de version, ce délai ne sert qu'à purger les anciennes clés.
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(namespace):
+    return f"core:version:{namespace}"
+
+
+def get_version(namespace):
+    """Retourne la version courante d'un espace de cache (1 par défaut)."""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def bump_version(namespace):
+    """Invalide toutes les clés d'un espace en incrémentant sa version."""
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        # Clé absente (cache vidé ou jamais initialisé)
+        cache.set(_version_key(namespace), 2, None)
+        return 2
+
+
+def get_versions(*namespaces):
+    """Versions de plusieurs espaces en une seule lecture du cache."""
+    keys = {_version_key(ns): ns for ns in namespaces}
+    found = cache.get_many(list(keys))
+    return {ns: found[key] if key in found else get_version(ns) for key, ns in keys.items()}
+
+
+def fragment_key(name, namespaces, vary_on=()):
+    """
+    Clé d'un fragment de template : change dès qu'un des espaces dont il
+    dépend est invalidé, ou qu'une des valeurs `vary_on` change.
+    """
+    versions = get_versions(*namespaces)
+    parts = ':'.join(f"{ns}.v{versions[ns]}" for ns in namespaces)
+    key = f"core:fragment:{name}:{parts}"
+    if vary_on:
+        key += ':' + hashlib.md5(':'.join(str(v) for v in vary_on).encode()).hexdigest()
+    return key
+
+
+def versioned_key(namespace, name):
+    return f"core:{namespace}:v{get_version(namespace)}:{name}"
+
+
+def get_or_build(namespace, name, builder, timeout=DEFAULT_TIMEOUT):
+    """
+    Lit une valeur dans l'espace versionné ou la construit via builder().
+    Les valeurs None sont stockées sous forme de sentinelle pour éviter de
+    relancer la requête à chaque page quand il n'y a rien en base.
+    """
+    key = versioned_key(namespace, name)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = builder()
+        cache.set(key, _NONE if value is None else value, timeout)
+        return value
+    return None if value == _NONE else value
+
+
+_MISSING = object()
+_NONE = "__none__"
@@ -0,0 +1,41 @@
+from django.db.models import Count, Prefetch
+from django.db.models.functions import Substr
+
+from .models import Categorie, SousCategorie, Produit
+
+# Produits affichés par sous-catégorie sur la page équipements
+PRODUITS_PAR_SOUS_CATEGORIE = 4
+# Colonnes lues pour une carte produit (ni description complète ni caractéristiques)
+CHAMPS_CARTE_PRODUIT = ('id', 'nom', 'prix', 'quantite', 'image', 'sous_categorie_id')
+# Les cartes tronquent la description à 60 caractères : 61 suffisent pour le "…"
+LONGUEUR_RESUME = 61
+PRODUITS_PAR_PAGE = 12
+
+
+def produits_carte(longueur_resume=LONGUEUR_RESUME):
+    """Produits avec seulement les colonnes d'une carte et un résumé de la description."""
+    return Produit.objects.only(*CHAMPS_CARTE_PRODUIT).annotate(
+        resume=Substr('description', 1, longueur_resume),
+    )
+
+
+def categories_avec_apercu(n=PRODUITS_PAR_SOUS_CATEGORIE):
+    """
+    Catégories avec leurs sous-catégories (annotées de nb_produits) et les n
+    premiers produits de chacune dans `apercu`. Le préchargement découpé est
+    traduit par Django en une requête ROW_NUMBER() OVER (PARTITION BY
+    sous_categorie_id) : trois requêtes au total quelle que soit la taille du
+    catalogue.
+    """
+    sous_categories = (
+        SousCategorie.objects.annotate(nb_produits=Count('produits'))
+        .order_by('pk')
+        .prefetch_related(Prefetch(
+            'produits',
+            queryset=produits_carte().order_by('pk')[:n],
+            to_attr='apercu',
+        ))
+    )
+    return Categorie.objects.prefetch_related(
+        Prefetch('sous_categories', queryset=sous_categories)
+    ).order_by('pk')
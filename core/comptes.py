@@ -0,0 +1,43 @@
+import itertools
+import re
+import secrets
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+# Suffixe aléatoire ajouté quand le nom est déjà pris : 10**6 valeurs rendent
+# une nouvelle collision improbable, même pour les prénoms les plus courants
+SUFFIXE_MAX = 10 ** 6
+ESSAIS = 8
+LONGUEUR_MAX = User._meta.get_field('username').max_length - len(str(SUFFIXE_MAX))
+
+
+def base_username(email):
+    """Partie locale de l'email, réduite aux caractères acceptés par le validateur de Django."""
+    base = re.sub(r'[^\w.@+-]', '', email.split('@')[0])[:LONGUEUR_MAX]
+    return base or 'utilisateur'
+
+
+def creer_utilisateur(email, first_name='', last_name=''):
+    """
+    Crée un utilisateur au nom dérivé de son email, sans compter la table :
+    le nom nu d'abord, puis avec un suffixe aléatoire. La contrainte d'unicité
+    de username tranche entre deux inscriptions simultanées ; chaque essai a
+    son point de sauvegarde, le perdant réessaie avec un autre suffixe.
+    Coût constant (une insertion, rarement deux) quelle que soit la taille de la table.
+    """
+    base = base_username(email)
+    candidats = itertools.chain([base], (f"{base}{secrets.randbelow(SUFFIXE_MAX)}" for _ in range(ESSAIS)))
+    for username in candidats:
+        try:
+            with transaction.atomic():
+                # Sans mot de passe : create_user le rend inutilisable
+                return User.objects.create_user(
+                    username=username,
+                    email=email,
+                    first_name=first_name,
+                    last_name=last_name,
+                )
+        except IntegrityError:
+            continue
+    raise IntegrityError(f"Aucun nom d'utilisateur libre pour {email} après {ESSAIS + 1} essais")
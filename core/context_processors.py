@@ -1,39 +1,63 @@
-from django.db import models
-from .models import Logo, Categorie, Panier, PanierItem
+from django.utils.functional import SimpleLazyObject
+
+from .caching import get_or_build
+from .models import Logo, Categorie
+from .panier import get_panier_count, lire_panier_anonyme
+
+
+def _load_logo():
+    return Logo.objects.filter(actif=True).first() or Logo.objects.first()
+
+
+def _load_menu():
+    menu = {}
+    for nom in ("Equipement", "Accessoire"):
+        categorie = Categorie.objects.filter(nom__iexact=nom).prefetch_related('sous_categories').first()
+        menu[nom] = list(categorie.sous_categories.all()) if categorie else []
+    return menu
+
+
+def logo_actif():
+    """Logo actif (ou à défaut le premier), lu depuis le cache versionné."""
+    return get_or_build('logo', 'actif', _load_logo)
+
+
+def _safe(loader, default, label):
+    def wrapper():
+        try:
+            return loader()
+        except Exception as e:
+            print(f"Error in {label}: {e}")
+            return default
+    return wrapper
+
 
 def logo_context(request):
-    """Retourne le logo actif ou None si aucun logo"""
-    try:
-        logo = Logo.objects.filter(actif=True).first() or Logo.objects.first()
-        return {'logo': logo}
-    except Exception as e:
-        print(f"Error in logo_context: {e}")
-        return {'logo': None}
+    """Retourne le logo actif (évalué uniquement si le template le lit)"""
+    return {
+        'logo': SimpleLazyObject(_safe(logo_actif, None, 'logo_context')),
+    }
+
 
 def menu_categories(request):
-    """Retourne les catégories d'équipement et d'accessoire avec leurs sous-catégories"""
-    try:
-        equipement = Categorie.objects.filter(nom__iexact="Equipement").prefetch_related('sous_categories').first()
-        accessoire = Categorie.objects.filter(nom__iexact="Accessoire").prefetch_related('sous_categories').first()
-        return {
-            'equipement_categories': list(equipement.sous_categories.all()) if equipement else [],
-            'accessoire_categories': list(accessoire.sous_categories.all()) if accessoire else [],
-        }
-    except Exception as e:
-        print(f"Error in menu_categories: {e}")
-        return {
-            'equipement_categories': [],
-            'accessoire_categories': [],
-        }
+    """Retourne les sous-catégories d'équipement et d'accessoire, depuis le cache versionné"""
+    menu = SimpleLazyObject(_safe(
+        lambda: get_or_build('menu', 'categories', _load_menu),
+        {"Equipement": [], "Accessoire": []},
+        'menu_categories',
+    ))
+    return {
+        'equipement_categories': SimpleLazyObject(lambda: menu["Equipement"]),
+        'accessoire_categories': SimpleLazyObject(lambda: menu["Accessoire"]),
+    }
+
 
 def panier_count(request):
-    """Retourne le nombre d'articles dans le panier de l'utilisateur"""
-    try:
-        if request.user.is_authenticated:
-            panier, created = Panier.objects.get_or_create(user=request.user)
-            count = PanierItem.objects.filter(panier=panier).aggregate(total=models.Sum('quantite'))['total'] or 0
-            return {'panier_count': count}
-    except Exception as e:
-        print(f"Error in panier_count: {e}")
-    
-    return {'panier_count': 0}
\ No newline at end of file
+    """Retourne le nombre d'articles dans le panier de l'utilisateur (sans écriture en base)"""
+    def load():
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return sum(lire_panier_anonyme(request).values())
+        return get_panier_count(user)
+
+    return {'panier_count': SimpleLazyObject(_safe(load, 0, 'panier_count'))}
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+from django.urls import reverse
+
+from .caching import get_or_build
+from .models import Commune, Forfait, Horodatage, ZoneCouverture
+
+# Types de forfait qui exigent une commune couverte ; les autres (FH) sont
+# disponibles partout et servent de repli
+TYPES_ZONE_COUVERTE = frozenset({'FO'})
+ESPACES_INDEX = ('zone', 'forfait')
+
+
+def _construire():
+    regions = {
+        pk: {'id': pk, 'nom': nom, 'communes': []}
+        for pk, nom in ZoneCouverture.objects.order_by('pk').values_list('pk', 'region')
+    }
+    for pk, nom, zone_id in Commune.objects.order_by('nom', 'pk').values_list('pk', 'nom', 'zone_id'):
+        regions[zone_id]['communes'].append([pk, nom])
+    # Format compact : {"regions": [{"id", "nom", "communes": [[id, nom], ...]}]}
+    contenu = json.dumps(
+        {'regions': list(regions.values())}, ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf-8')
+    return {
+        'regions': [{'id': r['id'], 'region': r['nom']} for r in regions.values()],
+        'json': contenu,
+        'empreinte': hashlib.sha256(contenu).hexdigest()[:16],
+    }
+
+
+def couverture():
+    """
+    Régions et communes couvertes, depuis le cache versionné 'zone' (deux
+    requêtes seulement quand une zone ou une commune a changé) :
+    - regions : [{'id', 'region'}] pour les <select> rendus côté serveur ;
+    - json : document de l'API /api/couverture/ ;
+    - empreinte : hash du contenu, clé de cache des navigateurs.
+    """
+    return get_or_build('zone', 'couverture', _construire)
+
+
+def formulaire_couverture():
+    """Contexte des formulaires région -> commune : les communes sont chargées à la demande."""
+    donnees = couverture()
+    return {
+        'regions': donnees['regions'],
+        'url_couverture': f"{reverse('api_couverture')}?v={donnees['empreinte']}",
+    }
+
+
+class IndexCouverture(NamedTuple):
+    """Instantané figé de la couverture et des forfaits, pour des tests d'éligibilité sans requête."""
+    signature: tuple
+    zones: MappingProxyType        # {id: ZoneCouverture}
+    communes: MappingProxyType     # {id: Commune}
+    eligibilite: MappingProxyType  # {(zone_id, commune_id): frozenset des types}
+    types_partout: frozenset
+    forfaits_repli: tuple          # forfaits disponibles hors zone couverte
+
+    def localiser(self, zone_id, commune_id):
+        """(zone, commune) à partir d'identifiants (chaînes acceptées) ; commune None si hors de la zone."""
+        zone = self.zones.get(_entier(zone_id))
+        commune = self.communes.get(_entier(commune_id))
+        if zone is None or commune is None or commune.zone_id != zone.pk:
+            commune = None
+        return zone, commune
+
+    def types_eligibles(self, zone_id, commune_id):
+        return self.eligibilite.get((_entier(zone_id), _entier(commune_id)), self.types_partout)
+
+    def est_eligible(self, type_forfait, zone_id, commune_id):
+        return type_forfait in self.types_eligibles(zone_id, commune_id)
+
+
+def _entier(valeur):
+    try:
+        return int(valeur)
+    except (TypeError, ValueError):
+        return None
+
+
+def _construire_index(signature):
+    types = frozenset(code for code, _ in Forfait._meta.get_field('type').choices)
+    types_partout = types - TYPES_ZONE_COUVERTE
+    zones = {z.pk: z for z in ZoneCouverture.objects.only('pk', 'region')}
+    communes = {c.pk: c for c in Commune.objects.only('pk', 'nom', 'zone_id')}
+    forfaits_repli = Forfait.objects.filter(type__in=types_partout).order_by('pk')
+    return IndexCouverture(
+        signature=signature,
+        zones=MappingProxyType(zones),
+        communes=MappingProxyType(communes),
+        eligibilite=MappingProxyType({(c.zone_id, pk): types for pk, c in communes.items()}),
+        types_partout=types_partout,
+        forfaits_repli=tuple(forfaits_repli),
+    )
+
+
+_index = None
+_verrou_index = threading.Lock()
+
+
+def index_couverture():
+    """
+    Index de couverture du processus, reconstruit quand une zone, une commune
+    ou un forfait change. Une lecture du cache (horodatages des espaces
+    'zone' et 'forfait', en base s'ils en sont absents) suffit à savoir s'il
+    est à jour : une modification faite dans un autre worker est vue à la
+    requête suivante.
+    """
+    global _index
+    horodatages = Horodatage.lire(*ESPACES_INDEX)
+    signature = tuple(horodatages[ns] for ns in ESPACES_INDEX)
+    index = _index
+    if index is None or index.signature != signature:
+        with _verrou_index:
+            if _index is None or _index.signature != signature:
+                _index = _construire_index(signature)
+            index = _index
+    return index
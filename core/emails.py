@@ -0,0 +1,211 @@
+import copy
+import io
+import os
+from datetime import timedelta
+from email.mime.image import MIMEImage
+
+from PIL import Image
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .context_processors import logo_actif
+from .metriques import emails
+from .models import EmailSortant
+
+MAX_TENTATIVES = 6
+DELAI_BASE = timedelta(minutes=1)
+DELAI_MAX = timedelta(hours=2)
+# Durée pendant laquelle un lot réservé par un worker est invisible aux autres
+DELAI_RESERVATION = timedelta(minutes=10)
+# Report d'un lot quand le serveur SMTP est injoignable (sans compter de tentative)
+DELAI_INDISPONIBLE = timedelta(minutes=5)
+
+
+def mettre_en_file(sujet, destinataires, corps_texte, corps_html='', avec_logo=False):
+    """
+    Enregistre un email dans la file d'envoi. Appelée dans un transaction.atomic(),
+    l'email n'existe que si la transaction est validée.
+    """
+    if isinstance(destinataires, str):
+        destinataires = [destinataires]
+    transaction.on_commit(lambda: emails.inc(resultat='en_file'))
+    return EmailSortant.objects.create(
+        sujet=sujet,
+        destinataires=[d for d in destinataires if d],
+        corps_texte=corps_texte,
+        corps_html=corps_html,
+        avec_logo=avec_logo,
+    )
+
+
+def envoyer_email_avec_logo(request, sujet, template_html, template_txt, context, destinataire):
+    """Rend les templates de l'email et le met en file, avec le logo actif en image inline."""
+    logo = logo_actif()
+    if logo and logo.image:
+        # Ajouter l'URL CID au contexte
+        context['logo_cid'] = 'cid:logo'
+    return mettre_en_file(
+        sujet=sujet,
+        destinataires=[destinataire],
+        corps_texte=render_to_string(template_txt, context),
+        corps_html=render_to_string(template_html, context),
+        avec_logo=bool(logo and logo.image),
+    )
+
+
+# Partie MIME du logo préparée une fois par processus : {(pk, mtime, largeur): MIMEImage}
+_logo_mime = {}
+
+
+def _preparer_logo(path, largeur):
+    """Lit le logo et le réduit à `largeur` pixels (0 = taille d'origine)."""
+    with open(path, 'rb') as f:
+        donnees = f.read()
+    if not largeur:
+        return donnees
+    try:
+        with Image.open(io.BytesIO(donnees)) as image:
+            if image.width <= largeur:
+                return donnees
+            format_ = image.format or 'PNG'
+            image.thumbnail((largeur, largeur * image.height // image.width))
+            sortie = io.BytesIO()
+            if format_ == 'JPEG':
+                image.convert('RGB').save(sortie, format_, quality=85, optimize=True)
+            else:
+                image.save(sortie, format_, optimize=True)
+            return sortie.getvalue()
+    except OSError:
+        # Image illisible par Pillow : on joint le fichier tel quel
+        return donnees
+
+
+def _image_logo():
+    """
+    Retourne une copie de la partie MIME du logo actif. Elle est construite une
+    seule fois par processus et reconstruite si le logo actif ou son fichier change.
+    """
+    logo = logo_actif()
+    if not (logo and logo.image):
+        return None
+    path = logo.image.path
+    largeur = getattr(settings, 'EMAIL_LOGO_LARGEUR', 300)
+    cle = (logo.pk, os.stat(path).st_mtime_ns, largeur)
+    logo_img = _logo_mime.get(cle)
+    if logo_img is None:
+        logo_img = MIMEImage(_preparer_logo(path, largeur))
+        logo_img.add_header('Content-ID', '<logo>')
+        _logo_mime.clear()
+        _logo_mime[cle] = logo_img
+    return copy.deepcopy(logo_img)
+
+
+def invalider_logo():
+    _logo_mime.clear()
+
+
+def construire_message(email, connection=None):
+    msg = EmailMultiAlternatives(
+        subject=email.sujet,
+        body=email.corps_texte,
+        from_email=None,
+        to=email.destinataires,
+        connection=connection,
+    )
+    if email.corps_html:
+        msg.attach_alternative(email.corps_html, "text/html")
+    if email.avec_logo:
+        logo_img = _image_logo()
+        if logo_img:
+            msg.attach(logo_img)
+    return msg
+
+
+def delai_avant_essai(tentatives):
+    """Backoff exponentiel : 1, 2, 4, 8... minutes, plafonné à DELAI_MAX."""
+    return min(DELAI_BASE * (2 ** max(tentatives - 1, 0)), DELAI_MAX)
+
+
+def _reserver_lot(taille):
+    """
+    Réserve le prochain lot d'emails à envoyer, dans une transaction courte.
+    Sous PostgreSQL, SKIP LOCKED permet à plusieurs workers de se partager la
+    file sans envoyer deux fois. Les emails réservés sont repoussés de
+    DELAI_RESERVATION : aucun autre worker ne les reprend pendant l'envoi, et
+    ils reviennent dans la file si ce worker s'arrête en cours de route.
+    """
+    with transaction.atomic():
+        maintenant = timezone.now()
+        qs = EmailSortant.objects.filter(statut='en_attente', prochain_essai__lte=maintenant)
+        if db_connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        lot = list(qs.order_by('prochain_essai', 'pk')[:taille])
+        if lot:
+            EmailSortant.objects.filter(pk__in=[email.pk for email in lot]).update(
+                prochain_essai=maintenant + DELAI_RESERVATION
+            )
+    return lot
+
+
+def _noter_echec(email, erreur, maintenant):
+    email.tentatives += 1
+    email.derniere_erreur = f"{type(erreur).__name__}: {erreur}"
+    if email.tentatives >= MAX_TENTATIVES:
+        email.statut = 'echec'
+    email.prochain_essai = maintenant + delai_avant_essai(email.tentatives)
+
+
+def envoyer_lot(taille=50):
+    """
+    Envoie un lot d'emails en attente sur une seule connexion SMTP.
+    Aucun verrou de ligne n'est tenu pendant les échanges SMTP. Seul l'échec
+    d'envoi d'un message compte une tentative : si le serveur est injoignable,
+    le lot est simplement reporté de DELAI_INDISPONIBLE, sans limite de durée.
+    Retourne (nombre envoyés, nombre en échec).
+    """
+    lot = _reserver_lot(taille)
+    if not lot:
+        return 0, 0
+    envoyes = echecs = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        print(f"ERROR: connexion SMTP impossible : {e}")
+        maintenant = timezone.now()
+        for email in lot:
+            email.derniere_erreur = f"{type(e).__name__}: {e}"
+            email.prochain_essai = maintenant + DELAI_INDISPONIBLE
+    else:
+        try:
+            for email in lot:
+                maintenant = timezone.now()
+                try:
+                    construire_message(email, connection).send()
+                except Exception as e:
+                    echecs += 1
+                    _noter_echec(email, e, maintenant)
+                    # La connexion peut être rompue : on la rouvre pour la suite du lot
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        pass
+                else:
+                    envoyes += 1
+                    email.statut = 'envoye'
+                    email.date_envoi = maintenant
+                    email.derniere_erreur = ''
+        finally:
+            connection.close()
+    EmailSortant.objects.bulk_update(
+        lot, ['statut', 'tentatives', 'prochain_essai', 'derniere_erreur', 'date_envoi']
+    )
+    if envoyes:
+        emails.inc(envoyes, resultat='envoye')
+    if echecs:
+        emails.inc(echecs, resultat='echec')
+    return envoyes, echecs
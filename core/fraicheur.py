@@ -0,0 +1,77 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Horodatage
+from .pages import ESPACES_BASE, est_cachable
+from .panier import COOKIE_PANIER, get_panier_count
+
+
+def _messages_en_attente(request):
+    session = getattr(request, 'session', None)
+    return bool(request.COOKIES.get('messages') or (session is not None and session.get('_messages')))
+
+
+def _fraicheur(request, espaces):
+    """
+    (ETag, Last-Modified) de la page, calculés une fois par requête.
+    None, None si la page affiche des messages en attente : elle ne doit pas
+    être servie depuis le cache du navigateur.
+    """
+    if not hasattr(request, '_fraicheur'):
+        request._fraicheur = (None, None)
+        if not _messages_en_attente(request):
+            horodatages = Horodatage.lire(*espaces)
+            parties = [f"{espace}.{horodatages[espace][0]}" for espace in espaces]
+            # base.html est personnalisé (panier, avatar) : l'ETag en dépend aussi
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                parties += [
+                    f"u{user.pk}",
+                    str(get_panier_count(user)),
+                    json.dumps(request.session.get('user_data'), sort_keys=True, default=str),
+                ]
+            else:
+                parties.append(request.COOKIES.get(COOKIE_PANIER, ''))
+            # Formulaires (souscription, déconnexion...) : le jeton CSRF de la page
+            # doit suivre le cookie, renouvelé à chaque connexion
+            csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+            parties.append(csrf)
+            etag = 'W/"%s"' % hashlib.md5(':'.join(parties).encode()).hexdigest()
+            # Last-Modified ne tient pas compte du visiteur : seulement pour les pages identiques pour tous
+            cachable = est_cachable(request) and not csrf
+            derniere = max(date for _, date in horodatages.values()) if cachable else None
+            request._fraicheur = (etag, derniere)
+    return request._fraicheur
+
+
+def get_conditionnel(*espaces):
+    """
+    GET conditionnel (304 Not Modified) d'après les horodatages des espaces
+    dont la page dépend (plus logo et menu, communs à toutes les pages) :
+    la vue et ses templates ne sont pas exécutés si le client a déjà la page.
+    Cache-Control: no-cache oblige navigateurs et nginx à revalider.
+    """
+    espaces = ESPACES_BASE + espaces
+
+    def decorateur(vue):
+        conditionnelle = condition(
+            etag_func=lambda request, *args, **kwargs: _fraicheur(request, espaces)[0],
+            last_modified_func=lambda request, *args, **kwargs: _fraicheur(request, espaces)[1],
+        )(vue)
+
+        @wraps(vue)
+        def wrapper(request, *args, **kwargs):
+            response = conditionnelle(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                if est_cachable(request):
+                    patch_cache_control(response, no_cache=True)
+                else:
+                    patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorateur
@@ -0,0 +1,160 @@
+import io
+import json
+import posixpath
+
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .storage import DOSSIER_RENDITIONS
+from .models import Produit, Forfait, Slider, QuickBlock, ActualiteImage, FaqStepImage
+
+# Modèles dont le champ `image` est servi avec des variantes responsives
+MODELES_IMAGES = (Produit, Forfait, Slider, QuickBlock, ActualiteImage, FaqStepImage)
+
+# Largeurs générées (px) : cartes mobiles, cartes desktop, bannières (écrans denses)
+LARGEURS = (320, 640, 960, 1280, 1920)
+# (extension, format Pillow, type MIME) : WebP pour le srcset principal, JPEG en repli
+FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpg', 'JPEG', 'image/jpeg'),
+)
+QUALITE = 80
+
+# Largeurs disponibles par fichier d'origine, gardées par processus : {name: (320, 640)}
+_disponibles = {}
+
+
+def chemin_rendition(name, largeur, extension):
+    """produits/photo.png -> produits/renditions/photo-640w.webp"""
+    dossier, fichier = posixpath.split(name)
+    base = posixpath.splitext(fichier)[0]
+    return posixpath.join(dossier, DOSSIER_RENDITIONS, f"{base}-{largeur}w.{extension}")
+
+
+def _normaliser(image):
+    """Passe l'image en RGB, ou RGBA si elle a de la transparence (redimensionnable en LANCZOS)."""
+    transparente = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if transparente:
+        return image.convert('RGBA')
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def _encoder(image, format_):
+    if format_ == 'JPEG' and image.mode == 'RGBA':
+        # Pas de transparence en JPEG : fond blanc, comme les cartes du site
+        fond = Image.new('RGB', image.size, (255, 255, 255))
+        fond.paste(image, mask=image.getchannel('A'))
+        image = fond
+    sortie = io.BytesIO()
+    image.save(sortie, format_, quality=QUALITE, optimize=format_ == 'JPEG', method=4)
+    return sortie.getvalue()
+
+
+def chemin_manifeste(name):
+    """produits/photo.png -> produits/renditions/photo.json (largeur d'origine et variantes)"""
+    dossier, fichier = posixpath.split(name)
+    return posixpath.join(dossier, DOSSIER_RENDITIONS, f"{posixpath.splitext(fichier)[0]}.json")
+
+
+def _lire_manifeste(name, storage):
+    try:
+        with storage.open(chemin_manifeste(name), 'rb') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _ecrire_manifeste(name, storage, largeur_origine, largeurs):
+    chemin = chemin_manifeste(name)
+    if storage.exists(chemin):
+        storage.delete(chemin)
+    storage.save(chemin, ContentFile(json.dumps({'largeur': largeur_origine, 'largeurs': list(largeurs)}).encode()))
+
+
+def _presentes(name, storage, largeurs):
+    return tuple(
+        largeur for largeur in largeurs
+        if all(storage.exists(chemin_rendition(name, largeur, extension)) for extension, _, _ in FORMATS)
+    )
+
+
+def generer_renditions(fichier, forcer=False, storage=None):
+    """
+    Génère les variantes WebP/JPEG d'une image aux largeurs de LARGEURS
+    (uniquement celles inférieures à la largeur d'origine), à côté du fichier
+    d'origine, et note la largeur d'origine dans un manifeste. Tant que les
+    variantes attendues d'après le manifeste sont présentes, l'image n'est
+    pas rouverte (petite image sans variante comprise), sauf si `forcer`.
+    Retourne le tuple des largeurs disponibles.
+    """
+    storage = storage or getattr(fichier, 'storage', None) or default_storage
+    name = getattr(fichier, 'name', fichier)
+    if not name:
+        return ()
+
+    manifeste = None if forcer else _lire_manifeste(name, storage)
+    if manifeste is not None:
+        attendues = tuple(largeur for largeur in LARGEURS if largeur < manifeste['largeur'])
+        if _presentes(name, storage, attendues) == attendues:
+            _disponibles[name] = attendues
+            return attendues
+
+    largeur_origine = None
+    try:
+        with storage.open(name, 'rb') as f:
+            with Image.open(f) as image:
+                image = _normaliser(ImageOps.exif_transpose(image))
+                largeur_origine = image.width
+                for largeur in LARGEURS:
+                    if largeur >= largeur_origine:
+                        break
+                    variante = None
+                    for extension, format_, _ in FORMATS:
+                        chemin = chemin_rendition(name, largeur, extension)
+                        if storage.exists(chemin):
+                            if not forcer:
+                                continue
+                            storage.delete(chemin)
+                        if variante is None:
+                            hauteur = max(1, round(image.height * largeur / largeur_origine))
+                            variante = image.resize((largeur, hauteur), Image.LANCZOS)
+                        storage.save(chemin, ContentFile(_encoder(variante, format_)))
+    except (OSError, ValueError) as e:
+        print(f"ERROR: renditions de {name} : {e}")
+
+    disponibles = _presentes(name, storage, LARGEURS)
+    if largeur_origine is not None:
+        _ecrire_manifeste(name, storage, largeur_origine, disponibles)
+    _disponibles[name] = disponibles
+    return disponibles
+
+
+def largeurs_disponibles(fichier):
+    """
+    Largeurs des variantes d'une image, lues dans son manifeste sans ouvrir
+    l'image. Rien n'est généré pendant le rendu d'une page : une image sans
+    manifeste (antérieure au pipeline) est servie sans srcset jusqu'au
+    passage de la commande generer_renditions.
+    """
+    name = fichier.name
+    disponibles = _disponibles.get(name)
+    if disponibles is None:
+        manifeste = _lire_manifeste(name, fichier.storage)
+        if manifeste is None:
+            return ()
+        disponibles = _disponibles[name] = tuple(manifeste['largeurs'])
+    return disponibles
+
+
+def supprimer_renditions(name, storage=None):
+    """Supprime les variantes d'une image (appelée quand l'original est supprimé)."""
+    storage = storage or default_storage
+    for largeur in LARGEURS:
+        for extension, _, _ in FORMATS:
+            chemin = chemin_rendition(name, largeur, extension)
+            if storage.exists(chemin):
+                storage.delete(chemin)
+    if storage.exists(chemin_manifeste(name)):
+        storage.delete(chemin_manifeste(name))
+    _disponibles.pop(name, None)
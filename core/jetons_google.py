@@ -0,0 +1,144 @@
+"""
+Vérification locale des jetons d'identité Google (bouton "Se connecter avec Google").
+
+Les clés publiques de Google (JWKS) sont gardées en mémoire par le processus
+et partagées entre workers par le cache Django, jusqu'à l'expiration annoncée
+par l'en-tête Cache-Control de Google : une connexion ne télécharge les clés
+que lorsqu'elles ont expiré ou changé. La signature et les revendications
+(aud, iss, exp) sont vérifiées sur place avec PyJWT.
+"""
+import re
+import threading
+import time
+from typing import NamedTuple
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+EMETTEURS = ['accounts.google.com', 'https://accounts.google.com']
+ALGORITHMES = ['RS256']
+DUREE_PAR_DEFAUT = 60 * 60
+DELAI_TELECHARGEMENT = 5
+# Clé inconnue (renouvellement chez Google) : au plus un téléchargement forcé par intervalle
+INTERVALLE_FORCE = 60
+TOLERANCE_HORLOGE = 10
+CLE_CACHE = 'core:google:jwks'
+
+
+class JeuDeCles(NamedTuple):
+    url: str = None
+    expire: float = 0
+    cles: dict = {}
+    force: float = None  # time.monotonic() du dernier téléchargement forcé
+
+
+_jeu = JeuDeCles()
+_verrou = threading.Lock()
+# Connexion HTTPS réutilisée d'un téléchargement à l'autre
+_session = requests.Session()
+
+
+def _duree(cache_control):
+    trouve = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(trouve.group(1)) if trouve else DUREE_PAR_DEFAUT
+
+
+def _cles(jwks):
+    cles = {}
+    for jwk in jwks.get('keys', []):
+        try:
+            cles[jwk['kid']] = jwt.PyJWK(jwk).key
+        except (KeyError, jwt.PyJWTError) as e:
+            print(f"ERROR: clé Google ignorée : {e}")
+    return cles
+
+
+def _telecharger(url):
+    try:
+        reponse = _session.get(url, timeout=DELAI_TELECHARGEMENT)
+        reponse.raise_for_status()
+        jwks = reponse.json()
+    except (requests.RequestException, ValueError) as e:
+        raise ValueError(f"Certificats Google indisponibles : {e}")
+    duree = _duree(reponse.headers.get('Cache-Control'))
+    expire = time.time() + duree
+    cache.set(CLE_CACHE, {'url': url, 'jwks': jwks, 'expire': expire}, duree)
+    return jwks, expire
+
+
+def _installer(jeu):
+    """Remplace le jeu de clés sous _verrou, sauf s'il est plus ancien que l'actuel."""
+    global _jeu
+    with _verrou:
+        if _jeu.url != jeu.url:
+            _jeu = jeu
+        elif jeu.expire >= _jeu.expire:
+            _jeu = jeu._replace(force=_jeu.force)
+        return _jeu
+
+
+def _reserver_force(url):
+    """Vrai si ce thread peut forcer un téléchargement (au plus un par INTERVALLE_FORCE)."""
+    global _jeu
+    with _verrou:
+        if _jeu.url != url or (_jeu.force is not None and time.monotonic() - _jeu.force <= INTERVALLE_FORCE):
+            return False
+        _jeu = _jeu._replace(force=time.monotonic())
+        return True
+
+
+def _charger(url, forcer=False):
+    """Nouveau jeu de clés, depuis le cache partagé ou Google. Le téléchargement se fait hors de _verrou."""
+    if not forcer:
+        partage = cache.get(CLE_CACHE)
+        if partage and partage['url'] == url and partage['expire'] > time.time():
+            return _installer(JeuDeCles(url, partage['expire'], _cles(partage['jwks'])))
+    jwks, expire = _telecharger(url)
+    return _installer(JeuDeCles(url, expire, _cles(jwks)))
+
+
+def cle_publique(kid):
+    """Clé publique Google d'identifiant `kid` ; ValueError si elle est introuvable."""
+    url = settings.GOOGLE_CERTS_URL
+    jeu = _jeu
+    if jeu.url == url and jeu.expire > time.time() and kid in jeu.cles:
+        return jeu.cles[kid]
+    if jeu.url != url or jeu.expire <= time.time():
+        jeu = _charger(url)
+    if kid not in jeu.cles and _reserver_force(url):
+        # Google a pu publier une nouvelle clé avant l'expiration annoncée
+        jeu = _charger(url, forcer=True)
+    try:
+        return jeu.cles[kid]
+    except KeyError:
+        raise ValueError(f"Clé de signature inconnue : {kid}")
+
+
+def oublier_cles():
+    """Vide les caches de clés (mémoire et partagé)."""
+    global _jeu
+    with _verrou:
+        _jeu = JeuDeCles()
+        cache.delete(CLE_CACHE)
+
+
+def verifier_jeton(jeton, client_id):
+    """
+    Revendications d'un jeton d'identité Google valide pour `client_id`.
+    Lève ValueError sinon, comme google.oauth2.id_token.verify_oauth2_token.
+    """
+    try:
+        kid = jwt.get_unverified_header(jeton).get('kid')
+        return jwt.decode(
+            jeton,
+            cle_publique(kid),
+            algorithms=ALGORITHMES,
+            audience=client_id,
+            issuer=EMETTEURS,
+            leeway=TOLERANCE_HORLOGE,
+            options={'require': ['exp', 'iat', 'iss', 'aud', 'sub']},
+        )
+    except jwt.PyJWTError as e:
+        raise ValueError(f"Jeton invalide : {e}")
@@ -0,0 +1,113 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+from core.models import Produit, Order, OrderItem
+
+PREFIXE = "BENCH-STOCK"
+
+
+def debit_par_ligne(order):
+    """Ancien algorithme de Order.debit_stock (un UPDATE et un save par ligne), pour comparaison."""
+    with transaction.atomic():
+        for item in order.items.select_for_update():
+            if item.stock_debited:
+                continue
+            updated = Produit.objects.filter(
+                pk=item.produit_id,
+                quantite__gte=item.quantite
+            ).update(quantite=F('quantite') - item.quantite)
+            if not updated:
+                raise ValueError(f"Stock insuffisant pour {item.produit_id}")
+            item.stock_debited = True
+            item.save(update_fields=['stock_debited'])
+
+
+def debit_ensembliste(order):
+    order.debit_stock()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit de stock ligne à ligne et le débit ensembliste de "
+        "Order.debit_stock sur de grosses commandes confirmées en parallèle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lignes', type=int, default=30, help="Lignes par commande")
+        parser.add_argument('--commandes', type=int, default=20, help="Commandes confirmées par mode")
+        parser.add_argument('--workers', type=int, default=4, help="Confirmations simultanées")
+
+    def handle(self, *args, **options):
+        lignes, nb_commandes, workers = options['lignes'], options['commandes'], options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            # SQLite n'accepte qu'un écrivain à la fois : les confirmations concurrentes
+            # échoueraient en "database is locked" au lieu de s'attendre.
+            self.stderr.write("SQLite : confirmations exécutées en série (utiliser PostgreSQL pour la concurrence)")
+            workers = 1
+        self.stdout.write(f"{nb_commandes} commandes de {lignes} lignes, {workers} confirmations simultanées")
+        self.stdout.write(f"{'mode':<12} {'total (s)':>10} {'p50 (ms)':>10} {'max (ms)':>10} {'requêtes/cmd':>13} {'échecs':>7}")
+        for mode, debit in (('boucle', debit_par_ligne), ('ensembliste', debit_ensembliste)):
+            try:
+                commandes = self.creer_jeu(lignes, nb_commandes)
+                debut = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    resultats = list(pool.map(lambda pk: self.confirmer(pk, debit), commandes))
+                total = time.perf_counter() - debut
+            finally:
+                self.nettoyer()
+            durees = [r[0] for r in resultats if r[2] is None]
+            requetes = [r[1] for r in resultats if r[2] is None]
+            echecs = [r[2] for r in resultats if r[2] is not None]
+            self.stdout.write(
+                f"{mode:<12} {total:>10.3f} "
+                f"{statistics.median(durees) * 1000 if durees else 0:>10.1f} "
+                f"{max(durees, default=0) * 1000:>10.1f} "
+                f"{statistics.mean(requetes) if requetes else 0:>13.1f} "
+                f"{len(echecs):>7}"
+            )
+            for erreur in sorted(set(echecs)):
+                self.stderr.write(f"  {mode}: {erreur}")
+
+    def creer_jeu(self, lignes, nb_commandes):
+        produits = Produit.objects.bulk_create([
+            Produit(nom=f"{PREFIXE}-{i}", prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=lignes * nb_commandes * 10)
+            for i in range(lignes)
+        ])
+        commandes = Order.objects.bulk_create([
+            Order(reference=f"{PREFIXE}-{i}", statut='en_attente') for i in range(nb_commandes)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(commande=commande, produit=produit, quantite=1 + (i % 3), prix_unitaire=produit.prix_ttc)
+            for commande in commandes
+            for i, produit in enumerate(produits)
+        ])
+        return [commande.pk for commande in commandes]
+
+    def confirmer(self, order_pk, debit):
+        compteur = [0]
+
+        def compter(execute, sql, params, many, context):
+            compteur[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            order = Order.objects.get(pk=order_pk)
+            with connection.execute_wrapper(compter):
+                debut = time.perf_counter()
+                debit(order)
+                duree = time.perf_counter() - debut
+            return duree, compteur[0], None
+        except Exception as e:
+            return 0, compteur[0], f"{type(e).__name__}: {e}"
+        finally:
+            connection.close()
+
+    def nettoyer(self):
+        Order.objects.filter(reference__startswith=PREFIXE).delete()
+        Produit.objects.filter(nom__startswith=PREFIXE).delete()
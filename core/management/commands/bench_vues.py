@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.bench import (
+    FICHIER_REFERENCES, SCENARIOS, SEUIL, charger_references, comparer, donnees_bench,
+    enregistrer_references, mesurer,
+)
+
+
+class Annulation(Exception):
+    pass
+
+
+# Cache privé au processus de la commande : les pages et fragments mis en cache
+# pendant la mesure (données de la transaction annulée) n'atteignent jamais le
+# cache partagé de l'instance
+CACHE_BENCH = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench_vues'}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure temps, requêtes SQL et mémoire des pages principales avec le client "
+        "de test sur la base peuplée (seed_scale), et échoue en cas de dépassement "
+        "du budget de requêtes ou de régression par rapport aux références. "
+        "Les mesures utilisent un cache mémoire privé, le cache partagé n'est pas touché."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=5, help="Requêtes mesurées par vue")
+        parser.add_argument('--seuil', type=float, default=SEUIL, help="Régression tolérée (0.25 = +25 %%)")
+        parser.add_argument('--enregistrer', action='store_true', help="Enregistrer les mesures comme références")
+        parser.add_argument('--vues', nargs='*', help="Limiter aux vues indiquées")
+        parser.add_argument('--references', default=FICHIER_REFERENCES, help="Fichier JSON des références")
+
+    def handle(self, *args, **options):
+        scenarios = [s for s in SCENARIOS if not options['vues'] or s.nom in options['vues']]
+        if not scenarios:
+            raise CommandError("Aucune vue à mesurer")
+
+        # Le client de test a besoin de l'environnement de test (ALLOWED_HOSTS,
+        # backend email en mémoire) ; les commandes créées sont annulées à la fin.
+        setup_test_environment()
+        cache_prive = override_settings(CACHES=CACHE_BENCH)
+        cache_prive.enable()
+        mesures = []
+        try:
+            with transaction.atomic():
+                try:
+                    donnees = donnees_bench()
+                except ValueError as e:
+                    raise CommandError(str(e))
+                client = Client()
+                for scenario in scenarios:
+                    mesures.append(mesurer(client, scenario, donnees, options['repetitions']))
+                raise Annulation
+        except Annulation:
+            pass
+        finally:
+            cache_prive.disable()
+            teardown_test_environment()
+
+        references = charger_references(options['references'])
+        self.stdout.write(f"{'vue':<30} {'requêtes':>9} {'budget':>7} {'temps (ms)':>11} {'réf.':>8} {'mémoire (Ko)':>13} {'réf.':>8}")
+        for mesure in mesures:
+            reference = references.get(mesure.nom, {})
+            self.stdout.write(
+                f"{mesure.nom:<30} {mesure.requetes:>9} {reference.get('budget_requetes', '-'):>7} "
+                f"{mesure.temps_ms:>11.1f} {reference.get('temps_ms', '-'):>8} "
+                f"{mesure.memoire_ko:>13.1f} {reference.get('memoire_ko', '-'):>8}"
+            )
+
+        if options['enregistrer']:
+            enregistrer_references(mesures, options['references'])
+            self.stdout.write(self.style.SUCCESS(f"Références enregistrées dans {options['references']}"))
+            return
+
+        echecs = comparer(mesures, references, options['seuil'])
+        if echecs:
+            for echec in echecs:
+                self.stdout.write(self.style.ERROR(echec))
+            raise CommandError(f"{len(echecs)} dépassement(s)")
+        self.stdout.write(self.style.SUCCESS("Aucune régression"))
@@ -0,0 +1,126 @@
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+
+from core.images import supprimer_renditions
+from core.storage import DOSSIER_RENDITIONS, champs_fichiers, empreinte
+
+
+def taille_lisible(octets):
+    for unite in ('o', 'Ko', 'Mo'):
+        if octets < 1024:
+            return f"{octets:.0f} {unite}"
+        octets /= 1024
+    return f"{octets:.1f} Go"
+
+
+class Command(BaseCommand):
+    help = (
+        "Recherche les fichiers en double (même contenu) dans MEDIA_ROOT, fait "
+        "pointer toutes les références vers une seule copie et supprime les autres."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulation', action='store_true', help="Afficher le rapport sans rien modifier")
+        parser.add_argument(
+            '--fixtures', nargs='*', default=[],
+            help="Fixtures JSON dont les chemins de fichiers sont aussi réécrits",
+        )
+
+    def scanner(self, racine):
+        """Regroupe les fichiers de MEDIA_ROOT par contenu : {sha256: [noms relatifs]}."""
+        par_taille = defaultdict(list)
+        for dossier, sous_dossiers, fichiers in os.walk(racine):
+            sous_dossiers[:] = [d for d in sous_dossiers if d != DOSSIER_RENDITIONS]
+            for fichier in fichiers:
+                chemin = Path(dossier) / fichier
+                par_taille[chemin.stat().st_size].append(chemin.relative_to(racine).as_posix())
+
+        # Seuls les fichiers de même taille peuvent être identiques : on ne hache qu'eux
+        groupes = defaultdict(list)
+        for noms in par_taille.values():
+            if len(noms) < 2:
+                continue
+            for name in noms:
+                with open(Path(racine) / name, 'rb') as f:
+                    groupes[empreinte(f)].append(name)
+        return {h: sorted(noms) for h, noms in groupes.items() if len(noms) > 1}
+
+    def handle(self, *args, **options):
+        racine = Path(settings.MEDIA_ROOT)
+        champs = champs_fichiers()
+
+        references = set()
+        for modele, champ in champs:
+            references.update(modele._default_manager.exclude(**{champ: ''}).values_list(champ, flat=True))
+        for chemin in options['fixtures']:
+            references |= self.references_fixture(chemin)
+
+        # Copie conservée : une déjà référencée si possible, sinon le nom le plus court
+        remplacements = {}
+        for noms in self.scanner(racine).values():
+            conservee = min(noms, key=lambda n: (n not in references, len(n), n))
+            for name in noms:
+                if name != conservee:
+                    remplacements[name] = conservee
+
+        recupere = sum((racine / name).stat().st_size for name in remplacements)
+        self.stdout.write(
+            f"{len(remplacements)} doublon(s) dans {len(set(remplacements.values()))} groupe(s), "
+            f"{taille_lisible(recupere)} récupérables"
+        )
+        for name, conservee in sorted(remplacements.items()):
+            self.stdout.write(f"  {name} -> {conservee}")
+        if options['simulation'] or not remplacements:
+            return
+
+        # Une seule requête UPDATE ... CASE par champ fichier
+        with transaction.atomic():
+            for modele, champ in champs:
+                nb = modele._default_manager.filter(**{f'{champ}__in': remplacements}).update(**{
+                    champ: Case(
+                        *[When(**{champ: name}, then=Value(conservee)) for name, conservee in remplacements.items()],
+                        default=champ,
+                        output_field=CharField(),
+                    ),
+                })
+                if nb:
+                    self.stdout.write(f"{modele.__name__}.{champ} : {nb} référence(s) réécrite(s)")
+
+        for chemin in options['fixtures']:
+            self.reecrire_fixture(chemin, remplacements)
+
+        # Suppression directe : le stockage dédupliqué refuserait les fichiers encore en base
+        stockage = FileSystemStorage(location=racine)
+        for name in remplacements:
+            stockage.delete(name)
+            supprimer_renditions(name, stockage)
+        self.stdout.write(self.style.SUCCESS(f"{taille_lisible(recupere)} libérés"))
+
+    def references_fixture(self, chemin):
+        with open(chemin, encoding='utf-8') as f:
+            return {
+                valeur for objet in json.load(f)
+                for valeur in objet.get('fields', {}).values() if isinstance(valeur, str)
+            }
+
+    def reecrire_fixture(self, chemin, remplacements):
+        # Remplacement textuel : garde la mise en forme de dumpdata et un diff minimal
+        with open(chemin, encoding='utf-8') as f:
+            texte = f.read()
+        nb = 0
+        for name, conservee in remplacements.items():
+            ancien = json.dumps(name, ensure_ascii=False)
+            nb += texte.count(ancien)
+            texte = texte.replace(ancien, json.dumps(conservee, ensure_ascii=False))
+        if nb:
+            with open(chemin, 'w', encoding='utf-8') as f:
+                f.write(texte)
+        self.stdout.write(f"{chemin} : {nb} chemin(s) réécrit(s)")
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.emails import envoyer_lot
+
+
+class Command(BaseCommand):
+    help = (
+        "Vide la file des emails sortants par lots, sur une connexion SMTP "
+        "réutilisée, avec nouvelles tentatives et backoff exponentiel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', type=int, default=50, help="Emails envoyés par connexion SMTP")
+        parser.add_argument('--intervalle', type=float, default=5.0, help="Pause (s) quand la file est vide")
+        parser.add_argument('--une-fois', action='store_true', help="Vider la file puis s'arrêter")
+
+    def handle(self, *args, **options):
+        taille, intervalle = options['lot'], options['intervalle']
+        while True:
+            close_old_connections()
+            try:
+                envoyes, echecs = envoyer_lot(taille)
+            except Exception as e:
+                # Base indisponible par exemple (un SMTP injoignable est géré par
+                # envoyer_lot, qui reporte le lot) : on réessaiera au prochain tour
+                self.stderr.write(f"ERROR: envoi du lot impossible : {e}")
+                envoyes = echecs = 0
+                if options['une_fois']:
+                    raise
+            if envoyes or echecs:
+                self.stdout.write(f"{envoyes} email(s) envoyé(s), {echecs} en échec")
+            if envoyes + echecs < taille:
+                if options['une_fois']:
+                    return
+                time.sleep(intervalle)
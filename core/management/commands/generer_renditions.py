@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.images import MODELES_IMAGES, generer_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère les variantes WebP/JPEG redimensionnées des images existantes "
+        "(produits, forfaits, sliders, blocs, actualités, FAQ)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forcer', action='store_true', help="Régénérer les variantes déjà présentes")
+
+    def handle(self, *args, **options):
+        for modele in MODELES_IMAGES:
+            noms = (
+                modele.objects.exclude(image='').exclude(image__isnull=True)
+                .values_list('image', flat=True).distinct()
+            )
+            storage = modele._meta.get_field('image').storage
+            traitees = 0
+            for nom in noms.iterator():
+                generer_renditions(nom, forcer=options['forcer'], storage=storage)
+                traitees += 1
+            self.stdout.write(f"{modele.__name__} : {traitees} image(s) traitée(s)")
@@ -0,0 +1,69 @@
+import io
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profilage import dossier_profils, flamegraph_svg, fonctions_chaudes, lire_folded
+
+
+class Command(BaseCommand):
+    help = (
+        "Fusionne les profils enregistrés par ProfilageMiddleware (logs/profils/) : "
+        "rapport des N fonctions les plus coûteuses par vue et, avec --flamegraph, "
+        "un flamegraph SVG et un fichier collapsed fusionné par vue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vue', action='append', help="Limiter à une vue (ex. accueil), répétable")
+        parser.add_argument('--top', type=int, default=25, help="Nombre de fonctions du rapport")
+        parser.add_argument('--flamegraph', action='store_true', help="Écrire <vue>.svg et <vue>.folded")
+        parser.add_argument('--purger', action='store_true', help="Supprimer les profils une fois fusionnés")
+
+    def handle(self, *args, **options):
+        racine = dossier_profils()
+        if not racine.is_dir():
+            raise CommandError(f"Aucun profil dans {racine}")
+        dossiers = sorted(d for d in racine.iterdir() if d.is_dir())
+        if options['vue']:
+            dossiers = [d for d in dossiers if d.name in options['vue']]
+        if not dossiers:
+            raise CommandError("Aucune vue profilée")
+
+        for dossier in dossiers:
+            folded = sorted(dossier.glob('*.folded'))
+            prof = sorted(dossier.glob('*.prof'))
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{dossier.name} : {len(folded)} profil(s) échantillonné(s), {len(prof)} profil(s) cProfile"
+            ))
+            if folded:
+                self.rapport_echantillons(racine, dossier.name, folded, options)
+            if prof:
+                self.rapport_cprofile(prof, options['top'])
+            if options['purger']:
+                for chemin in folded + prof:
+                    chemin.unlink()
+
+    def rapport_echantillons(self, racine, vue, fichiers, options):
+        piles = Counter()
+        for chemin in fichiers:
+            lire_folded(chemin, piles)
+        total = sum(piles.values())
+        self.stdout.write(f"{total} échantillons")
+        if total:
+            self.stdout.write(f"  {'propre':>7} {'inclusif':>8}  fonction")
+            for fonction, propre, inclusif in fonctions_chaudes(piles, options['top']):
+                self.stdout.write(f"  {propre / total:>7.1%} {inclusif / total:>8.1%}  {fonction}")
+        if options['flamegraph']:
+            with open(racine / f"{vue}.folded", 'w', encoding='utf-8') as f:
+                for pile, nombre in piles.most_common():
+                    f.write(f"{pile} {nombre}\n")
+            with open(racine / f"{vue}.svg", 'w', encoding='utf-8') as f:
+                f.write(flamegraph_svg(piles, vue))
+            self.stdout.write(self.style.SUCCESS(f"Flamegraph : {racine / f'{vue}.svg'}"))
+
+    def rapport_cprofile(self, fichiers, top):
+        sortie = io.StringIO()
+        stats = pstats.Stats(*map(str, fichiers), stream=sortie)
+        stats.strip_dirs().sort_stats('tottime').print_stats(top)
+        self.stdout.write(sortie.getvalue())
@@ -0,0 +1,370 @@
+import random
+import string
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, time as heure, timedelta, timezone as tz
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from core.models import (
+    Actualite, ActualiteImage, Categorie, Commune, DemandeSouscription, Forfait, Order, OrderItem,
+    Panier, PanierItem, Produit, SousCategorie, WifiTicket, WifiTicketType, ZoneCouverture,
+)
+from core.panier import recalculer
+from core.signals import modifier_espace
+
+# Marqueurs des données générées (pour --purger)
+MARQUE = '[seed_scale]'
+PREFIXE = 'SEED-'
+PREFIXE_TICKET = 'SEED'
+# Identifiant de ticket SEED<graine>-<9 chiffres> dans ses 20 caractères
+GRAINE_MAX = 10 ** 6
+
+MARQUES = ['MikroTik', 'Ubiquiti', 'TP-Link', 'Cambium', 'Huawei', 'Tenda', 'Mimosa', 'D-Link']
+GAMMES = ['hAP', 'RB', 'CCR', 'LiteBeam', 'NanoStation', 'Archer', 'ePMP', 'Deco', 'PowerBeam']
+REGIONS = ['Conakry', 'Kindia', 'Boké', 'Labé', 'Mamou', 'Kankan', 'Faranah', 'Nzérékoré']
+STATUTS = [('en_attente', 30), ('confirme', 20), ('en_preparation', 10), ('pret', 10), ('livre', 25), ('annule', 5)]
+STATUTS_DEBITES = {'confirme', 'en_preparation', 'pret', 'livre'}
+MOTS = (
+    "fibre couverture réseau débit antenne installation offre abonnement routeur "
+    "client agence connexion internet wifi hotspot service technicien qualité"
+).split()
+
+
+@contextmanager
+def dates_libres(*modeles_champs):
+    """Désactive auto_now_add le temps du chargement pour garder des dates réalistes."""
+    champs = [modele._meta.get_field(nom) for modele, nom in modeles_champs]
+    for champ in champs:
+        champ.auto_now_add = False
+    try:
+        yield
+    finally:
+        for champ in champs:
+            champ.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère un jeu de données volumineux et reproductible (produits, commandes, "
+        "tickets WiFi, demandes, actualités...) par bulk_create en lots."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graine', type=int, default=42, help="Graine aléatoire (même graine = mêmes données)")
+        parser.add_argument('--lot', type=int, default=5000, help="Lignes par INSERT")
+        parser.add_argument('--jours', type=int, default=365, help="Profondeur d'historique des dates")
+        parser.add_argument('--fin', default=None, help="Date de fin de l'historique AAAA-MM-JJ (défaut : aujourd'hui)")
+        parser.add_argument('--categories', type=int, default=6)
+        parser.add_argument('--sous-categories', type=int, default=8, help="Par catégorie")
+        parser.add_argument('--produits', type=int, default=5000)
+        parser.add_argument('--communes', type=int, default=40, help="Par région")
+        parser.add_argument('--clients', type=int, default=5000)
+        parser.add_argument('--commandes', type=int, default=50000)
+        parser.add_argument('--tickets', type=int, default=100000)
+        parser.add_argument('--demandes', type=int, default=20000)
+        parser.add_argument('--actualites', type=int, default=500)
+        parser.add_argument('--purger', action='store_true', help="Supprimer d'abord les données générées précédemment")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['graine'] < GRAINE_MAX:
+            raise CommandError(f"--graine doit être comprise entre 0 et {GRAINE_MAX - 1}")
+        self.rng = random.Random(options['graine'])
+        self.graine = options['graine']
+        self.lot = options['lot']
+        fin = datetime.fromisoformat(options['fin']).date() if options['fin'] else datetime.now(tz.utc).date()
+        self.fin = datetime.combine(fin, heure(23, 59), tzinfo=tz.utc)
+        self.jours = options['jours']
+
+        if options['purger']:
+            self.purger()
+        elif self.deja_generees():
+            raise CommandError(
+                f"Des données de la graine {self.graine} existent déjà : relancer avec --purger "
+                f"ou choisir une autre --graine"
+            )
+
+        debut = time.monotonic()
+        with dates_libres((Order, 'date_commande'), (WifiTicket, 'date_creation'),
+                          (DemandeSouscription, 'date'), (Actualite, 'date_pub')):
+            sous_categories = self.catalogue(options['categories'], options['sous_categories'])
+            produits = self.produits(options['produits'], sous_categories)
+            zones = self.zones(options['communes'])
+            clients = self.clients(options['clients'])
+            self.commandes(options['commandes'], produits, clients)
+            self.tickets(options['tickets'])
+            self.demandes(options['demandes'], zones)
+            self.actualites(options['actualites'])
+        self.stdout.write(self.style.SUCCESS(f"Terminé en {time.monotonic() - debut:.1f} s"))
+
+    # --- outils ---------------------------------------------------------------
+
+    def inserer(self, modele, objets, total):
+        """bulk_create de `objets` (générateur) par lots, une transaction par lot."""
+        if not total:
+            return 0
+        debut, cree = time.monotonic(), 0
+        objets = iter(objets)
+        while lot := list(islice(objets, self.lot)):
+            with transaction.atomic():
+                modele.objects.bulk_create(lot)
+            cree += len(lot)
+            self.stdout.write(f"\r{modele.__name__} : {cree}/{total}", ending='')
+            self.stdout.flush()
+        duree = time.monotonic() - debut
+        self.stdout.write(f"\r{modele.__name__} : {cree} en {duree:.1f} s ({cree / max(duree, 1e-6):.0f}/s)")
+        return cree
+
+    def deja_generees(self):
+        """Vrai si une génération de la même graine est en base (clés uniques déjà prises)."""
+        return (
+            Order.objects.filter(reference__startswith=f"{PREFIXE}{self.graine}-").exists()
+            or WifiTicket.objects.filter(identifiant__startswith=f"{PREFIXE_TICKET}{self.graine}-").exists()
+            or User.objects.filter(username__startswith=f"seed_{self.graine}_").exists()
+        )
+
+    def date(self):
+        """Date dans l'historique, plus dense vers la fin (activité en croissance)."""
+        recul = self.jours * (1 - self.rng.random() ** 0.5)
+        return self.fin - timedelta(days=recul, seconds=self.rng.randrange(86400))
+
+    def texte(self, nb_mots):
+        return ' '.join(self.rng.choices(MOTS, k=nb_mots)).capitalize() + '.'
+
+    def tirage_zipf(self, n, exposant=1.1):
+        """Fonction de tirage d'un index 0..n-1 selon une loi de Zipf (quelques éléments très demandés)."""
+        cumuls = list(accumulate(1 / (rang + 1) ** exposant for rang in range(n)))
+        total, rng = cumuls[-1], self.rng
+        return lambda: min(bisect(cumuls, rng.random() * total), n - 1)
+
+    # --- générateurs ----------------------------------------------------------
+
+    def catalogue(self, nb_categories, par_categorie):
+        categories = [
+            Categorie(nom=f"{self.rng.choice(['Équipement', 'Accessoire', 'Réseau', 'Énergie'])} {i + 1}", description=MARQUE)
+            for i in range(nb_categories)
+        ]
+        Categorie.objects.bulk_create(categories)
+        sous_categories = [
+            SousCategorie(nom=f"{self.rng.choice(GAMMES)} {c.pk}-{j + 1}", categorie=c, description=MARQUE)
+            for c in categories for j in range(par_categorie)
+        ]
+        SousCategorie.objects.bulk_create(sous_categories)
+        self.stdout.write(f"Catégorie : {len(categories)}, SousCategorie : {len(sous_categories)}")
+        return sous_categories
+
+    def produits(self, n, sous_categories):
+        rng = self.rng
+        tirage = self.tirage_zipf(len(sous_categories), 0.8) if sous_categories else None
+
+        def generer():
+            for i in range(n):
+                # Prix log-normal autour de 600 000 GNF, arrondi au millier
+                prix = Decimal(max(5, round(rng.lognormvariate(6.4, 0.9)))) * 1000
+                yield Produit(
+                    nom=f"{rng.choice(MARQUES)} {rng.choice(GAMMES)}-{rng.randint(100, 9999)}",
+                    description=self.texte(rng.randint(15, 60)),
+                    caracteristiques='\n'.join(f"{rng.choice(MOTS)}: {rng.randint(1, 1000)}" for _ in range(rng.randint(2, 8))),
+                    prix=prix,
+                    taux_tva=Decimal('18'),
+                    quantite=0 if rng.random() < 0.1 else rng.randint(1, 200),
+                    is_bon_plan=rng.random() < 0.03,
+                    sous_categorie=sous_categories[tirage()] if tirage else None,
+                    reference=f"{PREFIXE}{self.graine}-P{i:07d}",
+                )
+
+        self.inserer(Produit, generer(), n)
+        return list(
+            Produit.objects.filter(reference__startswith=f"{PREFIXE}{self.graine}-P")
+            .order_by('pk').values_list('pk', 'prix', 'taux_tva')
+        )
+
+    def zones(self, par_zone):
+        zones = [ZoneCouverture(region=region, description=MARQUE) for region in REGIONS]
+        ZoneCouverture.objects.bulk_create(zones)
+        self.inserer(Commune, (
+            Commune(nom=f"{zone.region} {j + 1}", zone=zone) for zone in zones for j in range(par_zone)
+        ), len(zones) * par_zone)
+        return {zone.pk: list(Commune.objects.filter(zone=zone).values_list('pk', flat=True)) for zone in zones}
+
+    def clients(self, n):
+        prefixe = f"seed_{self.graine}_"
+        self.inserer(User, (
+            User(username=f"{prefixe}{i}", email=f"client{i}.{self.graine}@seed.example", password='!')
+            for i in range(n)
+        ), n)
+        return list(User.objects.filter(username__startswith=prefixe).values_list('pk', 'email'))
+
+    def commandes(self, n, produits, clients):
+        if not n or not produits:
+            return
+        rng = self.rng
+        tirage = self.tirage_zipf(len(produits))
+        statuts = [s for s, _ in STATUTS]
+        poids_statuts = list(accumulate(p for _, p in STATUTS))
+        debut, cree, lignes = time.monotonic(), 0, 0
+
+        for depart in range(0, n, self.lot):
+            commandes, contenus = [], []
+            for i in range(depart, min(n, depart + self.lot)):
+                statut = rng.choices(statuts, cum_weights=poids_statuts)[0]
+                contenu = []
+                for _ in range(min(6, 1 + int(rng.expovariate(0.9)))):
+                    pk, prix, taux_tva = produits[tirage()]
+                    quantite = 1 + int(rng.expovariate(1.2))
+                    prix_ttc = prix * (1 + taux_tva / 100)
+                    contenu.append(OrderItem(
+                        produit_id=pk, quantite=quantite, prix_unitaire=prix_ttc,
+                        total_ligne=prix_ttc * quantite, stock_debited=statut in STATUTS_DEBITES,
+                    ))
+                client = rng.choice(clients) if clients and rng.random() < 0.7 else None
+                livraison = rng.random() < 0.6
+                date = self.date()
+                commandes.append(Order(
+                    reference=f"{PREFIXE}{self.graine}-{date:%Y%m%d}-{i:07d}",
+                    client_id=client[0] if client else None,
+                    email=client[1] if client else f"invite{rng.randrange(n)}@seed.example",
+                    nom=f"Client {i}", telephone=f"6{rng.randrange(10 ** 8):08d}",
+                    mode_reception='livraison' if livraison else 'retrait',
+                    adresse_livraison=self.texte(4) if livraison else None,
+                    date_commande=date, statut=statut,
+                    montant_total=sum(item.total_ligne for item in contenu),
+                ))
+                contenus.append(contenu)
+            with transaction.atomic():
+                Order.objects.bulk_create(commandes)
+                items = []
+                for commande, contenu in zip(commandes, contenus):
+                    for item in contenu:
+                        item.commande_id = commande.pk
+                        items.append(item)
+                OrderItem.objects.bulk_create(items, batch_size=self.lot)
+            cree, lignes = cree + len(commandes), lignes + len(items)
+            self.stdout.write(f"\rOrder : {cree}/{n}", ending='')
+            self.stdout.flush()
+        duree = time.monotonic() - debut
+        self.stdout.write(f"\rOrder : {cree}, OrderItem : {lignes} en {duree:.1f} s")
+
+    def tickets(self, n):
+        if not n:
+            return
+        types = list(WifiTicketType.objects.values_list('pk', 'duree_heures'))
+        if not types:
+            WifiTicketType.objects.bulk_create([
+                WifiTicketType(nom=nom, duree_heures=duree, prix=Decimal(prix), ordre=i)
+                for i, (nom, duree, prix) in enumerate([
+                    ('1 heure', 1, 2000), ('2 heures', 2, 3500), ('1 jour', 24, 10000), ('1 semaine', 168, 50000),
+                ])
+            ])
+            types = list(WifiTicketType.objects.values_list('pk', 'duree_heures'))
+        rng = self.rng
+        alphabet = string.ascii_lowercase + string.digits
+        # Les tickets courts se vendent le plus
+        cumuls = list(accumulate(range(len(types) + 1, 1, -1)))
+
+        def generer():
+            for i in range(n):
+                type_pk, duree = rng.choices(types, cum_weights=cumuls)[0]
+                creation = self.date()
+                utilise = rng.random() < 0.6
+                yield WifiTicket(
+                    ticket_type_id=type_pk,
+                    identifiant=f"{PREFIXE_TICKET}{self.graine}-{i:09d}",
+                    mot_de_passe=''.join(rng.choices(alphabet, k=8)),
+                    date_creation=creation,
+                    date_expiration=creation + timedelta(hours=duree),
+                    is_used=utilise,
+                    date_utilisation=creation + timedelta(hours=rng.uniform(0, 72)) if utilise else None,
+                    hotspot=f"hotspot-{rng.randint(1, 40)}" if utilise else '',
+                )
+
+        self.inserer(WifiTicket, generer(), n)
+
+    def demandes(self, n, zones):
+        if not n or not zones:
+            return
+        if not Forfait.objects.exists():
+            Forfait.objects.bulk_create([
+                Forfait(nom=f"{nom} {MARQUE}", prix=Decimal(prix), type=type_)
+                for nom, prix, type_ in [('SkyFibre I', 350000, 'FO'), ('SkyFibre II', 600000, 'FO'), ('SkyGet I', 250000, 'FH')]
+            ])
+        forfaits = list(Forfait.objects.values_list('pk', flat=True))
+        rng = self.rng
+        zones_pk = list(zones)
+        tirage = self.tirage_zipf(len(zones_pk), 1.5)  # Conakry concentre la demande
+
+        def generer():
+            for i in range(n):
+                zone = zones_pk[tirage()]
+                yield DemandeSouscription(
+                    nom=f"Prospect {i}", telephone=f"6{rng.randrange(10 ** 8):08d}",
+                    email=f"prospect{i}@seed.example", forfait_id=rng.choice(forfaits),
+                    zone_id=zone, commune_id=rng.choice(zones[zone]), date=self.date(),
+                )
+
+        self.inserer(DemandeSouscription, generer(), n)
+
+    def actualites(self, n):
+        def generer():
+            for i in range(n):
+                yield Actualite(
+                    titre=self.texte(self.rng.randint(4, 9)).rstrip('.'),
+                    description=self.texte(self.rng.randint(30, 200)),
+                    date_pub=self.date().date(),
+                    lien=f"https://seed.example/actualite/{i}",
+                )
+
+        self.inserer(Actualite, generer(), n)
+
+    def purger(self):
+        """
+        Supprime les données marquées par une génération précédente en DELETE
+        par lots (_raw_delete), enfants d'abord : ni chargement des objets ni
+        signaux par objet. Les données générées n'ont pas de fichiers. Les
+        paniers touchés et les versions de cache sont remis à jour une fois à la fin.
+        """
+        users = User.objects.filter(username__startswith='seed_', email__endswith='@seed.example')
+        produits = Produit.objects.filter(reference__startswith=PREFIXE)
+        categories = Categorie.objects.filter(description=MARQUE)
+        zones = ZoneCouverture.objects.filter(description=MARQUE)
+        forfaits = Forfait.objects.filter(nom__endswith=MARQUE)
+        actualites = Actualite.objects.filter(lien__startswith='https://seed.example/')
+        orders = Order.objects.filter(Q(reference__startswith=PREFIXE) | Q(client__in=users))
+        suppressions = [
+            OrderItem.objects.filter(Q(commande__in=orders) | Q(produit__in=produits)),
+            orders,
+            PanierItem.objects.filter(Q(panier__user__in=users) | Q(produit__in=produits)),
+            Panier.objects.filter(user__in=users),
+            DemandeSouscription.objects.filter(Q(forfait__in=forfaits) | Q(zone__in=zones) | Q(commune__zone__in=zones)),
+            produits,
+            SousCategorie.objects.filter(categorie__in=categories),
+            categories,
+            Commune.objects.filter(zone__in=zones),
+            zones,
+            forfaits,
+            ActualiteImage.objects.filter(actualite__in=actualites),
+            actualites,
+            WifiTicket.objects.filter(identifiant__startswith=PREFIXE_TICKET),
+        ]
+        with transaction.atomic():
+            # Paniers de vrais clients contenant des produits générés : total à recalculer
+            paniers = list(Panier.objects.filter(items__produit__in=produits).exclude(user__in=users).distinct())
+            # Produits existants rangés dans une sous-catégorie générée (SET_NULL)
+            Produit.objects.filter(sous_categorie__categorie__in=categories).exclude(pk__in=produits).update(sous_categorie=None)
+            for queryset in suppressions:
+                nb = queryset._raw_delete(queryset.db)
+                self.stdout.write(f"{queryset.model.__name__} : {nb} ligne(s) supprimée(s)")
+            # Plus rien ne référence les clients générés dans core : cascades
+            # restantes (groupes, permissions) sans signal de core
+            nb, _ = users.delete()
+            self.stdout.write(f"User : {nb} ligne(s) supprimée(s) (cascades comprises)")
+            for panier in paniers:
+                recalculer(panier)
+            for espace in ('produit', 'menu', 'zone', 'forfait', 'actualite'):
+                modifier_espace(espace)
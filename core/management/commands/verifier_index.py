@@ -0,0 +1,85 @@
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from core.models import (
+    Actualite, Commune, EmailSortant, Faq, Order, PanierItem, Produit, QuickBlock,
+    SequenceCommande, WifiTicketType,
+)
+
+# Lecture d'une table entière sans index : "Seq Scan on t" (PostgreSQL),
+# "SCAN t" sans "USING ... INDEX" (SQLite)
+SCAN_POSTGRES = re.compile(r'Seq Scan on (\w+)')
+SCAN_SQLITE = re.compile(r'\bSCAN (\w+)(?! USING)(?!\w)')
+
+
+def requetes_chaudes():
+    """(libellé, queryset) des requêtes des pages et traitements fréquents."""
+    maintenant = timezone.now()
+    user = User(pk=1, email='client@example.com')
+    return [
+        ("mes_commandes", Order.objects.filter(
+            models.Q(client=user) | (models.Q(client__isnull=True) & models.Q(email=user.email))
+        ).order_by('-date_commande', '-pk')[:21]),
+        ("mes_commandes (compte)", Order.objects.filter(client=user).order_by('-date_commande', '-pk')[:21]),
+        ("mes_commandes (sans compte)", Order.objects.filter(
+            client__isnull=True, email=user.email).order_by('-date_commande', '-pk')[:21]),
+        ("admin commandes du jour", Order.objects.filter(
+            date_commande__gte=maintenant - timedelta(days=1), date_commande__lt=maintenant)),
+        ("séquence des références", SequenceCommande.objects.filter(jour=maintenant.date())),
+        ("accueil bons plans", Produit.objects.filter(is_bon_plan=True, quantite__gt=0)[:3]),
+        ("accueil blocs", QuickBlock.objects.order_by('ordre')),
+        ("faq", Faq.objects.order_by('ordre')),
+        ("blog", Actualite.objects.order_by('-date_pub', '-pk')[:11]),
+        ("sous-catégorie", Produit.objects.filter(sous_categorie_id=1).order_by('pk')[:13]),
+        ("panier", PanierItem.objects.filter(panier__user_id=user.pk).select_related('produit')),
+        ("types de tickets", WifiTicketType.objects.filter(is_active=True)),
+        ("commune de la zone", Commune.objects.filter(id=1, zone_id=1)),
+        ("emails à envoyer", EmailSortant.objects.filter(
+            statut='en_attente', prochain_essai__lte=maintenant).order_by('prochain_essai', 'pk')[:50]),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance EXPLAIN sur les requêtes fréquentes et échoue si l'une d'elles "
+        "lit une table entière (Seq Scan / SCAN) au lieu d'utiliser un index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help="Afficher le plan de chaque requête")
+
+    def expliquer(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Sur une petite base le planificateur préfère un Seq Scan même avec
+            # un index : on le pénalise pour vérifier qu'un index existe
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+            return plan, SCAN_POSTGRES.findall(plan)
+        plan = queryset.explain()
+        return plan, SCAN_SQLITE.findall(plan)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f"Base {connection.vendor} non prise en charge")
+
+        echecs = []
+        for libelle, queryset in requetes_chaudes():
+            plan, tables = self.expliquer(queryset)
+            if tables:
+                echecs.append(libelle)
+                self.stdout.write(self.style.ERROR(f"SCAN  {libelle} : {', '.join(sorted(set(tables)))}"))
+            else:
+                self.stdout.write(f"OK    {libelle}")
+            if options['plans'] or tables:
+                self.stdout.write('      ' + plan.replace('\n', '\n      '))
+
+        if echecs:
+            raise CommandError(f"{len(echecs)} requête(s) sans index : {', '.join(echecs)}")
+        self.stdout.write(self.style.SUCCESS("Toutes les requêtes utilisent un index"))
@@ -0,0 +1,345 @@
+"""
+Métriques au format texte Prometheus, partagées entre les workers gunicorn.
+
+Chaque processus écrit ses compteurs dans son propre fichier mappé en mémoire
+(METRIQUES_DOSSIER/<hôte>_<pid>.db) : une incrémentation est une écriture de
+8 octets, sans verrou entre processus. /metrics additionne les fichiers de tous
+les processus. Les fichiers des workers arrêtés sont reportés dans
+<hôte>_archive.db puis supprimés à l'ouverture du fichier d'un nouveau
+processus : les totaux ne reculent pas et le dossier ne grossit pas au fil des
+redémarrages. Le worker d'emails (autre conteneur, même dossier monté) y écrit
+aussi ; le nom d'hôte évite les collisions de pid entre conteneurs.
+"""
+import glob
+import json
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows (développement) : pas de fusion des fichiers
+    fcntl = None
+
+PREFIXE = 'skyconnect_'
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Fichier : [octets utilisés (int32) + remplissage] puis des entrées
+# [longueur de la clé (int32)][clé utf-8 complétée à 8 octets][valeur (float64)]
+ENTETE = 8
+TAILLE_INITIALE = 64 * 1024
+
+_registre = {}
+_verrou = threading.Lock()
+_ouvert = {}  # {'cle': (pid, dossier), 'fichier': _FichierMmap}
+
+
+def _aligner(n):
+    return n + (-n % 8)
+
+
+def _lire_entrees(donnees):
+    """(clé, valeur, position de la valeur) pour chaque entrée d'un fichier."""
+    utilise = struct.unpack_from('<i', donnees, 0)[0]
+    position = ENTETE
+    while position < utilise:
+        longueur = struct.unpack_from('<i', donnees, position)[0]
+        debut_cle = position + 4
+        cle = bytes(donnees[debut_cle:debut_cle + longueur]).decode('utf-8')
+        position_valeur = _aligner(debut_cle + longueur)
+        yield cle, struct.unpack_from('<d', donnees, position_valeur)[0], position_valeur
+        position = position_valeur + 8
+
+
+class _FichierMmap:
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.f = open(chemin, 'a+b')
+        if os.fstat(self.f.fileno()).st_size == 0:
+            self.f.truncate(TAILLE_INITIALE)
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        self.utilise = struct.unpack_from('<i', self.mm, 0)[0] or ENTETE
+        self.positions = {cle: position for cle, _, position in _lire_entrees(self.mm)}
+
+    def _ajouter(self, cle):
+        encodee = cle.encode('utf-8')
+        position_valeur = _aligner(self.utilise + 4 + len(encodee))
+        fin = position_valeur + 8
+        if fin > len(self.mm):
+            taille = len(self.mm)
+            while fin > taille:
+                taille *= 2
+            self.mm.close()
+            self.f.truncate(taille)
+            self.mm = mmap.mmap(self.f.fileno(), 0)
+        struct.pack_into(f'<i{len(encodee)}s', self.mm, self.utilise, len(encodee), encodee)
+        struct.pack_into('<d', self.mm, position_valeur, 0.0)
+        # L'en-tête n'est avancé qu'une fois l'entrée écrite : un lecteur
+        # concurrent ne voit jamais d'entrée incomplète
+        self.utilise = fin
+        struct.pack_into('<i', self.mm, 0, self.utilise)
+        self.positions[cle] = position_valeur
+        return position_valeur
+
+    def incrementer(self, cle, delta):
+        position = self.positions.get(cle)
+        if position is None:
+            position = self._ajouter(cle)
+        valeur = struct.unpack_from('<d', self.mm, position)[0]
+        struct.pack_into('<d', self.mm, position, valeur + delta)
+
+    def fermer(self):
+        self.mm.flush()
+        self.mm.close()
+        self.f.close()
+
+
+def dossier_metriques():
+    return Path(getattr(settings, 'METRIQUES_DOSSIER', settings.BASE_DIR / 'logs' / 'metriques'))
+
+
+@contextmanager
+def _verrou_dossier(dossier, exclusif):
+    # Partagé pour lire les fichiers, exclusif pour fusionner ceux des processus arrêtés
+    with open(dossier / '.verrou', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusif else fcntl.LOCK_SH)
+        yield
+
+
+def _vivant(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fusionner_processus_arretes(dossier=None):
+    """
+    Reporte les compteurs des processus arrêtés de cet hôte dans
+    <hôte>_archive.db et supprime leurs fichiers. Retourne le nombre de
+    fichiers fusionnés. Les autres hôtes (conteneurs) fusionnent les leurs.
+    """
+    if fcntl is None:
+        return 0
+    dossier = Path(dossier or dossier_metriques())
+    hote = socket.gethostname()
+    arretes = []
+    for chemin in dossier.glob(f'{glob.escape(hote)}_*.db'):
+        pid = chemin.stem[len(hote) + 1:]
+        if pid.isdigit() and int(pid) != os.getpid() and not _vivant(int(pid)):
+            arretes.append(chemin)
+    if not arretes:
+        return 0
+    fusionnes = 0
+    with _verrou_dossier(dossier, exclusif=True):
+        archive = _FichierMmap(dossier / f'{hote}_archive.db')
+        try:
+            for chemin in arretes:
+                try:
+                    donnees = chemin.read_bytes()
+                except FileNotFoundError:
+                    continue  # déjà fusionné par un autre worker
+                if len(donnees) >= ENTETE:
+                    for cle, valeur, _ in _lire_entrees(donnees):
+                        archive.incrementer(cle, valeur)
+                chemin.unlink()
+                fusionnes += 1
+        finally:
+            archive.fermer()
+    return fusionnes
+
+
+def _fichier():
+    # Ouvert à la première écriture et rouvert après un fork (pid différent)
+    cle = (os.getpid(), getattr(settings, 'METRIQUES_DOSSIER', None))
+    if _ouvert.get('cle') != cle:
+        dossier = dossier_metriques()
+        dossier.mkdir(parents=True, exist_ok=True)
+        fusionner_processus_arretes(dossier)
+        _ouvert['fichier'] = _FichierMmap(dossier / f"{socket.gethostname()}_{os.getpid()}.db")
+        _ouvert['cle'] = cle
+    return _ouvert['fichier']
+
+
+def _incrementer(increments):
+    """Applique [(clé, delta), ...] sous un seul verrou."""
+    try:
+        with _verrou:
+            fichier = _fichier()
+            for cle, delta in increments:
+                fichier.incrementer(cle, delta)
+    except OSError as e:
+        # Une métrique perdue ne doit jamais faire échouer la requête
+        print(f"ERROR: métriques non enregistrées : {e}")
+
+
+def _cle(metrique, serie, etiquettes):
+    return json.dumps([metrique, serie, sorted(etiquettes.items())], ensure_ascii=False)
+
+
+class Compteur:
+    type = 'counter'
+
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom = PREFIXE + nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        # Clés déjà sérialisées par jeu d'étiquettes : pas de json.dumps par incrément
+        self._cles = {}
+        _registre[self.nom] = self
+
+    def _etiquettes(self, etiquettes):
+        if set(etiquettes) != set(self.etiquettes):
+            raise ValueError(f"{self.nom} attend les étiquettes {self.etiquettes}, reçu {tuple(etiquettes)}")
+        return {k: str(v) for k, v in etiquettes.items()}
+
+    def _series(self, etiquettes):
+        return _cle(self.nom, self.nom, self._etiquettes(etiquettes))
+
+    def _cles_pour(self, etiquettes):
+        index = tuple(sorted(etiquettes.items()))
+        cles = self._cles.get(index)
+        if cles is None:
+            cles = self._cles[index] = self._series(etiquettes)
+        return cles
+
+    def inc(self, valeur=1, **etiquettes):
+        _incrementer([(self._cles_pour(etiquettes), valeur)])
+
+
+class Histogramme(Compteur):
+    type = 'histogram'
+
+    def __init__(self, nom, aide, etiquettes=(), bornes=BORNES_DUREE):
+        super().__init__(nom, aide, etiquettes)
+        self.bornes = tuple(sorted(bornes)) + (float('inf'),)
+
+    def _series(self, etiquettes):
+        etiquettes = self._etiquettes(etiquettes)
+        buckets = [
+            (borne, _cle(self.nom, f'{self.nom}_bucket', {**etiquettes, 'le': _format(borne)}))
+            for borne in self.bornes
+        ]
+        return buckets, _cle(self.nom, f'{self.nom}_sum', etiquettes), _cle(self.nom, f'{self.nom}_count', etiquettes)
+
+    def observer(self, valeur, **etiquettes):
+        buckets, somme, nombre = self._cles_pour(etiquettes)
+        # Buckets stockés déjà cumulés (le <= borne), comme à l'export
+        increments = [(cle, 1) for borne, cle in buckets if valeur <= borne]
+        increments += [(somme, valeur), (nombre, 1)]
+        _incrementer(increments)
+
+    @contextmanager
+    def chronometrer(self, **etiquettes):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observer(time.perf_counter() - debut, **etiquettes)
+
+
+def _format(valeur):
+    if valeur == float('inf'):
+        return '+Inf'
+    if float(valeur).is_integer():
+        return str(int(valeur))
+    return repr(float(valeur))
+
+
+def _echapper(valeur):
+    return valeur.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def agreger():
+    """Somme des valeurs de tous les fichiers du dossier : {clé: valeur}."""
+    totaux = {}
+    dossier = dossier_metriques()
+    if not dossier.is_dir():
+        return totaux
+    # Pas de fusion en cours : un fichier n'est jamais compté deux fois (archive et original)
+    with _verrou_dossier(dossier, exclusif=False):
+        for chemin in dossier.glob('*.db'):
+            try:
+                donnees = chemin.read_bytes()
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"ERROR: lecture de {chemin} impossible : {e}")
+                continue
+            if len(donnees) < ENTETE:
+                continue
+            for cle, valeur, _ in _lire_entrees(donnees):
+                totaux[cle] = totaux.get(cle, 0.0) + valeur
+    return totaux
+
+
+def exposer():
+    """Texte au format d'exposition Prometheus (version 0.0.4)."""
+    series = {}
+    for cle, valeur in agreger().items():
+        metrique, serie, etiquettes = json.loads(cle)
+        series.setdefault(metrique, []).append((serie, etiquettes, valeur))
+
+    lignes = []
+    for nom in sorted(_registre):
+        metrique = _registre[nom]
+        lignes.append(f"# HELP {nom} {metrique.aide}")
+        lignes.append(f"# TYPE {nom} {metrique.type}")
+        for serie, etiquettes, valeur in sorted(series.get(nom, []), key=_ordre_serie):
+            # "le" en dernier, comme l'écrivent les clients Prometheus officiels
+            etiquettes = sorted(etiquettes, key=lambda e: e[0] == 'le')
+            texte = ','.join(f'{k}="{_echapper(v)}"' for k, v in etiquettes)
+            lignes.append(f"{serie}{{{texte}}} {_format(valeur)}" if texte else f"{serie} {_format(valeur)}")
+    return '\n'.join(lignes) + '\n'
+
+
+def _ordre_serie(element):
+    serie, etiquettes, _ = element
+    autres = [(k, v) for k, v in etiquettes if k != 'le']
+    le = dict(etiquettes).get('le')
+    suffixe = {'_bucket': 0, '_sum': 1, '_count': 2}.get(serie[serie.rfind('_'):], 0)
+    return autres, suffixe, float(le) if le is not None else 0
+
+
+# Méthodes suivies telles quelles ; les autres (au choix du client) sont
+# regroupées sous « autre » pour borner le nombre de séries
+METHODES = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+class MetriquesMiddleware:
+    """Nombre et durée des requêtes HTTP par vue, méthode et statut."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        debut = time.perf_counter()
+        response = self.get_response(request)
+        duree = time.perf_counter() - debut
+        match = request.resolver_match
+        vue = match.view_name if match else 'non_resolue'
+        methode = request.method if request.method in METHODES else 'autre'
+        requetes_http.inc(vue=vue, methode=methode, statut=response.status_code)
+        duree_requetes.observer(duree, vue=vue)
+        return response
+
+
+requetes_http = Compteur('requetes_http_total', "Requêtes HTTP traitées", ('vue', 'methode', 'statut'))
+duree_requetes = Histogramme('duree_requete_secondes', "Durée de traitement des requêtes HTTP", ('vue',))
+commandes = Compteur('commandes_total', "Commandes passées (confirmation)", ('mode', 'resultat'))
+duree_commandes = Histogramme('duree_commande_secondes', "Durée de création d'une commande", ('mode',))
+debits_stock = Compteur('debits_stock_total', "Débits de stock (Order.debit_stock)", ('resultat',))
+ajouts_panier = Compteur('ajouts_panier_total', "Ajouts au panier", ('connecte', 'resultat'))
+connexions_google = Compteur('connexions_google_total', "Connexions via Google", ('resultat',))
+emails = Compteur('emails_total', "Emails mis en file, envoyés ou en échec", ('resultat',))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:25
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def calculer_resumes(apps, schema_editor):
+    Panier = apps.get_model('core', 'Panier')
+    PanierItem = apps.get_model('core', 'PanierItem')
+    resumes = {}
+    lignes = PanierItem.objects.values_list('panier_id', 'quantite', 'produit__prix', 'produit__taux_tva')
+    for panier_id, quantite, prix, taux_tva in lignes.iterator():
+        nb, total = resumes.get(panier_id, (0, Decimal('0')))
+        ligne = (prix * (1 + taux_tva / 100) * quantite).quantize(Decimal('0.01'))
+        resumes[panier_id] = (nb + quantite, total + ligne)
+    paniers = list(Panier.objects.filter(pk__in=resumes))
+    for panier in paniers:
+        panier.nb_articles, panier.total_ttc = resumes[panier.pk]
+    Panier.objects.bulk_update(paniers, ['nb_articles', 'total_ttc'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_wifitickettype_wifiticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panier',
+            name='nb_articles',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='panier',
+            name='total_ttc',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(calculer_resumes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:30
+
+import datetime
+import re
+
+from django.db import migrations, models
+
+
+def initialiser_sequences(apps, schema_editor):
+    """Reprend le dernier numéro utilisé chaque jour pour ne pas réattribuer une référence."""
+    Order = apps.get_model('core', 'Order')
+    SequenceCommande = apps.get_model('core', 'SequenceCommande')
+    derniers = {}
+    for reference in Order.objects.values_list('reference', flat=True).iterator():
+        m = re.fullmatch(r'CMD-(\d{8})-(\d+)', reference or '')
+        if m:
+            jour = datetime.datetime.strptime(m.group(1), '%Y%m%d').date()
+            derniers[jour] = max(derniers.get(jour, 0), int(m.group(2)))
+    SequenceCommande.objects.bulk_create(
+        [SequenceCommande(jour=jour, dernier=dernier) for jour, dernier in derniers.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_panier_nb_articles_total_ttc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCommande',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField(unique=True)),
+                ('dernier', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Séquence de commandes',
+                'verbose_name_plural': 'Séquences de commandes',
+            },
+        ),
+        migrations.RunPython(initialiser_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_sequencecommande'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sujet', models.CharField(max_length=255)),
+                ('destinataires', models.JSONField(default=list)),
+                ('corps_texte', models.TextField()),
+                ('corps_html', models.TextField(blank=True)),
+                ('avec_logo', models.BooleanField(default=False, help_text='Joindre le logo en image inline (cid:logo)')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('envoye', 'Envoyé'), ('echec', 'Échec définitif')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Email sortant',
+                'verbose_name_plural': 'Emails sortants',
+                'ordering': ['prochain_essai', 'pk'],
+                'indexes': [models.Index(fields=['statut', 'prochain_essai'], name='core_email_a_envoyer_idx')],
+            },
+        ),
+    ]
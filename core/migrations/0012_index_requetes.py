@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_emailsortant'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actualite',
+            index=models.Index(fields=['-date_pub', '-id'], name='core_actu_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commune',
+            index=models.Index(fields=['zone', 'id'], name='core_commune_zone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faq',
+            index=models.Index(fields=['ordre'], name='core_faq_ordre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', '-date_commande', '-id'], name='core_order_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('client__isnull', True)), fields=['email', '-date_commande', '-id'], name='core_order_invite_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date_commande'], name='core_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['sous_categorie', 'id'], name='core_produit_souscat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('is_bon_plan', True)), fields=['quantite'], name='core_produit_bon_plan_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quickblock',
+            index=models.Index(fields=['ordre'], name='core_quickblock_ordre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wifitickettype',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['ordre', 'duree_heures'], name='core_ticket_type_ordre_idx'),
+        ),
+    ]
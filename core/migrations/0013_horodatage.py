@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_index_requetes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Horodatage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('espace', models.CharField(max_length=50, unique=True)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Horodatage de modification',
+                'verbose_name_plural': 'Horodatages de modification',
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+# La connexion Google cherche l'utilisateur par email : index sur
+# auth_user.email. La table appartient à django.contrib.auth, d'où le SQL
+# direct (même syntaxe pour PostgreSQL et SQLite).
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_horodatage'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS core_user_email_idx ON auth_user (email)',
+            'DROP INDEX IF EXISTS core_user_email_idx',
+        ),
+    ]
@@ -1,9 +1,13 @@
-from django.db import models, transaction
+from django.db import models, transaction, connection, IntegrityError
 from django.db.models import F
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .caching import bump_version
+from .metriques import debits_stock
+
 class Agence(models.Model):
     nom = models.CharField(max_length=200, blank=True, null=True)
     adresse = models.TextField(blank=True, null=True)
@@ -34,6 +38,10 @@ class Commune(models.Model):
     description = models.TextField(blank=True)
     zone = models.ForeignKey(ZoneCouverture, related_name='communes', on_delete=models.CASCADE)
 
+    class Meta:
+        # Commune.objects.filter(id=..., zone_id=...) et communes d'une zone par id
+        indexes = [models.Index(fields=['zone', 'id'], name='core_commune_zone_idx')]
+
     def __str__(self):
         return self.nom
     
@@ -53,6 +61,10 @@ class Actualite(models.Model):
     date_pub = models.DateField(auto_now_add=True)
     lien = models.URLField(blank=True, null=True)
 
+    class Meta:
+        # Tri et pagination par clé du blog : (-date_pub, -id)
+        indexes = [models.Index(fields=['-date_pub', '-id'], name='core_actu_date_idx')]
+
     def __str__(self):
         return self.titre
 
@@ -84,6 +96,9 @@ class QuickBlock(models.Model):
     icon = models.CharField(max_length=50, blank=True, help_text="Classe Bootstrap Icons (ex: 'bi-box-seam')")
     ordre = models.PositiveIntegerField(default=0)  # Ajout pour l'ordre
 
+    class Meta:
+        indexes = [models.Index(fields=['ordre'], name='core_quickblock_ordre_idx')]
+
     def get_url(self):
         from django.urls import reverse
         return reverse(self.url_name)
@@ -103,6 +118,9 @@ class Faq(models.Model):
     question = models.CharField(max_length=255)
     ordre = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [models.Index(fields=['ordre'], name='core_faq_ordre_idx')]
+
     def __str__(self):
         return self.question
 
@@ -168,6 +186,14 @@ class Produit(models.Model):
     reference = models.CharField(max_length=100, blank=True, help_text="Référence ou SKU du produit")
     date_ajout = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Liste paginée d'une sous-catégorie : sous_categorie_id puis id
+        indexes = [
+            models.Index(fields=['sous_categorie', 'id'], name='core_produit_souscat_idx'),
+            # Bons plans de l'accueil : is_bon_plan=True AND quantite > 0 (index partiel)
+            models.Index(fields=['quantite'], condition=models.Q(is_bon_plan=True), name='core_produit_bon_plan_idx'),
+        ]
+
     @property
     def prix_ttc(self):
         return self.prix * (1 + self.taux_tva / 100)
@@ -184,6 +210,9 @@ class Produit(models.Model):
 class Panier(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     date_creation = models.DateTimeField(auto_now_add=True)
+    # Résumé dénormalisé, maintenu par les vues du panier (voir core/panier.py)
+    nb_articles = models.PositiveIntegerField(default=0)
+    total_ttc = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
 class PanierItem(models.Model):
     panier = models.ForeignKey(Panier, related_name='items', on_delete=models.CASCADE)
@@ -210,6 +239,103 @@ import datetime
 
 # ...existing code...
 
+class SequenceCommande(models.Model):
+    """Compteur journalier des références de commande (CMD-YYYYMMDD-NNNN)."""
+    jour = models.DateField(unique=True)
+    dernier = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Séquence de commandes"
+        verbose_name_plural = "Séquences de commandes"
+
+    def __str__(self):
+        return f"{self.jour} : {self.dernier}"
+
+    @classmethod
+    def suivant(cls, jour):
+        """
+        Réserve et retourne le prochain numéro du jour en une seule requête
+        (INSERT ... ON CONFLICT DO UPDATE ... RETURNING, PostgreSQL et SQLite >= 3.35).
+        L'upsert rend chaque numéro unique, sans nouvel essai. La ligne du jour
+        reste verrouillée jusqu'à la fin de la transaction appelante : appeler
+        hors d'une transaction longue, sinon les autres commandes attendent.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (jour, dernier) VALUES (%s, 1) "
+                f"ON CONFLICT (jour) DO UPDATE SET dernier = {table}.dernier + 1 "
+                f"RETURNING dernier",
+                [jour],
+            )
+            return cursor.fetchone()[0]
+
+
+class Horodatage(models.Model):
+    """
+    Date et numéro de la dernière modification d'un espace de données
+    (produit, forfait, faq, ...), tenus à jour par les signaux. Servent de
+    Last-Modified / ETag aux pages qui en dépendent (core/fraicheur.py).
+    """
+    espace = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=1)
+    date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Horodatage de modification"
+        verbose_name_plural = "Horodatages de modification"
+
+    def __str__(self):
+        return f"{self.espace} v{self.version} ({self.date:%Y-%m-%d %H:%M:%S})"
+
+    @staticmethod
+    def _cle(espace):
+        return f"core:horodatage:{espace}"
+
+    @classmethod
+    def marquer(cls, *espaces):
+        """Note une modification des espaces (une requête UPDATE, plus un INSERT la première fois)."""
+        # Précision HTTP : la seconde (le numéro de version départage le reste)
+        maintenant = timezone.now().replace(microsecond=0)
+        modifies = cls.objects.filter(espace__in=espaces).update(version=F('version') + 1, date=maintenant)
+        if modifies < len(espaces):
+            cls.objects.bulk_create(
+                [cls(espace=espace, date=maintenant) for espace in espaces],
+                ignore_conflicts=True,
+            )
+        cles = [cls._cle(espace) for espace in espaces]
+        cache.delete_many(cles)
+        # Et après le commit : un lecteur concurrent a pu remettre l'ancienne valeur en cache
+        transaction.on_commit(lambda: cache.delete_many(cles))
+
+    @classmethod
+    def lire(cls, *espaces):
+        """{espace: (version, date)} depuis le cache, ou en une requête pour les absents."""
+        trouves = cache.get_many([cls._cle(espace) for espace in espaces])
+        resultat = {espace: trouves[cls._cle(espace)] for espace in espaces if cls._cle(espace) in trouves}
+        manquants = [espace for espace in espaces if espace not in resultat]
+        if manquants:
+            lus = {h.espace: (h.version, h.date) for h in cls.objects.filter(espace__in=manquants)}
+            if len(lus) < len(manquants):
+                # Espace jamais modifié depuis la mise en place : on part de maintenant
+                maintenant = timezone.now().replace(microsecond=0)
+                cls.objects.bulk_create(
+                    [cls(espace=espace, date=maintenant) for espace in manquants if espace not in lus],
+                    ignore_conflicts=True,
+                )
+                lus = {h.espace: (h.version, h.date) for h in cls.objects.filter(espace__in=manquants)}
+            cache.set_many({cls._cle(espace): valeur for espace, valeur in lus.items()}, None)
+            resultat.update(lus)
+        return resultat
+
+
+def _stock_modifie():
+    # UPDATE en masse, sans signal : les bons plans et fiches produits affichent le stock.
+    # Après le commit, pour ne pas garder la ligne d'horodatage verrouillée pendant la commande.
+    bump_version('produit')
+    Horodatage.marquer('produit')
+
+
 class Order(models.Model):
     STATUT_CHOICES = (
         ('en_attente', 'En attente'),
@@ -233,6 +359,19 @@ class Order(models.Model):
     montant_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
 
+    class Meta:
+        # Historique "mes commandes" : par client (ou email) puis (-date_commande, -id)
+        indexes = [
+            models.Index(fields=['client', '-date_commande', '-id'], name='core_order_client_date_idx'),
+            # Commandes passées sans compte : client IS NULL AND email = ... (index partiel)
+            models.Index(
+                fields=['email', '-date_commande', '-id'], condition=models.Q(client__isnull=True),
+                name='core_order_invite_date_idx',
+            ),
+            # Filtre par date de l'admin
+            models.Index(fields=['date_commande'], name='core_order_date_idx'),
+        ]
+
     @property
     def montant_total_ttc(self):
         return sum(item.total_ligne for item in self.items.all())
@@ -245,6 +384,12 @@ class Order(models.Model):
     def __str__(self):
         return f"{self.reference}"
 
+    @staticmethod
+    def nouvelle_reference(maintenant=None):
+        """Référence unique CMD-YYYYMMDD-NNNN, allouée en temps constant (voir SequenceCommande.suivant)."""
+        jour = (maintenant or timezone.now()).date()
+        return f"CMD-{jour:%Y%m%d}-{SequenceCommande.suivant(jour):04d}"
+
     def save(self, *args, **kwargs):
         old_status = None
         if self.pk:
@@ -262,38 +407,67 @@ class Order(models.Model):
         if old_status in confirmed_states and self.statut == 'annule':
             self.restore_stock()
 
+    def _lignes_a_traiter(self, stock_debited):
+        """
+        Verrouille les lignes de la commande dans l'état demandé et retourne
+        (ids des lignes, {produit_id: quantité totale}).
+        """
+        lignes = self.items.select_for_update().filter(stock_debited=stock_debited).values_list('pk', 'produit_id', 'quantite')
+        ids, quantites = [], {}
+        for pk, produit_id, quantite in lignes:
+            ids.append(pk)
+            quantites[produit_id] = quantites.get(produit_id, 0) + quantite
+        return ids, quantites
+
     def debit_stock(self):
         """
-        Décrémente le stock de façon atomique. Si la mise-à-jour conditionnelle
-        échoue (quantité insuffisante) on lève ValueError.
+        Décrémente le stock de toutes les lignes en quelques requêtes : verrouillage
+        des lignes et des produits, un seul UPDATE sur Produit, un seul UPDATE sur
+        les lignes. Tout ou rien : si un ou plusieurs produits manquent de stock,
+        rien n'est modifié et ValueError liste tous les produits concernés.
         """
         with transaction.atomic():
-            for item in self.items.select_for_update():
-                if getattr(item, 'stock_debited', False):
-                    continue
-                # update conditionnel : ne décrémente que si quantite >= item.quantite
-                updated = Produit.objects.filter(
-                    pk=item.produit_id,
-                    quantite__gte=item.quantite
-                ).update(quantite=F('quantite') - item.quantite)
-                if not updated:
-                    # Ne modifie rien en base pour cet item -> stock insuffisant
-                    raise ValueError(f"Stock insuffisant pour {getattr(item.produit, 'nom', getattr(item.produit, 'name', item.produit_id))}")
-                # Marquer la ligne comme débitée
-                item.stock_debited = True
-                item.save(update_fields=['stock_debited'])
+            ids, quantites = self._lignes_a_traiter(stock_debited=False)
+            if not ids:
+                return
+            # Verrou des produits dans un ordre stable pour éviter les interblocages
+            stocks = Produit.objects.select_for_update().filter(pk__in=quantites).order_by('pk').values_list('pk', 'nom', 'quantite')
+            manquants = [nom or f"Produit #{pk}" for pk, nom, stock in stocks if stock < quantites[pk]]
+            if manquants:
+                debits_stock.inc(resultat='stock_insuffisant')
+                raise ValueError(f"Stock insuffisant pour {', '.join(manquants)}")
+            try:
+                Produit.objects.filter(pk__in=quantites).update(quantite=models.Case(
+                    *[models.When(pk=pk, then=F('quantite') - quantite) for pk, quantite in quantites.items()],
+                    default=F('quantite'),
+                    output_field=models.PositiveIntegerField(),
+                ))
+            except IntegrityError:
+                # Contrainte quantite >= 0 : stock modifié entre la lecture et l'écriture
+                # (bases sans SELECT ... FOR UPDATE, comme SQLite)
+                debits_stock.inc(resultat='conflit')
+                raise ValueError("Stock insuffisant pour un ou plusieurs produits de la commande")
+            OrderItem.objects.filter(pk__in=ids).update(stock_debited=True)
+            # Compté seulement si la transaction englobante est validée
+            transaction.on_commit(lambda: debits_stock.inc(resultat='ok'))
+            transaction.on_commit(_stock_modifie)
 
     def restore_stock(self):
         """
-        Restaure le stock (atomique) pour les items marqués stock_debited.
+        Restaure le stock (atomique) pour les items marqués stock_debited,
+        avec un UPDATE sur Produit et un UPDATE sur les lignes.
         """
         with transaction.atomic():
-            for item in self.items.select_for_update():
-                if not getattr(item, 'stock_debited', False):
-                    continue
-                Produit.objects.filter(pk=item.produit_id).update(quantite=F('quantite') + item.quantite)
-                item.stock_debited = False
-                item.save(update_fields=['stock_debited'])
+            ids, quantites = self._lignes_a_traiter(stock_debited=True)
+            if not ids:
+                return
+            Produit.objects.filter(pk__in=quantites).update(quantite=models.Case(
+                *[models.When(pk=pk, then=F('quantite') + quantite) for pk, quantite in quantites.items()],
+                default=F('quantite'),
+                output_field=models.PositiveIntegerField(),
+            ))
+            OrderItem.objects.filter(pk__in=ids).update(stock_debited=False)
+            transaction.on_commit(_stock_modifie)
 
 
 class OrderItem(models.Model):
@@ -325,6 +499,10 @@ class WifiTicketType(models.Model):
 
     class Meta:
         ordering = ['ordre', 'duree_heures']
+        # Types actifs dans l'ordre d'affichage (index partiel)
+        indexes = [
+            models.Index(fields=['ordre', 'duree_heures'], condition=models.Q(is_active=True), name='core_ticket_type_ordre_idx'),
+        ]
         verbose_name = "Type de ticket WiFi"
         verbose_name_plural = "Types de tickets WiFi"
 
@@ -358,3 +536,37 @@ class WifiTicket(models.Model):
         if not self.date_expiration:
             self.date_expiration = self.date_creation + timezone.timedelta(hours=self.ticket_type.duree_heures)
         super().save(*args, **kwargs)
+
+
+class EmailSortant(models.Model):
+    """
+    File d'attente des emails (outbox). Les vues enregistrent le message dans la
+    même transaction que les données métier ; la commande envoyer_emails les
+    expédie ensuite par lots sur une seule connexion SMTP.
+    """
+    STATUT_CHOICES = (
+        ('en_attente', 'En attente'),
+        ('envoye', 'Envoyé'),
+        ('echec', 'Échec définitif'),
+    )
+
+    sujet = models.CharField(max_length=255)
+    destinataires = models.JSONField(default=list)
+    corps_texte = models.TextField()
+    corps_html = models.TextField(blank=True)
+    avec_logo = models.BooleanField(default=False, help_text="Joindre le logo en image inline (cid:logo)")
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    tentatives = models.PositiveIntegerField(default=0)
+    prochain_essai = models.DateTimeField(default=timezone.now)
+    derniere_erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['prochain_essai', 'pk']
+        indexes = [models.Index(fields=['statut', 'prochain_essai'], name='core_email_a_envoyer_idx')]
+        verbose_name = "Email sortant"
+        verbose_name_plural = "Emails sortants"
+
+    def __str__(self):
+        return f"{self.sujet} -> {', '.join(self.destinataires)}"
@@ -0,0 +1,117 @@
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .caching import DEFAULT_TIMEOUT, get_versions
+from .panier import COOKIE_PANIER
+
+# Espaces dont dépend base.html (logo, menu) : communs à toutes les pages
+ESPACES_BASE = ('logo', 'menu')
+# Le jeton CSRF est propre à chaque visiteur : remplacé par un marqueur dans
+# la copie en cache, puis par un jeton neuf à chaque service
+JETON_CSRF = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+MARQUEUR_CSRF = '__jeton_csrf__'
+ATTENTE_MAX = 5
+ATTENTE_PAS = 0.05
+
+
+def _cookies_personnels():
+    return (settings.SESSION_COOKIE_NAME, COOKIE_PANIER, 'messages')
+
+
+def est_cachable(request):
+    """
+    GET/HEAD sans paramètres d'un visiteur sans session, sans panier et sans
+    message en attente : la page est alors identique pour tous.
+    """
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.GET
+        and not any(request.COOKIES.get(nom) for nom in _cookies_personnels())
+    )
+
+
+def _cle_page(request):
+    # Schéma et hôte : les pages contiennent des URL absolues (connexion Google)
+    brut = f"{request.scheme}://{request.get_host()}{request.path}"
+    return f"core:page:{hashlib.md5(brut.encode()).hexdigest()}"
+
+
+def _servir(request, entree, etat):
+    response = HttpResponse(entree['contenu'], content_type=entree['type'])
+    if MARQUEUR_CSRF in entree['contenu']:
+        # get_token() demande aussi à CsrfViewMiddleware de poser le cookie
+        response.content = entree['contenu'].replace(MARQUEUR_CSRF, get_token(request))
+    response['X-Cache'] = etat
+    return response
+
+
+def _generer(request, vue, args, kwargs, cle, signature):
+    response = vue(request, *args, **kwargs)
+    session = getattr(request, 'session', None)
+    if (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not (session is not None and session.modified)
+    ):
+        contenu = JETON_CSRF.sub(rf'\g<1>{MARQUEUR_CSRF}\g<2>', response.content.decode(response.charset))
+        cache.set(cle, {
+            'signature': signature,
+            'expire': time.time() + settings.PAGE_CACHE_TTL,
+            'contenu': contenu,
+            'type': response['Content-Type'],
+        }, DEFAULT_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def page_anonyme_en_cache(*espaces):
+    """
+    Cache de page complète pour les visiteurs anonymes. La copie est valable
+    tant que les espaces versionnés dont la page dépend (plus logo et menu)
+    n'ont pas changé, et au plus PAGE_CACHE_TTL secondes.
+
+    Régénération unique : quand la copie est périmée, une seule requête (verrou
+    cache.add) refait la page ; les autres servent l'ancienne copie en
+    attendant (X-Cache: STALE), ou patientent si aucune copie n'existe.
+    """
+    espaces = ESPACES_BASE + espaces
+
+    def decorateur(vue):
+        @wraps(vue)
+        def wrapper(request, *args, **kwargs):
+            if settings.PAGE_CACHE_TTL <= 0 or not est_cachable(request):
+                return vue(request, *args, **kwargs)
+
+            cle = _cle_page(request)
+            versions = get_versions(*espaces)
+            signature = ':'.join(f"{ns}.v{versions[ns]}" for ns in espaces)
+            entree = cache.get(cle)
+            if entree and entree['signature'] == signature and entree['expire'] > time.time():
+                return _servir(request, entree, 'HIT')
+
+            verrou = f"{cle}:verrou"
+            fin_attente = time.monotonic() + ATTENTE_MAX
+            while not cache.add(verrou, 1, ATTENTE_MAX * 2):
+                if entree:
+                    return _servir(request, entree, 'STALE')
+                if time.monotonic() > fin_attente:
+                    # Le régénérateur est trop lent ou a échoué : on rend la page soi-même
+                    return vue(request, *args, **kwargs)
+                time.sleep(ATTENTE_PAS)
+                entree = cache.get(cle)
+                if entree and entree['signature'] == signature:
+                    return _servir(request, entree, 'HIT')
+            try:
+                return _generer(request, vue, args, kwargs, cle, signature)
+            finally:
+                cache.delete(verrou)
+        return wrapper
+    return decorateur
@@ -0,0 +1,78 @@
+from typing import NamedTuple
+
+from django.core import signing
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+CURSEUR_SALT = 'core.pagination'
+
+
+class PageCurseur(NamedTuple):
+    items: list
+    suivant: str  # curseur de la page suivante, None si c'est la dernière
+
+
+def _champ(modele, nom):
+    return modele._meta.pk if nom == 'pk' else modele._meta.get_field(nom)
+
+
+def _apres(ordre, valeurs):
+    """
+    Condition "strictement après la ligne `valeurs`" pour un tri sur plusieurs
+    colonnes de sens quelconque :
+    (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+    """
+    condition = Q()
+    egalites = {}
+    for nom, valeur in zip(ordre, valeurs):
+        champ = nom.lstrip('-')
+        comparaison = 'lt' if nom.startswith('-') else 'gt'
+        condition |= Q(**egalites, **{f'{champ}__{comparaison}': valeur})
+        egalites[champ] = valeur
+    return condition
+
+
+def paginer(queryset, ordre, curseur=None, taille=12):
+    """
+    Pagination par clé (keyset) : au lieu d'un OFFSET qui relit toutes les
+    lignes précédentes, la page suivante commence après la dernière ligne vue.
+    `ordre` doit se terminer par une colonne unique (pk) pour un tri stable, et
+    correspondre à un index. Le curseur est signé : un curseur invalide ramène
+    à la première page.
+    """
+    modele = queryset.model
+    qs = queryset.order_by(*ordre)
+    if curseur:
+        try:
+            brut = signing.loads(curseur, salt=CURSEUR_SALT)
+            valeurs = [_champ(modele, nom.lstrip('-')).to_python(v) for nom, v in zip(ordre, brut)]
+            qs = qs.filter(_apres(ordre, valeurs))
+        except (signing.BadSignature, TypeError, ValueError) as e:
+            print(f"ERROR: curseur de pagination invalide : {e}")
+
+    items = list(qs[:taille + 1])
+    suivant = None
+    if len(items) > taille:
+        items = items[:taille]
+        dernier = items[-1]
+        suivant = signing.dumps(
+            [_champ(modele, nom.lstrip('-')).value_to_string(dernier) for nom in ordre],
+            salt=CURSEUR_SALT,
+        )
+    return PageCurseur(items, suivant)
+
+
+def reponse_paginee(request, template, fragment, page, context):
+    """
+    Première page : rendu complet de `template`. Avec ?format=json (bouton
+    "Charger plus") : {"html": <fragment rendu>, "suivant": <curseur ou null>}.
+    """
+    context = {**context, 'page': page}
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'html': render_to_string(fragment, context, request=request),
+            'suivant': page.suivant,
+        })
+    return render(request, template, context)
@@ -0,0 +1,248 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, DecimalField, ExpressionWrapper, Value
+
+from .models import Panier, PanierItem, Produit
+
+PANIER_COUNT_TIMEOUT = 60 * 60
+CENTIME = Decimal('0.01')
+
+# Panier des visiteurs anonymes : cookie signé "id:quantite,id:quantite"
+COOKIE_PANIER = 'panier'
+COOKIE_SALT = 'core.panier'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+COOKIE_MAX_LIGNES = 50
+
+# Vrai pendant les écritures de lignes dont le résumé est tenu à jour par
+# appliquer_delta / recalculer / vider : le signal de PanierItem les ignore
+_resume_tenu = ContextVar('resume_panier_tenu', default=False)
+
+
+class LignePanier(NamedTuple):
+    id: int
+    produit: Produit
+    quantite: int
+    prix_ttc: Decimal
+    total_ligne: Decimal
+
+
+class ContenuPanier(NamedTuple):
+    """Panier chargé et valorisé, partagé par le panier et les étapes de commande."""
+    lignes: tuple
+    total: Decimal
+    nb_articles: int
+
+    def __iter__(self):
+        return iter(self.lignes)
+
+    def __len__(self):
+        return len(self.lignes)
+
+    def __bool__(self):
+        return bool(self.lignes)
+
+
+def _montant(expression):
+    return ExpressionWrapper(expression, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+# taux * 0.01 plutôt que taux / 100 : SQLite stocke 18.00 en entier et ferait
+# une division entière
+POURCENT = Value(Decimal('0.01'), output_field=DecimalField())
+PRIX_TTC_SQL = _montant(F('prix') * (Value(1) + F('taux_tva') * POURCENT))
+
+
+def charger_panier(user):
+    """
+    Charge le panier de l'utilisateur en une seule requête : lignes, produits
+    (select_related), prix TTC et total de ligne calculés en SQL ; le total et
+    le nombre d'articles viennent du résumé dénormalisé du Panier. Aucun panier
+    n'est créé.
+    """
+    prix_ttc = _montant(F('produit__prix') * (Value(1) + F('produit__taux_tva') * POURCENT))
+    qs = (
+        PanierItem.objects.filter(panier__user_id=user.pk)
+        .select_related('produit')
+        .annotate(
+            ttc=prix_ttc,
+            ttc_ligne=_montant(prix_ttc * F('quantite')),
+            total_panier=F('panier__total_ttc'),
+            nb_panier=F('panier__nb_articles'),
+        )
+        .order_by('pk')
+    )
+    lignes, total, nb = [], Decimal('0'), 0
+    for item in qs:
+        lignes.append(LignePanier(item.pk, item.produit, item.quantite, item.ttc, item.ttc_ligne))
+        total, nb = item.total_panier, item.nb_panier
+    return ContenuPanier(tuple(lignes), total, nb)
+
+
+def charger_panier_anonyme(contenu):
+    """Équivalent de charger_panier pour le panier du cookie ({produit_id: quantite})."""
+    lignes = []
+    for produit in Produit.objects.filter(pk__in=contenu).annotate(ttc=PRIX_TTC_SQL).order_by('pk'):
+        quantite = contenu[produit.pk]
+        lignes.append(LignePanier(produit.pk, produit, quantite, produit.ttc, produit.ttc * quantite))
+    return ContenuPanier(
+        tuple(lignes),
+        sum((ligne.total_ligne for ligne in lignes), Decimal('0')),
+        sum(ligne.quantite for ligne in lignes),
+    )
+
+
+@contextmanager
+def resume_tenu():
+    """Écritures de PanierItem dont l'appelant met lui-même le résumé à jour."""
+    jeton = _resume_tenu.set(True)
+    try:
+        yield
+    finally:
+        _resume_tenu.reset(jeton)
+
+
+def resume_est_tenu():
+    return _resume_tenu.get()
+
+
+def _count_key(user_id):
+    return f"core:panier_count:{user_id}"
+
+
+def montant_ligne(produit, quantite):
+    """Total TTC d'une ligne, arrondi comme dans le résumé du panier."""
+    return (produit.prix_ttc * quantite).quantize(CENTIME)
+
+
+def get_panier_count(user):
+    """
+    Nombre d'articles du panier de l'utilisateur.
+    Lecture seule : aucun panier n'est créé ici. La valeur vient du cache, sinon
+    du compteur dénormalisé Panier.nb_articles (pas d'agrégat sur PanierItem).
+    """
+    key = _count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = sum(Panier.objects.filter(user_id=user.pk).values_list('nb_articles', flat=True))
+        cache.set(key, count, PANIER_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_panier_count(user_id):
+    cache.delete(_count_key(user_id))
+
+
+def resume_reel(panier):
+    """Recalcule (nb_articles, total_ttc) à partir des lignes du panier."""
+    nb, total = 0, Decimal('0')
+    lignes = PanierItem.objects.filter(panier=panier).values_list('quantite', 'produit__prix', 'produit__taux_tva')
+    for quantite, prix, taux_tva in lignes:
+        nb += quantite
+        total += (prix * (1 + taux_tva / 100) * quantite).quantize(CENTIME)
+    return nb, total
+
+
+def recalculer(panier):
+    """Réaligne le résumé dénormalisé sur le contenu réel du panier."""
+    panier.nb_articles, panier.total_ttc = resume_reel(panier)
+    panier.save(update_fields=['nb_articles', 'total_ttc'])
+    invalidate_panier_count(panier.user_id)
+    return panier.nb_articles
+
+
+def appliquer_delta(panier, delta_articles, delta_total):
+    """
+    Met à jour le résumé du panier de façon incrémentale (UPDATE ... SET x = x + delta)
+    et retourne le nouveau nombre d'articles. Si PANIER_VERIFY_SUMMARY est actif,
+    le résumé est comparé à l'agrégat réel et corrigé en cas d'écart.
+    """
+    if delta_articles or delta_total:
+        Panier.objects.filter(pk=panier.pk).update(
+            nb_articles=F('nb_articles') + delta_articles,
+            total_ttc=F('total_ttc') + delta_total,
+        )
+    panier.refresh_from_db(fields=['nb_articles', 'total_ttc'])
+
+    if getattr(settings, 'PANIER_VERIFY_SUMMARY', False):
+        reel = resume_reel(panier)
+        if reel != (panier.nb_articles, panier.total_ttc):
+            print(f"WARNING: résumé du panier {panier.pk} incohérent "
+                  f"({panier.nb_articles}, {panier.total_ttc}) != {reel}, recalcul")
+            recalculer(panier)
+
+    cache.set(_count_key(panier.user_id), panier.nb_articles, PANIER_COUNT_TIMEOUT)
+    return panier.nb_articles
+
+
+def vider(panier):
+    """Supprime toutes les lignes du panier et remet son résumé à zéro."""
+    with resume_tenu():
+        PanierItem.objects.filter(panier=panier).delete()
+    panier.nb_articles, panier.total_ttc = 0, Decimal('0')
+    panier.save(update_fields=['nb_articles', 'total_ttc'])
+    invalidate_panier_count(panier.user_id)
+
+
+def lire_panier_anonyme(request):
+    """Retourne le panier anonyme du cookie sous forme {produit_id: quantite}."""
+    if hasattr(request, '_panier_anonyme'):
+        return request._panier_anonyme
+    contenu = {}
+    brut = request.get_signed_cookie(COOKIE_PANIER, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+    for ligne in brut.split(','):
+        produit_id, _, quantite = ligne.partition(':')
+        if produit_id.isdigit() and quantite.isdigit() and int(quantite) > 0:
+            contenu[int(produit_id)] = int(quantite)
+    request._panier_anonyme = contenu
+    return contenu
+
+
+def ecrire_panier_anonyme(request, response, contenu):
+    """Enregistre le panier anonyme dans le cookie signé de la réponse."""
+    request._panier_anonyme = contenu
+    if not contenu:
+        response.delete_cookie(COOKIE_PANIER)
+        return
+    valeur = ','.join(f"{produit_id}:{quantite}" for produit_id, quantite in list(contenu.items())[:COOKIE_MAX_LIGNES])
+    response.set_signed_cookie(
+        COOKIE_PANIER, valeur, salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+        httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+
+def fusionner_panier_anonyme(request, user):
+    """
+    Fusionne le panier du cookie dans le Panier en base de l'utilisateur :
+    une lecture des lignes existantes puis un bulk_update et un bulk_create.
+    Les quantités sont additionnées et plafonnées au stock disponible.
+    """
+    contenu = lire_panier_anonyme(request)
+    if not contenu:
+        return False
+
+    stocks = dict(Produit.objects.filter(pk__in=contenu, quantite__gt=0).values_list('pk', 'quantite'))
+    if not stocks:
+        return True
+
+    panier, _ = Panier.objects.get_or_create(user=user)
+    existants = {item.produit_id: item for item in PanierItem.objects.filter(panier=panier, produit_id__in=stocks)}
+    a_modifier, a_creer = [], []
+    for produit_id, stock in stocks.items():
+        quantite = contenu[produit_id]
+        item = existants.get(produit_id)
+        if item:
+            item.quantite = min(stock, item.quantite + quantite)
+            a_modifier.append(item)
+        else:
+            a_creer.append(PanierItem(panier=panier, produit_id=produit_id, quantite=min(stock, quantite)))
+    if a_modifier:
+        PanierItem.objects.bulk_update(a_modifier, ['quantite'])
+    if a_creer:
+        PanierItem.objects.bulk_create(a_creer)
+    recalculer(panier)
+    return True
@@ -0,0 +1,276 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as TemplateDjango
+
+logger = logging.getLogger('core.perf')
+
+# Mesures de la requête en cours ; None si elle n'est pas échantillonnée
+_courante = contextvars.ContextVar('core_perf', default=None)
+_ABSENT = object()
+
+# Tampon circulaire par processus (chaque worker gunicorn a le sien), recopié
+# toutes les PERF_EXPORT secondes dans PERF_DOSSIER/<hôte>_<pid>.jsonl pour
+# que /_perf/ agrège les mesures de tous les workers
+tampon = deque(maxlen=getattr(settings, 'PERF_TAMPON', 5000))
+_en_attente = []
+_export = {'pid': None, 'lignes': 0, 'instant': 0.0}
+_verrou_export = threading.Lock()
+
+CENTILES = (50, 95, 99)
+# Un fichier d'export sans écriture depuis PEREMPTION * PERF_FENETRE secondes
+# appartient à un worker arrêté : il est supprimé
+PEREMPTION = 2
+
+
+def _instrumenter_templates():
+    rendu = TemplateDjango.render
+    if getattr(rendu, 'perf', False):
+        return
+
+    def render(self, context=None, request=None):
+        mesure = _courante.get()
+        if mesure is None:
+            return rendu(self, context, request)
+        # Seuls les rendus de premier niveau comptent : un render_to_string
+        # imbriqué est déjà inclus dans le temps du rendu englobant
+        mesure['_profondeur'] += 1
+        debut = time.perf_counter()
+        try:
+            return rendu(self, context, request)
+        finally:
+            mesure['_profondeur'] -= 1
+            if not mesure['_profondeur']:
+                mesure['template_ms'] += (time.perf_counter() - debut) * 1000
+
+    render.perf = True
+    TemplateDjango.render = render
+
+
+def _instrumenter_cache():
+    classe = type(caches['default'])
+    lecture = classe.get
+    if getattr(lecture, 'perf', False):
+        return
+
+    def get(self, key, default=None, version=None):
+        mesure = _courante.get()
+        if mesure is None:
+            return lecture(self, key, default, version)
+        valeur = lecture(self, key, _ABSENT, version)
+        if valeur is _ABSENT:
+            mesure['cache_miss'] += 1
+            return default
+        mesure['cache_hit'] += 1
+        return valeur
+
+    get.perf = True
+    classe.get = get
+
+
+def _chronometrer_sql(mesure):
+    def wrapper(execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            mesure['requetes'] += 1
+            mesure['sql_ms'] += (time.perf_counter() - debut) * 1000
+    return wrapper
+
+
+class PerfMiddleware:
+    """
+    Mesure par requête : vue résolue, durée totale, nombre et durée des
+    requêtes SQL, temps de rendu des templates, lectures du cache (hits et
+    misses) et taille de la réponse. Les mesures vont dans un tampon
+    circulaire exporté pour la page /_perf/ et dans le logger "core.perf" en JSON.
+
+    Seule une fraction PERF_ECHANTILLON des requêtes est mesurée (0 = middleware
+    désactivé, 1 = toutes) : une requête non échantillonnée ne coûte qu'un tirage.
+    Render des templates et get du cache ne sont instrumentés que si le taux est positif.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.taux = getattr(settings, 'PERF_ECHANTILLON', 0)
+        if self.taux <= 0:
+            raise MiddlewareNotUsed
+        _instrumenter_templates()
+        _instrumenter_cache()
+
+    def __call__(self, request):
+        if self.taux < 1 and random.random() >= self.taux:
+            return self.get_response(request)
+
+        mesure = {
+            'requetes': 0, 'sql_ms': 0.0, 'template_ms': 0.0,
+            'cache_hit': 0, 'cache_miss': 0, '_profondeur': 0,
+        }
+        jeton = _courante.set(mesure)
+        debut = time.perf_counter()
+        try:
+            with ExitStack() as pile:
+                wrapper = _chronometrer_sql(mesure)
+                for alias in connections:
+                    pile.enter_context(connections[alias].execute_wrapper(wrapper))
+                response = self.get_response(request)
+        finally:
+            duree = (time.perf_counter() - debut) * 1000
+            _courante.reset(jeton)
+
+        match = request.resolver_match
+        del mesure['_profondeur']
+        mesure.update({
+            'horodatage': time.time(),
+            'vue': match.view_name if match else '<non résolue>',
+            'methode': request.method,
+            'statut': response.status_code,
+            'duree_ms': duree,
+            'taille': 0 if response.streaming else len(response.content),
+            'pid': os.getpid(),
+        })
+        tampon.append(mesure)
+        _en_attente.append(mesure)
+        _exporter_si_du()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(mesure))
+        return response
+
+
+def dossier_perf():
+    return Path(getattr(settings, 'PERF_DOSSIER', settings.BASE_DIR / 'logs' / 'perf'))
+
+
+def _fichier_processus():
+    return dossier_perf() / f"{socket.gethostname()}_{os.getpid()}.jsonl"
+
+
+def exporter():
+    """
+    Ajoute les nouvelles mesures au fichier du processus. Quand il dépasse
+    la taille du tampon, le fichier est réécrit (remplacement atomique) avec
+    le contenu du tampon : il reste borné comme lui.
+    """
+    with _verrou_export:
+        if _export['pid'] != os.getpid():
+            # Nouveau processus (fork) : son fichier part de zéro
+            _export.update(pid=os.getpid(), lignes=0)
+        nouvelles = list(_en_attente)
+        _en_attente.clear()
+        chemin = _fichier_processus()
+        try:
+            chemin.parent.mkdir(parents=True, exist_ok=True)
+            if _export['lignes'] + len(nouvelles) > tampon.maxlen:
+                nouvelles = list(tampon)
+                temporaire = chemin.with_suffix('.tmp')
+                with open(temporaire, 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(m) + '\n' for m in nouvelles)
+                os.replace(temporaire, chemin)
+                _export['lignes'] = len(nouvelles)
+            elif nouvelles:
+                with open(chemin, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(m) + '\n' for m in nouvelles)
+                _export['lignes'] += len(nouvelles)
+        except OSError as e:
+            print(f"ERROR: mesures de performance non exportées : {e}")
+
+
+def _exporter_si_du():
+    maintenant = time.monotonic()
+    if maintenant - _export['instant'] >= getattr(settings, 'PERF_EXPORT', 10):
+        _export['instant'] = maintenant
+        exporter()
+
+
+def mesures_tous_workers(fenetre):
+    """
+    (mesures, pids) de tous les workers : le tampon du processus courant et
+    les fichiers des autres. Les fichiers sans écriture depuis `fenetre`
+    secondes ne sont pas lus ; ceux sans écriture depuis PEREMPTION *
+    PERF_FENETRE secondes (workers arrêtés) sont supprimés, quelle que soit
+    la fenêtre demandée.
+    """
+    mesures, pids = list(tampon), {os.getpid()}
+    dossier = dossier_perf()
+    if not dossier.is_dir():
+        return mesures, pids
+    maintenant = time.time()
+    limite = maintenant - fenetre
+    peremption = maintenant - PEREMPTION * settings.PERF_FENETRE
+    propre = _fichier_processus()
+    for chemin in dossier.glob('*.jsonl'):
+        if chemin == propre:
+            continue
+        try:
+            modification = chemin.stat().st_mtime
+            if modification < peremption:
+                chemin.unlink()
+                continue
+            if modification < limite:
+                continue
+            lignes = chemin.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"ERROR: lecture de {chemin} impossible : {e}")
+            continue
+        for ligne in lignes:
+            try:
+                mesure = json.loads(ligne)
+            except ValueError:
+                continue  # ligne en cours d'écriture
+            mesures.append(mesure)
+            pids.add(mesure['pid'])
+    return mesures, pids
+
+
+def centile(valeurs_triees, p):
+    """Centile par rang le plus proche sur une liste déjà triée."""
+    if not valeurs_triees:
+        return 0
+    rang = max(0, min(len(valeurs_triees) - 1, -(-p * len(valeurs_triees) // 100) - 1))
+    return valeurs_triees[rang]
+
+
+def statistiques(fenetre=None, mesures=None):
+    """
+    Agrège par vue les mesures des `fenetre` dernières secondes
+    (PERF_FENETRE par défaut) : centiles de durée et moyennes du reste.
+    """
+    fenetre = fenetre if fenetre is not None else getattr(settings, 'PERF_FENETRE', 15 * 60)
+    limite = time.time() - fenetre
+    par_vue = {}
+    for mesure in (mesures if mesures is not None else list(tampon)):
+        if mesure['horodatage'] >= limite:
+            par_vue.setdefault(mesure['vue'], []).append(mesure)
+
+    lignes = []
+    for vue, liste in par_vue.items():
+        n = len(liste)
+        durees = sorted(m['duree_ms'] for m in liste)
+        lignes.append({
+            'vue': vue,
+            'nb': n,
+            **{f'p{p}': centile(durees, p) for p in CENTILES},
+            'requetes': sum(m['requetes'] for m in liste) / n,
+            'sql_ms': sum(m['sql_ms'] for m in liste) / n,
+            'template_ms': sum(m['template_ms'] for m in liste) / n,
+            'cache_hit': sum(m['cache_hit'] for m in liste),
+            'cache_miss': sum(m['cache_miss'] for m in liste),
+            'taille': sum(m['taille'] for m in liste) / n,
+        })
+    return sorted(lignes, key=lambda l: l['p95'], reverse=True)
@@ -0,0 +1,197 @@
+import cProfile
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from html import escape
+from pathlib import Path
+
+from django.conf import settings
+
+MODES = ('echantillonneur', 'cprofile')
+EN_TETE = 'HTTP_X_PROFILAGE'
+_numeros = itertools.count(1)
+
+
+def dossier_profils():
+    return Path(getattr(settings, 'PROFILAGE_DOSSIER', settings.BASE_DIR / 'logs' / 'profils'))
+
+
+def nom_fichier_vue(vue):
+    # "core:faq" ou "admin:index" -> nom de dossier sûr
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in vue)
+
+
+def _libelle(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{code.co_qualname}"
+
+
+class Echantillonneur:
+    """
+    Échantillonneur de pile : un thread relève toutes les `intervalle`
+    secondes la pile du thread profilé et compte les piles identiques
+    (format "collapsed" : "a;b;c nombre", lu par flamegraph.pl ou speedscope).
+    Seules les frames sous celle qui démarre l'échantillonnage sont gardées.
+    """
+
+    def __init__(self, intervalle):
+        self.intervalle = intervalle
+        self.piles = Counter()
+        self.cible = threading.get_ident()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, daemon=True)
+
+    def _boucle(self):
+        while not self._arret.wait(self.intervalle):
+            frame = sys._current_frames().get(self.cible)
+            pile = []
+            while frame is not None and frame is not self._base:
+                pile.append(frame)
+                frame = frame.f_back
+            # Pile vide ou thread profilé déjà sorti de la vue (attente de l'arrêt)
+            if pile and pile[-1].f_code is not Echantillonneur.__exit__.__code__:
+                self.piles[';'.join(_libelle(f) for f in reversed(pile))] += 1
+
+    def __enter__(self):
+        self._base = sys._getframe(1)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._arret.set()
+        self._thread.join()
+
+    def ecrire(self, chemin):
+        with open(chemin, 'w', encoding='utf-8') as f:
+            for pile, nombre in self.piles.most_common():
+                f.write(f"{pile} {nombre}\n")
+
+
+class ProfilageMiddleware:
+    """
+    Profilage à la demande de la vue et du rendu de ses templates :
+    - en-tête "X-Profilage: 1" (ou le nom d'un mode) envoyé par un membre du staff ;
+    - vues listées dans PROFILAGE_VUES, toujours profilées ;
+    - fraction PROFILAGE_ECHANTILLON des autres requêtes.
+    Le profil est écrit dans PROFILAGE_DOSSIER/<vue>/ : pile échantillonnée
+    (.folded) ou pstats de cProfile (.prof), selon PROFILAGE_MODE. Voir la
+    commande "profils" pour les fusionner en flamegraph ou en rapport.
+
+    Doit être le dernier middleware : la vue est appelée depuis process_view,
+    après les vérifications (CSRF, authentification) des précédents.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def mode(self, request, vue):
+        demande = request.META.get(EN_TETE)
+        if demande and request.user.is_staff:
+            return demande if demande in MODES else settings.PROFILAGE_MODE
+        if vue in settings.PROFILAGE_VUES:
+            return settings.PROFILAGE_MODE
+        taux = settings.PROFILAGE_ECHANTILLON
+        if taux > 0 and random.random() < taux:
+            return settings.PROFILAGE_MODE
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        vue = request.resolver_match.view_name
+        mode = self.mode(request, vue)
+        if mode is None:
+            return None
+
+        dossier = dossier_profils() / nom_fichier_vue(vue)
+        dossier.mkdir(parents=True, exist_ok=True)
+        base = dossier / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_numeros)}"
+        if mode == 'cprofile':
+            profil = cProfile.Profile()
+            try:
+                return profil.runcall(view_func, request, *view_args, **view_kwargs)
+            finally:
+                profil.dump_stats(f"{base}.prof")
+        echantillonneur = Echantillonneur(settings.PROFILAGE_INTERVALLE)
+        try:
+            with echantillonneur:
+                return view_func(request, *view_args, **view_kwargs)
+        finally:
+            echantillonneur.ecrire(f"{base}.folded")
+
+
+def lire_folded(chemin, piles=None):
+    piles = Counter() if piles is None else piles
+    with open(chemin, encoding='utf-8') as f:
+        for ligne in f:
+            pile, _, nombre = ligne.rstrip('\n').rpartition(' ')
+            if pile and nombre.isdigit():
+                piles[pile] += int(nombre)
+    return piles
+
+
+def fonctions_chaudes(piles, n=25):
+    """[(fonction, échantillons propres, échantillons inclusifs)] les plus coûteuses en propre."""
+    propre, inclusif = Counter(), Counter()
+    for pile, nombre in piles.items():
+        frames = pile.split(';')
+        propre[frames[-1]] += nombre
+        for fonction in set(frames):
+            inclusif[fonction] += nombre
+    return [(fonction, nombre, inclusif[fonction]) for fonction, nombre in propre.most_common(n)]
+
+
+def flamegraph_svg(piles, titre, largeur=1200, hauteur_ligne=16):
+    """Flamegraph SVG autonome (survol : fonction, échantillons, pourcentage)."""
+    arbre = {}
+    for pile, nombre in piles.items():
+        noeud = arbre
+        for frame in pile.split(';'):
+            entree = noeud.setdefault(frame, [0, {}])
+            entree[0] += nombre
+            noeud = entree[1]
+    total = sum(piles.values()) or 1
+    rectangles = []
+    profondeur_max = 0
+
+    def parcourir(noeud, x, profondeur):
+        nonlocal profondeur_max
+        for nom, (nombre, enfants) in sorted(noeud.items()):
+            largeur_noeud = nombre / total * largeur
+            if largeur_noeud >= 0.5:
+                profondeur_max = max(profondeur_max, profondeur)
+                rectangles.append((x, profondeur, largeur_noeud, nom, nombre))
+                parcourir(enfants, x, profondeur + 1)
+            x += largeur_noeud
+
+    parcourir(arbre, 0, 0)
+    hauteur = (profondeur_max + 1) * hauteur_ligne + 40
+    lignes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{largeur}" height="{hauteur}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="16" font-size="14">{escape(titre)} ({total} échantillons)</text>',
+    ]
+    for x, profondeur, l, nom, nombre in rectangles:
+        y = hauteur - (profondeur + 1) * hauteur_ligne - 4
+        teinte = 10 + zlib.crc32(nom.encode()) % 40
+        # ~7 px par caractère : libellé tronqué, ou absent si le rectangle est trop étroit
+        if len(nom) * 7 < l:
+            texte = nom
+        elif l > 30:
+            texte = nom[:int(l / 7) - 2] + '..'
+        else:
+            texte = ''
+        lignes.append(
+            f'<g><title>{escape(nom)} : {nombre} ({nombre / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{l:.1f}" height="{hauteur_ligne - 1}" '
+            f'fill="hsl({teinte},85%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + hauteur_ligne - 4}">{escape(texte)}</text></g>'
+        )
+    lignes.append('</svg>')
+    return '\n'.join(lignes) + '\n'
@@ -0,0 +1,140 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django_cleanup.signals import cleanup_post_delete
+
+from .caching import bump_version
+from .emails import invalider_logo
+from .images import MODELES_IMAGES, generer_renditions, supprimer_renditions
+from .storage import est_rendition
+from .models import (
+    Actualite, ActualiteImage, Categorie, Commune, Faq, FaqImage, FaqSection, FaqStep, FaqStepImage,
+    Forfait, Horodatage, Logo, Panier, PanierItem, Produit, QuickBlock, SousCategorie, ZoneCouverture,
+)
+from .panier import recalculer, resume_est_tenu
+
+
+def modifier_espace(espace):
+    # Nouvelle version des caches de l'espace, et nouvelle date pour les
+    # GET conditionnels (Last-Modified / ETag, core/fraicheur.py)
+    bump_version(espace)
+    Horodatage.marquer(espace)
+
+
+@receiver([post_save, post_delete], sender=Logo)
+def invalider_cache_logo(sender, **kwargs):
+    modifier_espace('logo')
+    invalider_logo()
+
+
+@receiver([post_save, post_delete], sender=Categorie)
+@receiver([post_save, post_delete], sender=SousCategorie)
+def invalider_cache_menu(sender, **kwargs):
+    modifier_espace('menu')
+
+
+# Fragments de templates (core/templatetags/fragments.py) et pages anonymes
+# en cache (core/pages.py) : un espace par source de données, incrémenté à
+# chaque modification
+@receiver([post_save, post_delete], sender=QuickBlock)
+def invalider_fragments_quickblock(sender, **kwargs):
+    modifier_espace('quickblock')
+
+
+@receiver([post_save, post_delete], sender=Forfait)
+def invalider_fragments_forfait(sender, **kwargs):
+    modifier_espace('forfait')
+
+
+@receiver([post_save, post_delete], sender=Produit)
+def invalider_fragments_produit(sender, **kwargs):
+    modifier_espace('produit')
+
+
+@receiver([post_save, post_delete], sender=Actualite)
+@receiver([post_save, post_delete], sender=ActualiteImage)
+def invalider_fragments_actualite(sender, **kwargs):
+    modifier_espace('actualite')
+
+
+@receiver([post_save, post_delete], sender=ZoneCouverture)
+@receiver([post_save, post_delete], sender=Commune)
+def invalider_pages_zone(sender, **kwargs):
+    modifier_espace('zone')
+
+
+@receiver([post_save, post_delete], sender=FaqSection)
+@receiver([post_save, post_delete], sender=Faq)
+@receiver([post_save, post_delete], sender=FaqImage)
+@receiver([post_save, post_delete], sender=FaqStep)
+@receiver([post_save, post_delete], sender=FaqStepImage)
+def invalider_pages_faq(sender, **kwargs):
+    modifier_espace('faq')
+
+
+CHAMPS_PRIX = ('prix', 'taux_tva')
+
+
+@receiver(pre_save, sender=Produit)
+def noter_changement_prix(sender, instance, update_fields=None, **kwargs):
+    # Seul un changement de prix ou de TVA fausse le total TTC des paniers :
+    # une modification du stock, du nom ou de l'image ne les recalcule pas
+    instance._prix_modifie = False
+    if instance.pk is None or (update_fields is not None and not set(CHAMPS_PRIX) & set(update_fields)):
+        return
+    ancien = Produit.objects.filter(pk=instance.pk).values_list(*CHAMPS_PRIX).first()
+    if ancien is not None:
+        nouveau = tuple(Decimal(str(getattr(instance, champ))) for champ in CHAMPS_PRIX)
+        instance._prix_modifie = ancien != nouveau
+
+
+@receiver(post_save, sender=Produit)
+def recalculer_paniers_produit(sender, instance, created, **kwargs):
+    if created or not getattr(instance, '_prix_modifie', False):
+        return
+    instance._prix_modifie = False
+    for panier in Panier.objects.filter(items__produit=instance).distinct():
+        recalculer(panier)
+
+
+@receiver(pre_delete, sender=Produit)
+def noter_paniers_produit(sender, instance, **kwargs):
+    # Les lignes partent en cascade avec le produit : les paniers sont notés avant
+    instance._paniers = list(Panier.objects.filter(items__produit=instance).distinct())
+
+
+@receiver(post_delete, sender=Produit)
+def recalculer_paniers_produit_supprime(sender, instance, **kwargs):
+    for panier in getattr(instance, '_paniers', []):
+        recalculer(panier)
+
+
+@receiver([post_save, post_delete], sender=PanierItem)
+def recalculer_panier_item(sender, instance, origin=None, **kwargs):
+    # Écritures hors des vues du panier (admin, shell, ORM) : le résumé est
+    # recalculé. Les vues tiennent elles-mêmes le résumé (resume_tenu) et la
+    # suppression d'un produit ou d'un panier est traitée une seule fois plus haut.
+    if resume_est_tenu() or isinstance(origin, (Produit, Panier)):
+        return
+    panier = Panier.objects.filter(pk=instance.panier_id).first()
+    if panier is not None:
+        recalculer(panier)
+
+
+def generer_renditions_image(sender, instance, **kwargs):
+    # Image déjà traitée (manifeste et variantes présents) : ni Pillow ni réencodage
+    if instance.image:
+        generer_renditions(instance.image)
+
+
+for modele in MODELES_IMAGES:
+    post_save.connect(generer_renditions_image, sender=modele, dispatch_uid=f'renditions_{modele.__name__}')
+
+
+@receiver(cleanup_post_delete)
+def supprimer_renditions_image(sender, file, file_name, **kwargs):
+    # django_cleanup a supprimé l'ancien fichier (remplacement ou suppression de l'objet).
+    # Un fichier encore partagé par un autre objet est conservé par le stockage.
+    if file_name and not est_rendition(file_name) and not file.storage.exists(file_name):
+        supprimer_renditions(file_name, file.storage)
@@ -0,0 +1,57 @@
+// Listes région -> commune : les communes de la région choisie sont lues dans
+// l'API de couverture (un seul téléchargement, gardé par le navigateur tant
+// que la couverture ne change pas), au lieu d'être toutes écrites dans la page.
+//
+//   <select id="region">...</select>
+//   <select id="commune" data-couverture="{{ url_couverture }}" data-region="region"
+//           data-selection="{{ id commune présélectionnée }}">
+(function () {
+  const chargements = {};
+
+  function charger(url) {
+    if (!chargements[url]) {
+      chargements[url] = fetch(url, {credentials: 'same-origin'})
+        .then(r => r.json())
+        .then(data => {
+          const parRegion = {};
+          data.regions.forEach(r => { parRegion[String(r.id)] = r.communes; });
+          return parRegion;
+        })
+        .catch(() => { delete chargements[url]; return {}; });
+    }
+    return chargements[url];
+  }
+
+  function majCommunes(communeSel) {
+    const regionSel = document.getElementById(communeSel.dataset.region);
+    if (!regionSel) return Promise.resolve();
+    const regionId = String(regionSel.value || '');
+    const placeholder = communeSel.querySelector('option[value=""]');
+    const courante = communeSel.value || communeSel.dataset.selection || '';
+    return charger(communeSel.dataset.couverture).then(parRegion => {
+      // La région a pu changer pendant le chargement
+      if (String(regionSel.value || '') !== regionId) return;
+      const communes = parRegion[regionId] || [];
+      communeSel.replaceChildren(...(placeholder ? [placeholder] : []));
+      communes.forEach(([id, nom]) => communeSel.add(new Option(nom, id)));
+      communeSel.disabled = communes.length === 0;
+      communeSel.value = communes.some(([id]) => String(id) === courante) ? courante : '';
+      delete communeSel.dataset.selection;
+    });
+  }
+
+  window.majCommunes = majCommunes;
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-couverture]').forEach(communeSel => {
+      const regionSel = document.getElementById(communeSel.dataset.region);
+      if (!regionSel) return;
+      regionSel.addEventListener('change', () => majCommunes(communeSel));
+      if (regionSel.value) {
+        majCommunes(communeSel);
+      } else {
+        communeSel.disabled = true;
+      }
+    });
+  });
+})();
@@ -0,0 +1,69 @@
+import hashlib
+import posixpath
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+# Dossier des variantes redimensionnées (voir core/images.py) : noms fixes, pas de déduplication
+DOSSIER_RENDITIONS = 'renditions'
+
+
+def empreinte(fichier, taille_bloc=64 * 1024):
+    """SHA-256 du contenu d'un fichier ouvert, sans changer sa position."""
+    position = fichier.tell() if hasattr(fichier, 'tell') else 0
+    fichier.seek(0)
+    h = hashlib.sha256()
+    for bloc in iter(lambda: fichier.read(taille_bloc), b''):
+        h.update(bloc)
+    fichier.seek(position)
+    return h.hexdigest()
+
+
+def est_rendition(name):
+    return DOSSIER_RENDITIONS in posixpath.dirname(name).split('/')
+
+
+def champs_fichiers():
+    """(modèle, nom du champ) pour chaque FileField/ImageField du projet."""
+    return [
+        (modele, champ.name)
+        for modele in apps.get_models()
+        for champ in modele._meta.concrete_fields
+        if isinstance(champ, models.FileField)
+    ]
+
+
+def est_reference(name):
+    """Vrai si au moins un objet en base pointe encore vers ce fichier."""
+    return any(
+        modele._default_manager.filter(**{champ: name}).exists()
+        for modele, champ in champs_fichiers()
+    )
+
+
+class StockageDedupe(FileSystemStorage):
+    """
+    Stockage adressé par contenu : un upload est enregistré sous
+    <upload_to>/<sha256>.<ext>. Si un fichier identique existe déjà, il est
+    réutilisé au lieu d'écrire une copie avec un suffixe aléatoire.
+    Un fichier partagé par plusieurs objets n'est supprimé (django_cleanup)
+    que lorsque plus aucun objet ne le référence.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if est_rendition(name):
+            return super().save(name, content, max_length)
+        dossier, fichier = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(fichier)[1].lower()
+        nom = posixpath.join(dossier, empreinte(content)[:32] + extension)
+        if self.exists(nom):
+            return nom
+        return super().save(nom, content, max_length)
+
+    def delete(self, name):
+        if name and not est_rendition(name) and est_reference(name):
+            return
+        super().delete(name)
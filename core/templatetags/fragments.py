@@ -0,0 +1,51 @@
+from django import template
+from django.core.cache import cache
+
+from ..caching import DEFAULT_TIMEOUT, fragment_key
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, nom, espaces, selon):
+        self.nodelist = nodelist
+        self.nom = nom
+        self.espaces = espaces
+        self.selon = selon
+
+    def render(self, context):
+        key = fragment_key(
+            self.nom,
+            self.espaces,
+            [valeur.resolve(context) for valeur in self.selon],
+        )
+        html = cache.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, DEFAULT_TIMEOUT)
+        return html
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """
+    Met en cache le rendu d'un fragment partagé par tous les visiteurs,
+    invalidé par les signaux des modèles (espaces versionnés de core/caching.py) :
+        {% fragment_cache "nav_sous_menus" menu %} ... {% endfragment_cache %}
+        {% fragment_cache "accueil_bons_plans" forfait produit selon x y %} ... {% endfragment_cache %}
+    Les valeurs après "selon" (variables de template) font aussi varier la clé.
+    Ne rien y mettre qui dépende de l'utilisateur (panier, avatar, jeton CSRF).
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"{bits[0]} attend un nom et au moins un espace de cache")
+    nom = bits[1].strip('"\'')
+    reste = bits[2:]
+    selon = []
+    if 'selon' in reste:
+        index = reste.index('selon')
+        selon = [parser.compile_filter(b) for b in reste[index + 1:]]
+        reste = reste[:index]
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, nom, reste, selon)
@@ -0,0 +1,40 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import FORMATS, chemin_rendition, largeurs_disponibles
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_responsive(fichier, alt='', sizes='100vw', lazy=True, **attrs):
+    """
+    <picture> avec srcset WebP et repli JPEG aux largeurs générées, et l'original
+    en src. Exemple :
+        {% image_responsive produit.image alt=produit.nom sizes="(max-width: 767px) 100vw, 25vw" class="img-fluid" %}
+    Passer lazy=False pour les images visibles au chargement de la page.
+    Les variantes sont générées à l'enregistrement (post_save) ou par la
+    commande generer_renditions, jamais pendant le rendu.
+    """
+    if not fichier:
+        return ''
+    attrs_img = format_html_join('', ' {}="{}"', ((nom, valeur) for nom, valeur in attrs.items() if valeur))
+    chargement = format_html(' loading="lazy" decoding="async"') if lazy else ''
+    largeurs = largeurs_disponibles(fichier)
+    if not largeurs:
+        return format_html('<img src="{}" alt="{}"{}{}>', fichier.url, alt, attrs_img, chargement)
+
+    storage = fichier.storage
+
+    def srcset(extension):
+        return ', '.join(f"{storage.url(chemin_rendition(fichier.name, largeur, extension))} {largeur}w" for largeur in largeurs)
+
+    (ext_webp, _, type_webp), (ext_jpeg, _, _) = FORMATS
+    return format_html(
+        '<picture style="display:contents">'
+        '<source type="{}" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}{}>'
+        '</picture>',
+        type_webp, srcset(ext_webp), sizes,
+        fichier.url, srcset(ext_jpeg), sizes, alt, attrs_img, chargement,
+    )
@@ -1,3 +1,1475 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import unittest
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import metriques
+from .bench import SCENARIOS, Mesure, ModeTest, charger_references, comparer, donnees_bench, mesurer
+from . import couverture, emails, jetons_google
+from .caching import bump_version, get_or_build, get_version, get_versions
+from .catalogue import categories_avec_apercu
+from .comptes import creer_utilisateur
+from .context_processors import logo_actif, logo_context, menu_categories, panier_count
+from .emails import MAX_TENTATIVES, envoyer_lot, mettre_en_file
+from .images import chemin_rendition
+from .models import (
+    Categorie, SousCategorie, Produit, Panier, PanierItem, Order, OrderItem, EmailSortant,
+    Actualite, ActualiteImage, WifiTicket, DemandeSouscription, Faq, FaqSection, Forfait, Horodatage,
+    ZoneCouverture, Commune, Logo, SequenceCommande,
+)
+from .management.commands.seed_scale import Command as SeedScale
+from .pages import page_anonyme_en_cache
+from .panier import (
+    COOKIE_MAX_AGE, COOKIE_PANIER, COOKIE_SALT, charger_panier, lire_panier_anonyme, recalculer, resume_reel,
+)
+from .perf import CENTILES, PEREMPTION, PerfMiddleware, centile, tampon
+from .profilage import fonctions_chaudes
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Toute la suite tourne sur un cache mémoire : les cache.clear() des tests ne
+# doivent jamais vider le cache fichier partagé (./cache) d'une instance en service
+_cache_de_test = override_settings(CACHES=LOCMEM_CACHE)
+
+
+def setUpModule():
+    _cache_de_test.enable()
+
+
+def tearDownModule():
+    _cache_de_test.disable()
+
+
+def png(largeur, hauteur, couleur=(200, 0, 0, 128)):
+    sortie = io.BytesIO()
+    Image.new('RGBA', (largeur, hauteur), couleur).save(sortie, 'PNG')
+    return ContentFile(sortie.getvalue())
+
+
+class PanierQueryCountTests(TestCase):
+    """Le coût du panier et des étapes de commande ne dépend pas du nombre de lignes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com')
+        sous_categorie = SousCategorie.objects.create(
+            nom='Routeurs', categorie=Categorie.objects.create(nom='Equipement')
+        )
+        cls.produits = Produit.objects.bulk_create([
+            Produit(nom=f'Produit {i}', prix=Decimal('1000') * (i + 1), taux_tva=Decimal('18'), quantite=50, sous_categorie=sous_categorie)
+            for i in range(12)
+        ])
+        cls.panier = Panier.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def remplir(self, nb_lignes):
+        PanierItem.objects.bulk_create([
+            PanierItem(panier=self.panier, produit=produit, quantite=2)
+            for produit in self.produits[:nb_lignes]
+        ])
+        # bulk_create ne passe pas par le résumé du panier
+        recalculer(self.panier)
+
+    def test_charger_panier_une_requete(self):
+        self.remplir(12)
+        with self.assertNumQueries(1):
+            contenu = charger_panier(self.user)
+        self.assertEqual(len(contenu), 12)
+        self.assertEqual(contenu.nb_articles, 24)
+        attendu = sum(p.prix_ttc * 2 for p in self.produits)
+        self.assertEqual(contenu.total.quantize(Decimal('0.01')), attendu.quantize(Decimal('0.01')))
+
+    def test_charger_panier_vide(self):
+        with self.assertNumQueries(1):
+            contenu = charger_panier(self.user)
+        self.assertFalse(contenu)
+        self.assertEqual(contenu.total, 0)
+
+    def assertVueCoutConstant(self, url, session=None):
+        if session:
+            s = self.client.session
+            s.update(session)
+            s.save()
+        self.remplir(1)
+        cache.clear()
+        with CaptureQueriesContext(connection) as une_ligne:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        PanierItem.objects.all().delete()
+        self.remplir(12)
+        cache.clear()
+        with self.assertNumQueries(len(une_ligne)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_voir_panier(self):
+        self.assertVueCoutConstant(reverse('panier'))
+
+    def test_commande_infos_client(self):
+        self.assertVueCoutConstant(reverse('commande_infos_client'))
+
+    def test_commande_confirmation(self):
+        infos = {'nom': 'Client', 'telephone': '620000000', 'email': '', 'adresse': 'Kaloum',
+                 'choix_retrait': 'livraison', 'region_id': None, 'commune_id': None}
+        self.assertVueCoutConstant(reverse('commande_confirmation'), {'commande_infos': infos})
+
+
+class ResumePanierTests(TestCase):
+    """Le résumé dénormalisé du panier (nb_articles, total_ttc) reste égal au contenu réel."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', 'client@example.com')
+        cls.produits = [
+            Produit.objects.create(nom=f'Produit {i}', prix=Decimal('1000') * (i + 1), taux_tva=Decimal('18'), quantite=50)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def panier(self):
+        return Panier.objects.get(user=self.user)
+
+    def assertResumeExact(self):
+        panier = self.panier()
+        self.assertEqual((panier.nb_articles, panier.total_ttc), resume_reel(panier))
+
+    def test_vues_par_delta(self):
+        a, b, _ = self.produits
+        self.client.post(reverse('ajouter_au_panier', args=[a.pk]), {'q': 2})
+        self.client.post(reverse('ajouter_au_panier', args=[b.pk]), {'q': 1})
+        self.client.post(reverse('ajouter_au_panier', args=[a.pk]), {'q': 1})
+        self.assertResumeExact()
+        self.assertEqual(self.panier().nb_articles, 4)
+        item = PanierItem.objects.get(panier__user=self.user, produit=a)
+        self.client.post(reverse('changer_quantite', args=[item.pk]), {'quantite': 5})
+        self.assertResumeExact()
+        self.client.post(reverse('retirer_du_panier', args=[item.pk]))
+        self.assertResumeExact()
+        self.assertEqual(self.panier().nb_articles, 1)
+
+    def test_vues_sans_recalcul(self):
+        self.client.post(reverse('ajouter_au_panier', args=[self.produits[0].pk]), {'q': 1})
+        with mock.patch('core.signals.recalculer') as recalcul:
+            self.client.post(reverse('ajouter_au_panier', args=[self.produits[0].pk]), {'q': 1})
+        recalcul.assert_not_called()
+
+    def test_ecriture_hors_vues(self):
+        # Admin ou shell : le résumé suit les lignes enregistrées ou supprimées
+        panier = Panier.objects.create(user=self.user)
+        item = PanierItem.objects.create(panier=panier, produit=self.produits[0], quantite=3)
+        self.assertResumeExact()
+        self.assertEqual(self.panier().nb_articles, 3)
+        item.quantite = 1
+        item.save()
+        self.assertResumeExact()
+        item.delete()
+        self.assertResumeExact()
+        self.assertEqual(self.panier().nb_articles, 0)
+
+    def test_suppression_produit(self):
+        for produit in self.produits:
+            self.client.post(reverse('ajouter_au_panier', args=[produit.pk]), {'q': 2})
+        with mock.patch('core.signals.recalculer', wraps=recalculer) as recalcul:
+            self.produits[1].delete()
+        recalcul.assert_called_once()
+        self.assertResumeExact()
+        self.assertEqual(self.panier().nb_articles, 4)
+
+    def test_changement_de_prix(self):
+        produit = self.produits[0]
+        self.client.post(reverse('ajouter_au_panier', args=[produit.pk]), {'q': 2})
+        produit.prix = Decimal('1500')
+        produit.save()
+        self.assertResumeExact()
+        self.assertEqual(self.panier().total_ttc, Decimal('3540.00'))
+
+    def test_autre_modification_sans_recalcul(self):
+        produit = self.produits[0]
+        self.client.post(reverse('ajouter_au_panier', args=[produit.pk]), {'q': 2})
+        with mock.patch('core.signals.recalculer') as recalcul:
+            produit.nom = 'Routeur'
+            produit.save()
+            produit.quantite = 40
+            produit.save(update_fields=['quantite'])
+        recalcul.assert_not_called()
+
+    @override_settings(PANIER_VERIFY_SUMMARY=True)
+    def test_verification_corrige_ecart(self):
+        a, b, _ = self.produits
+        self.client.post(reverse('ajouter_au_panier', args=[a.pk]), {'q': 1})
+        Panier.objects.filter(user=self.user).update(nb_articles=99, total_ttc=Decimal('1'))
+        with mock.patch('builtins.print') as sortie:
+            self.client.post(reverse('ajouter_au_panier', args=[b.pk]), {'q': 1})
+        self.assertTrue(any('WARNING' in str(appel) for appel in sortie.call_args_list))
+        self.assertResumeExact()
+        self.assertEqual(self.panier().nb_articles, 2)
+
+
+class PanierAnonymeTests(TestCase):
+    """Panier des visiteurs dans un cookie signé, repris en base à la connexion."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produits = [
+            Produit.objects.create(nom=f'Produit {i}', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=5)
+            for i in range(2)
+        ]
+
+    def cookie(self, valeur):
+        return signing.get_cookie_signer(salt=COOKIE_PANIER + COOKIE_SALT).sign(valeur)
+
+    def lire(self, cookie):
+        request = RequestFactory().get('/')
+        request.COOKIES[COOKIE_PANIER] = cookie
+        return lire_panier_anonyme(request)
+
+    def test_lecture(self):
+        a, b = self.produits
+        self.assertEqual(self.lire(self.cookie(f'{a.pk}:2,{b.pk}:1,x:3,{a.pk}:0')), {a.pk: 2, b.pk: 1})
+
+    def test_cookie_falsifie_ou_expire(self):
+        cookie = self.cookie(f'{self.produits[0].pk}:2')
+        self.assertEqual(self.lire(cookie.replace(':2', ':9', 1)), {})
+        self.assertEqual(self.lire('n-importe-quoi'), {})
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - COOKIE_MAX_AGE - 60):
+            ancien = self.cookie(f'{self.produits[0].pk}:2')
+        self.assertEqual(self.lire(ancien), {})
+
+    def test_ajout_plafonne_au_stock(self):
+        produit = self.produits[0]
+        self.client.post(reverse('ajouter_au_panier', args=[produit.pk]), {'q': 4})
+        reponse = self.client.post(reverse('ajouter_au_panier', args=[produit.pk]), {'q': 4})
+        self.assertEqual(reponse.json()['panier_count'], 5)
+        self.client.post(reverse('changer_quantite', args=[produit.pk]), {'quantite': 50})
+        self.assertEqual(self.lire(self.client.cookies[COOKIE_PANIER].value), {produit.pk: 5})
+
+    def test_quantite_illisible(self):
+        produit = self.produits[0]
+        self.client.post(reverse('ajouter_au_panier', args=[produit.pk]), {'q': 2})
+        reponse = self.client.post(reverse('changer_quantite', args=[produit.pk]), {'quantite': 'deux'})
+        self.assertRedirects(reponse, reverse('panier'), fetch_redirect_response=False)
+        self.assertEqual(self.lire(self.client.cookies[COOKIE_PANIER].value), {produit.pk: 2})
+
+    def test_quantite_illisible_connecte(self):
+        user = User.objects.create_user('client', 'client@example.com')
+        item = PanierItem.objects.create(panier=Panier.objects.create(user=user), produit=self.produits[0], quantite=2)
+        self.client.force_login(user)
+        reponse = self.client.post(reverse('changer_quantite', args=[item.pk]), {'quantite': ''})
+        self.assertRedirects(reponse, reverse('panier'), fetch_redirect_response=False)
+        item.refresh_from_db()
+        self.assertEqual(item.quantite, 2)
+
+    def test_fusion_a_la_connexion(self):
+        a, b = self.produits
+        user = User.objects.create_user('client', 'client@example.com')
+        panier = Panier.objects.create(user=user)
+        PanierItem.objects.create(panier=panier, produit=a, quantite=4)
+        self.client.cookies[COOKIE_PANIER] = self.cookie(f'{a.pk}:3,{b.pk}:2')
+        donnees = {'email': 'client@example.com', 'name': 'Client'}
+        with mock.patch.dict(os.environ, {'GOOGLE_OAUTH_CLIENT_ID': 'client-id'}), \
+                mock.patch('core.views.verifier_jeton', return_value=donnees):
+            reponse = self.client.post(reverse('auth_receiver'), {'credential': 'jeton'})
+        self.assertRedirects(reponse, reverse('accueil'), fetch_redirect_response=False)
+        # Quantités additionnées, plafonnées au stock ; cookie effacé
+        self.assertEqual(dict(panier.items.values_list('produit_id', 'quantite')), {a.pk: 5, b.pk: 2})
+        panier.refresh_from_db()
+        self.assertEqual(panier.nb_articles, 7)
+        self.assertEqual(reponse.cookies[COOKIE_PANIER].value, '')
+
+
+class StockTests(TestCase):
+    """Débit et restauration du stock d'une commande en nombre constant de requêtes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produits = Produit.objects.bulk_create([
+            Produit(nom=f'Produit {i}', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=10)
+            for i in range(30)
+        ])
+
+    def commande(self, quantites):
+        order = Order.objects.create(reference=f'CMD-TEST-{Order.objects.count() + 1}')
+        OrderItem.objects.bulk_create([
+            OrderItem(commande=order, produit=produit, quantite=q, prix_unitaire=produit.prix_ttc)
+            for produit, q in zip(self.produits, quantites)
+        ])
+        return order
+
+    def stocks(self):
+        return list(Produit.objects.order_by('pk').values_list('quantite', flat=True))
+
+    def test_debit_et_restauration(self):
+        order = self.commande([3] * 30)
+        with self.assertNumQueries(6):
+            order.debit_stock()
+        self.assertEqual(self.stocks(), [7] * 30)
+        self.assertFalse(order.items.filter(stock_debited=False).exists())
+        # Un second débit ne touche plus au stock
+        order.debit_stock()
+        self.assertEqual(self.stocks(), [7] * 30)
+        order.restore_stock()
+        self.assertEqual(self.stocks(), [10] * 30)
+        self.assertFalse(order.items.filter(stock_debited=True).exists())
+
+    def test_stock_insuffisant_tout_ou_rien(self):
+        order = self.commande([1, 11, 2, 12])
+        with self.assertRaises(ValueError) as ctx:
+            order.debit_stock()
+        self.assertIn('Produit 1', str(ctx.exception))
+        self.assertIn('Produit 3', str(ctx.exception))
+        self.assertEqual(self.stocks(), [10] * 30)
+        self.assertFalse(order.items.filter(stock_debited=True).exists())
+
+
+class ReferenceCommandeTests(TransactionTestCase):
+    """Allocation des références de commande sous confirmations concurrentes."""
+
+    def test_references_sequentielles(self):
+        maintenant = datetime.datetime(2026, 3, 1, 10, 0, tzinfo=datetime.timezone.utc)
+        with self.assertNumQueries(1):
+            reference = Order.nouvelle_reference(maintenant)
+        self.assertEqual(reference, 'CMD-20260301-0001')
+        self.assertEqual(Order.nouvelle_reference(maintenant), 'CMD-20260301-0002')
+        self.assertEqual(Order.nouvelle_reference(maintenant + datetime.timedelta(days=1)), 'CMD-20260302-0001')
+
+    def test_stress_concurrent(self):
+        threads, par_thread = 8, 25
+        maintenant = timezone.now()
+
+        def allouer(_):
+            try:
+                refs = []
+                for _ in range(par_thread):
+                    with transaction.atomic():
+                        refs.append(Order.nouvelle_reference(maintenant))
+                return refs
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            references = [ref for refs in pool.map(allouer, range(threads)) for ref in refs]
+
+        numeros = sorted(int(ref.rsplit('-', 1)[1]) for ref in references)
+        self.assertEqual(numeros, list(range(1, threads * par_thread + 1)))
+
+    def test_reference_hors_transaction_commande(self):
+        # Le compteur du jour n'est pas verrouillé pendant la création de la commande
+        user = User.objects.create_user('client', 'client@example.com')
+        produit = Produit.objects.create(nom='Routeur', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=5)
+        PanierItem.objects.create(panier=Panier.objects.create(user=user), produit=produit, quantite=1)
+        self.client.force_login(user)
+        session = self.client.session
+        session['commande_infos'] = {
+            'nom': 'Client', 'telephone': '620000000', 'email': '', 'adresse': 'Kaloum',
+            'choix_retrait': 'livraison', 'region_id': None, 'commune_id': None,
+        }
+        session.save()
+        suivant = SequenceCommande.suivant
+        transactions = []
+
+        def allouer(jour):
+            transactions.append(connection.in_atomic_block)
+            return suivant(jour)
+
+        with mock.patch.object(SequenceCommande, 'suivant', side_effect=allouer):
+            reponse = self.client.post(reverse('commande_confirmation'))
+        self.assertRedirects(reponse, reverse('commande_succes'), fetch_redirect_response=False)
+        self.assertEqual(transactions, [False])
+        self.assertTrue(Order.objects.filter(client=user).exists())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailSortantTests(TestCase):
+    """File d'envoi des emails : écrite dans la transaction, vidée par lots."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_annulation_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                mettre_en_file("Sujet", ["client@example.com"], "Corps")
+                raise RuntimeError
+        self.assertFalse(EmailSortant.objects.exists())
+
+    def test_envoi_par_lot(self):
+        for i in range(5):
+            mettre_en_file(f"Sujet {i}", [f"client{i}@example.com"], "Corps", "<p>Corps</p>")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(envoyer_lot(taille=3), (3, 0))
+        self.assertEqual(envoyer_lot(taille=3), (2, 0))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailSortant.objects.filter(statut='envoye').count(), 5)
+        self.assertEqual(envoyer_lot(), (0, 0))
+
+    def test_nouvelle_tentative_avec_backoff(self):
+        email = mettre_en_file("Sujet", ["client@example.com"], "Corps")
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError("SMTP indisponible")):
+            self.assertEqual(envoyer_lot(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.statut, email.tentatives), ('en_attente', 1))
+        self.assertGreater(email.prochain_essai, timezone.now())
+        # Pas encore dû : rien n'est repris avant la fin du délai
+        self.assertEqual(envoyer_lot(), (0, 0))
+        EmailSortant.objects.update(prochain_essai=timezone.now())
+        self.assertEqual(envoyer_lot(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_serveur_injoignable(self):
+        for i in range(3):
+            mettre_en_file(f"Sujet {i}", [f"client{i}@example.com"], "Corps")
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError("Connexion refusée")):
+            self.assertEqual(envoyer_lot(), (0, 0))
+            for email in EmailSortant.objects.all():
+                # Lot reporté, sans tentative comptée
+                self.assertEqual((email.statut, email.tentatives), ('en_attente', 0))
+                self.assertIn('Connexion refusée', email.derniere_erreur)
+                self.assertGreater(email.prochain_essai, timezone.now())
+            # Une longue panne ne fait passer aucun email en échec
+            for _ in range(MAX_TENTATIVES + 1):
+                EmailSortant.objects.update(prochain_essai=timezone.now())
+                self.assertEqual(envoyer_lot(), (0, 0))
+        self.assertFalse(EmailSortant.objects.exclude(statut='en_attente').exists())
+        EmailSortant.objects.update(prochain_essai=timezone.now())
+        self.assertEqual(envoyer_lot(), (3, 0))
+
+    def test_lot_reserve_pendant_envoi(self):
+        mettre_en_file("Sujet", ["client@example.com"], "Corps")
+        envois = []
+
+        def envoyer(message):
+            # Pendant l'échange SMTP, un autre worker ne trouve rien à envoyer
+            envois.append(envoyer_lot())
+            return 1
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=envoyer, autospec=True):
+            self.assertEqual(envoyer_lot(), (1, 0))
+        self.assertEqual(envois, [(0, 0)])
+
+
+@override_settings(EMAIL_LOGO_LARGEUR=200)
+class LogoEmailTests(TestCase):
+    """Partie MIME du logo préparée une fois par processus, réduite à EMAIL_LOGO_LARGEUR."""
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        reglages = override_settings(MEDIA_ROOT=media.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        emails.invalider_logo()
+        self.addCleanup(emails.invalider_logo)
+
+    def logo(self, largeur, hauteur, alt='Logo'):
+        logo = Logo(alt=alt)
+        logo.image.save('logo.png', png(largeur, hauteur), save=False)
+        logo.save()
+        return logo
+
+    def taille(self, partie):
+        with Image.open(io.BytesIO(partie.get_payload(decode=True))) as image:
+            return image.size
+
+    def test_reutilise_entre_envois(self):
+        logo = self.logo(800, 400)
+        for i in range(3):
+            mettre_en_file(f"Sujet {i}", [f"client{i}@example.com"], "Corps", "<img src='cid:logo'>", avec_logo=True)
+        with mock.patch('core.emails._preparer_logo', wraps=emails._preparer_logo) as preparer:
+            self.assertEqual(envoyer_lot(), (3, 0))
+        preparer.assert_called_once()
+        self.assertEqual(list(emails._logo_mime), [(logo.pk, os.stat(logo.image.path).st_mtime_ns, 200)])
+        for message in mail.outbox:
+            partie = next(a for a in message.attachments if a['Content-ID'] == '<logo>')
+            self.assertEqual(self.taille(partie), (200, 100))
+
+    def test_invalide_au_changement(self):
+        self.logo(800, 400)
+        self.assertEqual(self.taille(emails._image_logo()), (200, 100))
+        self.logo(600, 600, alt='Nouveau')
+        self.assertEqual(self.taille(emails._image_logo()), (200, 200))
+        # Autre largeur configurée : nouvelle clé
+        with override_settings(EMAIL_LOGO_LARGEUR=100):
+            self.assertEqual(self.taille(emails._image_logo()), (100, 100))
+        self.assertEqual(len(emails._logo_mime), 1)
+
+    def test_petit_logo_intact(self):
+        logo = self.logo(120, 60)
+        with open(logo.image.path, 'rb') as f:
+            self.assertEqual(emails._image_logo().get_payload(decode=True), f.read())
+
+
+class RenditionsTests(TestCase):
+    """Variantes WebP/JPEG générées à l'upload et servies en srcset."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        reglages = override_settings(MEDIA_ROOT=media.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.media = media.name
+
+    def test_variantes_et_srcset(self):
+        produit = Produit.objects.create(nom='Routeur', prix=Decimal('1000'))
+        produit.image.save('routeur.png', png(1000, 500))
+        for largeur in (320, 640, 960):
+            for extension in ('webp', 'jpg'):
+                chemin = os.path.join(self.media, chemin_rendition(produit.image.name, largeur, extension))
+                with Image.open(chemin) as variante:
+                    self.assertEqual(variante.size, (largeur, largeur // 2))
+        self.assertFalse(os.path.exists(os.path.join(self.media, chemin_rendition(produit.image.name, 1280, 'webp'))))
+
+        html = Template('{% load renditions %}{% image_responsive p.image alt=p.nom sizes="25vw" %}').render(
+            Context({'p': produit}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('-960w.webp 960w', html)
+        self.assertIn('-320w.jpg 320w', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn(f'src="{produit.image.url}"', html)
+
+    def test_petite_image_sans_variante(self):
+        produit = Produit.objects.create(nom='Câble', prix=Decimal('1000'))
+        produit.image.save('cable.png', png(200, 100))
+        html = Template('{% load renditions %}{% image_responsive p.image %}').render(Context({'p': produit}))
+        self.assertNotIn('srcset', html)
+        self.assertIn(f'src="{produit.image.url}"', html)
+        # Largeur d'origine notée : un nouvel enregistrement ne rouvre pas l'image
+        with mock.patch('core.images.Image.open') as ouvrir:
+            produit.nom = 'Câble RJ45'
+            produit.save()
+        ouvrir.assert_not_called()
+
+    def test_rendu_sans_generation(self):
+        # Image antérieure au pipeline : servie sans srcset, variantes faites par la commande
+        nom = default_storage.save('produits/ancien.png', png(1000, 500))
+        Produit.objects.create(nom='Routeur', prix=Decimal('1000'))
+        Produit.objects.update(image=nom)
+        produit = Produit.objects.get()
+        gabarit = Template('{% load renditions %}{% image_responsive p.image %}')
+        with mock.patch('core.images.Image.open') as ouvrir:
+            self.assertNotIn('srcset', gabarit.render(Context({'p': produit})))
+        ouvrir.assert_not_called()
+        self.assertFalse(os.path.exists(os.path.join(self.media, chemin_rendition(nom, 320, 'webp'))))
+        call_command('generer_renditions', stdout=io.StringIO())
+        self.assertIn('-960w.webp 960w', gabarit.render(Context({'p': produit})))
+
+
+class StockageDedupeTests(TestCase):
+    """Uploads adressés par contenu : une seule copie par contenu, conservée tant qu'elle est référencée."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        reglages = override_settings(MEDIA_ROOT=media.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.media = media.name
+
+    def test_meme_contenu_meme_fichier(self):
+        premier = Produit.objects.create(nom='Routeur A', prix=Decimal('1000'))
+        second = Produit.objects.create(nom='Routeur B', prix=Decimal('1000'))
+        premier.image.save('routeur.png', png(100, 50))
+        second.image.save('routeur_copie.png', png(100, 50))
+        self.assertEqual(premier.image.name, second.image.name)
+        originaux = [f for f in os.listdir(os.path.join(self.media, 'produits')) if f != 'renditions']
+        self.assertEqual(originaux, [os.path.basename(premier.image.name)])
+
+        chemin = premier.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            premier.delete()
+        self.assertTrue(os.path.exists(chemin))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(chemin))
+
+
+class CatalogueTests(TestCase):
+    """Page équipements : n produits par sous-catégorie, coût indépendant du catalogue."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom='Equipement')
+        cls.routeurs = SousCategorie.objects.create(nom='Routeurs', categorie=categorie)
+        cls.antennes = SousCategorie.objects.create(nom='Antennes', categorie=categorie)
+        Produit.objects.bulk_create(
+            [Produit(nom=f'Routeur {i}', prix=Decimal('1000'), description='x' * 500, sous_categorie=cls.routeurs)
+             for i in range(30)]
+            + [Produit(nom=f'Antenne {i}', prix=Decimal('1000'), sous_categorie=cls.antennes) for i in range(2)]
+        )
+
+    def test_apercu_et_compteurs(self):
+        with self.assertNumQueries(3):
+            sous_categories = {sc.nom: sc for c in categories_avec_apercu() for sc in c.sous_categories.all()}
+            routeurs, antennes = sous_categories['Routeurs'], sous_categories['Antennes']
+            self.assertEqual((routeurs.nb_produits, len(routeurs.apercu)), (30, 4))
+            self.assertEqual((antennes.nb_produits, len(antennes.apercu)), (2, 2))
+            self.assertEqual(len(routeurs.apercu[0].resume), 61)
+            self.assertIn('description', routeurs.apercu[0].get_deferred_fields())
+
+    def test_page_cout_constant(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as avant:
+            self.assertEqual(self.client.get(reverse('equipements')).status_code, 200)
+        Produit.objects.bulk_create([
+            Produit(nom=f'Routeur bis {i}', prix=Decimal('1000'), sous_categorie=self.antennes) for i in range(40)
+        ])
+        cache.clear()
+        with self.assertNumQueries(len(avant)):
+            response = self.client.get(reverse('equipements'))
+        self.assertContains(response, 'Voir les 42 produits')
+
+
+class PaginationTests(TestCase):
+    """Pagination par clé : pages complètes, sans doublon, en nombre constant de requêtes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Même date_pub pour toutes : le départage se fait sur l'id
+        cls.actualites = Actualite.objects.bulk_create([Actualite(titre=f'Actu {i}') for i in range(25)])
+        ActualiteImage.objects.bulk_create([
+            ActualiteImage(actualite=actu, image=f'blog/{actu.pk}-{n}.jpg') for actu in cls.actualites for n in range(2)
+        ])
+        cls.user = User.objects.create_user('client', 'client@example.com')
+        Order.objects.bulk_create(
+            [Order(reference=f'CMD-{i}', client=cls.user) for i in range(30)]
+            + [Order(reference=f'CMD-INVITE-{i}', email='client@example.com') for i in range(5)]
+            + [Order(reference=f'CMD-AUTRE-{i}', email='autre@example.com') for i in range(5)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        # Fichiers d'images fictifs : pas de variantes à générer
+        patch = mock.patch('core.templatetags.renditions.largeurs_disponibles', return_value=())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def parcourir(self, url, marqueur):
+        vus, curseur, requetes = [], None, set()
+        while True:
+            params = {'format': 'json', **({'curseur': curseur} if curseur else {})}
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(url, params).json()
+            requetes.add(len(ctx))
+            vus.append(data['html'].count(marqueur))
+            curseur = data['suivant']
+            if not curseur:
+                return vus, requetes
+
+    def test_blog(self):
+        # Horodatages des GET conditionnels déjà en cache, comme en production
+        self.client.get(reverse('blog'))
+        pages, requetes = self.parcourir(reverse('blog'), 'class="card mb-4')
+        self.assertEqual(pages, [10, 10, 5])
+        self.assertEqual(len(requetes), 1)
+        response = self.client.get(reverse('blog'))
+        self.assertContains(response, 'data-charger-plus')
+        self.assertContains(response, f'id="post{self.actualites[-1].pk}"')
+
+    def test_mes_commandes(self):
+        self.client.force_login(self.user)
+        pages, _ = self.parcourir(reverse('mes_commandes'), '<tr>')
+        self.assertEqual(pages, [20, 15])
+
+    def test_curseur_invalide(self):
+        response = self.client.get(reverse('blog'), {'curseur': 'invalide'})
+        self.assertEqual(response.status_code, 200)
+
+
+class IndexTests(TestCase):
+    """Les requêtes fréquentes passent par un index (manage.py verifier_index)."""
+
+    def test_requetes_chaudes_indexees(self):
+        call_command('verifier_index', stdout=io.StringIO())
+
+    def test_scan_detecte(self):
+        from .management.commands.verifier_index import Command
+        _, tables = Command().expliquer(Produit.objects.filter(reference='ABC'))
+        self.assertEqual(tables, ['core_produit'])
+
+
+class SeedScaleTests(TestCase):
+    """Génération de données de volume : quantités demandées, cohérentes et reproductibles."""
+
+    def lancer(self, **options):
+        volumes = dict(categories=2, sous_categories=3, produits=40, communes=2, clients=10,
+                       commandes=60, tickets=120, demandes=15, actualites=5, lot=25, fin='2026-01-31')
+        volumes.update(options)
+        call_command('seed_scale', stdout=io.StringIO(), **volumes)
+
+    def test_volumes_et_coherence(self):
+        self.lancer()
+        self.assertEqual(Produit.objects.count(), 40)
+        self.assertEqual(Order.objects.count(), 60)
+        self.assertEqual(WifiTicket.objects.count(), 120)
+        self.assertEqual(DemandeSouscription.objects.count(), 15)
+        self.assertEqual(Actualite.objects.count(), 5)
+        self.assertFalse(Order.objects.filter(date_commande__gt=datetime.datetime(2026, 2, 1, tzinfo=datetime.timezone.utc)).exists())
+        for order in Order.objects.prefetch_related('items')[:10]:
+            self.assertEqual(order.montant_total, sum(item.total_ligne for item in order.items.all()))
+
+    def test_reproductible(self):
+        self.lancer()
+        premier = list(WifiTicket.objects.order_by('identifiant').values_list('mot_de_passe', 'date_creation'))
+        self.lancer(purger=True)
+        second = list(WifiTicket.objects.order_by('identifiant').values_list('mot_de_passe', 'date_creation'))
+        self.assertEqual(premier, second)
+
+    def test_graines_distinctes(self):
+        # 42 et 142 ne partagent plus de clé unique
+        self.lancer(graine=42)
+        self.lancer(graine=142)
+        self.assertEqual(WifiTicket.objects.count(), 240)
+        self.assertEqual(Order.objects.count(), 120)
+
+    def test_relance_sans_purger(self):
+        self.lancer()
+        with self.assertRaisesMessage(CommandError, '--purger'):
+            self.lancer()
+        self.assertEqual(Order.objects.count(), 60)
+
+    def test_purger_par_lots(self):
+        self.lancer()
+        client = User.objects.create_user('client', 'client@example.com')
+        panier = Panier.objects.create(user=client)
+        PanierItem.objects.create(panier=panier, produit=Produit.objects.first(), quantite=2)
+        self.assertGreater(Panier.objects.get(pk=panier.pk).total_ttc, 0)
+        version = get_version('produit')
+        # Nombre de requêtes indépendant du volume : pas de suppression objet par objet
+        with CaptureQueriesContext(connection) as requetes:
+            SeedScale(stdout=io.StringIO()).purger()
+        self.assertLess(len(requetes), 50)
+        for modele in (Produit, Order, OrderItem, WifiTicket, DemandeSouscription, Actualite, ZoneCouverture, Categorie):
+            self.assertFalse(modele.objects.exists(), modele.__name__)
+        self.assertEqual(list(User.objects.all()), [client])
+        panier.refresh_from_db()
+        self.assertEqual((panier.nb_articles, panier.total_ttc), (0, 0))
+        self.assertGreater(get_version('produit'), version)
+
+
+class BudgetVuesTests(TestCase):
+    """Les pages principales restent dans le budget de requêtes de core/bench_vues.json."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_scale', stdout=io.StringIO(), categories=2, sous_categories=3, produits=60, communes=2,
+            clients=5, commandes=80, tickets=20, demandes=5, actualites=12, lot=50, fin='2026-01-31',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_budget_requetes(self):
+        references = charger_references()
+        donnees = donnees_bench()
+        for scenario in SCENARIOS:
+            with self.subTest(vue=scenario.nom):
+                mesure = mesurer(self.client, scenario, donnees, repetitions=1)
+                self.assertLessEqual(mesure.requetes, references[scenario.nom]['budget_requetes'])
+
+    def test_comparer(self):
+        references = {'faq': {'budget_requetes': 2, 'requetes': 2, 'temps_ms': 10, 'memoire_ko': 200}}
+        self.assertEqual(comparer([Mesure('faq', 2, 12, 210)], references), [])
+        echecs = comparer([Mesure('faq', 3, 40, 1000)], references)
+        self.assertEqual(len(echecs), 3)
+
+
+@override_settings(PERF_ECHANTILLON=1, PAGE_CACHE_TTL=0)
+class PerfTests(TestCase):
+    """Mesures par requête et page /_perf/ réservée au staff."""
+
+    def setUp(self):
+        cache.clear()
+        tampon.clear()
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = Path(dossier.name)
+        reglages = override_settings(PERF_DOSSIER=dossier.name, PERF_EXPORT=0)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def test_mesures_par_requete(self):
+        self.client.get(reverse('accueil'))
+        self.client.get(reverse('accueil'))
+        premiere, seconde = tampon
+        self.assertEqual(seconde['vue'], 'accueil')
+        self.assertEqual(seconde['statut'], 200)
+        self.assertGreater(premiere['requetes'], seconde['requetes'])
+        self.assertGreater(premiere['cache_miss'], 0)
+        self.assertGreater(seconde['cache_hit'], 0)
+        self.assertGreater(seconde['template_ms'], 0)
+        self.assertGreater(seconde['taille'], 0)
+
+    @override_settings(PERF_ECHANTILLON=0)
+    def test_desactive(self):
+        self.client.get(reverse('faq'))
+        self.assertEqual(len(tampon), 0)
+        # Aucun monkeypatch installé quand l'échantillonnage est nul
+        with mock.patch('core.perf._instrumenter_templates') as templates, \
+                mock.patch('core.perf._instrumenter_cache') as lectures, \
+                self.assertRaises(MiddlewareNotUsed):
+            PerfMiddleware(lambda request: None)
+        templates.assert_not_called()
+        lectures.assert_not_called()
+
+    def test_tous_les_workers(self):
+        self.client.get(reverse('faq'))
+        propre = list(self.dossier.glob('*.jsonl'))
+        self.assertEqual(len(propre), 1)
+        self.assertEqual(json.loads(propre[0].read_text().splitlines()[0])['vue'], 'faq')
+        # Autre worker : ses mesures comptent ; le fichier d'un worker arrêté est supprimé
+        autre = {**json.loads(propre[0].read_text().splitlines()[0]), 'vue': 'tickets', 'pid': 999999, 'horodatage': time.time()}
+        (self.dossier / 'autre_999999.jsonl').write_text(json.dumps(autre) + '\n{"incomplet')
+        arrete = self.dossier / 'autre_999998.jsonl'
+        arrete.write_text(json.dumps({**autre, 'pid': 999998}) + '\n')
+        perime = time.time() - PEREMPTION * settings.PERF_FENETRE - 60
+        os.utime(arrete, (perime, perime))
+        user = User.objects.create_user('perf', 'perf@example.com', is_staff=True)
+        self.client.force_login(user)
+        reponse = self.client.get(reverse('perf'), {'fenetre': 600})
+        self.assertContains(reponse, 'tickets')
+        self.assertContains(reponse, '999999')
+        self.assertNotContains(reponse, '999998')
+        self.assertFalse(arrete.exists())
+
+    def test_fenetre_bornee(self):
+        # Un fichier inactif depuis plus que la fenêtre n'est pas lu, mais reste en place
+        self.client.get(reverse('faq'))
+        mesure = json.loads(next(self.dossier.glob('*.jsonl')).read_text().splitlines()[0])
+        inactif = self.dossier / 'autre_999997.jsonl'
+        inactif.write_text(json.dumps({**mesure, 'pid': 999997, 'horodatage': time.time() - 120}) + '\n')
+        os.utime(inactif, (time.time() - 120, time.time() - 120))
+        user = User.objects.create_user('perf', 'perf@example.com', is_staff=True)
+        self.client.force_login(user)
+        for fenetre, attendue in (('0', 1), ('-5', 1), ('abc', settings.PERF_FENETRE), ('99999999', settings.PERF_FENETRE)):
+            reponse = self.client.get(reverse('perf'), {'fenetre': fenetre})
+            self.assertEqual(reponse.status_code, 200)
+            self.assertEqual(reponse.context['fenetre'], attendue)
+            self.assertTrue(inactif.exists())
+        self.assertNotContains(self.client.get(reverse('perf'), {'fenetre': 60}), '999997')
+
+    def test_fichier_borne(self):
+        with mock.patch('core.perf.tampon', deque(maxlen=3)):
+            for _ in range(5):
+                self.client.get(reverse('faq'))
+        lignes = next(self.dossier.glob('*.jsonl')).read_text().splitlines()
+        self.assertLessEqual(len(lignes), 3)
+
+    def test_page_staff(self):
+        self.client.get(reverse('faq'))
+        user = User.objects.create_user('perf', 'perf@example.com')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('perf')).status_code, 302)
+        user.is_staff = True
+        user.save()
+        reponse = self.client.get(reverse('perf'))
+        self.assertContains(reponse, 'faq')
+
+    def test_centiles(self):
+        self.assertEqual([centile(list(range(1, 101)), p) for p in CENTILES], [50, 95, 99])
+        self.assertEqual(centile([7.0], 99), 7.0)
+
+
+class MetriquesTests(TestCase):
+    """Registre de métriques partagé entre processus et endpoint /metrics."""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = dossier.name
+        reglages = override_settings(METRIQUES_DOSSIER=dossier.name, METRIQUES_JETON='secret')
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def valeur(self, ligne):
+        for texte in metriques.exposer().splitlines():
+            if texte.startswith(ligne + ' '):
+                return float(texte.rsplit(' ', 1)[1])
+        return None
+
+    def test_agregation_entre_processus(self):
+        metriques.debits_stock.inc(resultat='ok')
+        contexte = multiprocessing.get_context('fork')
+        processus = [contexte.Process(target=metriques.debits_stock.inc, kwargs={'resultat': 'ok'}) for _ in range(3)]
+        for p in processus:
+            p.start()
+        for p in processus:
+            p.join()
+        self.assertEqual(self.valeur('skyconnect_debits_stock_total{resultat="ok"}'), 4)
+
+    @unittest.skipIf(metriques.fcntl is None, "fusion des fichiers indisponible sans fcntl")
+    def test_fusion_processus_arretes(self):
+        metriques.debits_stock.inc(resultat='ok')
+        contexte = multiprocessing.get_context('fork')
+        for _ in range(2):
+            processus = [contexte.Process(target=metriques.debits_stock.inc, kwargs={'resultat': 'ok'}) for _ in range(3)]
+            for p in processus:
+                p.start()
+            for p in processus:
+                p.join()
+            metriques.fusionner_processus_arretes()
+            # Fichier du processus courant et archive, quel que soit le nombre de workers passés
+            self.assertEqual(len(list(Path(self.dossier).glob('*.db'))), 2)
+        self.assertEqual(self.valeur('skyconnect_debits_stock_total{resultat="ok"}'), 7)
+        self.assertEqual(metriques.fusionner_processus_arretes(), 0)
+
+    def test_histogramme(self):
+        for duree in (0.003, 0.2, 20):
+            metriques.duree_commandes.observer(duree, mode='livraison')
+        serie = 'skyconnect_duree_commande_secondes'
+        self.assertEqual(self.valeur(f'{serie}_bucket{{mode="livraison",le="0.005"}}'), 1)
+        self.assertEqual(self.valeur(f'{serie}_bucket{{mode="livraison",le="0.25"}}'), 2)
+        self.assertEqual(self.valeur(f'{serie}_bucket{{mode="livraison",le="+Inf"}}'), 3)
+        self.assertEqual(self.valeur(f'{serie}_count{{mode="livraison"}}'), 3)
+        with self.assertRaises(ValueError):
+            metriques.duree_commandes.observer(1)
+
+    def test_debit_stock_et_endpoint(self):
+        produit = Produit.objects.create(nom='Routeur', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=1)
+        order = Order.objects.create(reference='CMD-METRIQUES')
+        OrderItem.objects.create(commande=order, produit=produit, quantite=2, prix_unitaire=produit.prix_ttc)
+        with self.assertRaises(ValueError):
+            order.debit_stock()
+
+        # La requête en cours n'est comptée qu'une fois sa réponse produite
+        entete = {'HTTP_AUTHORIZATION': 'Bearer secret'}
+        self.client.get(reverse('metriques'), **entete)
+        reponse = self.client.get(reverse('metriques'), **entete)
+        self.assertEqual(reponse['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(reponse, '# TYPE skyconnect_debits_stock_total counter')
+        self.assertContains(reponse, 'skyconnect_debits_stock_total{resultat="stock_insuffisant"} 1')
+        self.assertContains(reponse, 'skyconnect_requetes_http_total{methode="GET",statut="200",vue="metriques"}')
+
+        self.assertEqual(self.client.get(reverse('metriques')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metriques'), HTTP_AUTHORIZATION='Bearer autre').status_code, 401)
+        # Sans jeton configuré, l'endpoint est fermé
+        with override_settings(METRIQUES_JETON=''):
+            self.assertEqual(self.client.get(reverse('metriques'), **entete).status_code, 404)
+
+    def test_methode_bornee(self):
+        self.client.generic('PROPFIND', reverse('metriques'))
+        self.client.generic('BREW', reverse('metriques'))
+        reponse = self.client.get(reverse('metriques'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(reponse, 'skyconnect_requetes_http_total{methode="autre",statut="401",vue="metriques"} 2')
+        self.assertNotContains(reponse, 'PROPFIND')
+
+    def test_debit_annule_non_compte(self):
+        produit = Produit.objects.create(nom='Routeur', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=5)
+        order = Order.objects.create(reference='CMD-ANNULEE')
+        OrderItem.objects.create(commande=order, produit=produit, quantite=2, prix_unitaire=produit.prix_ttc)
+        ligne = 'skyconnect_debits_stock_total{resultat="ok"}'
+        # Transaction annulée après le débit : rien n'est compté
+        with self.captureOnCommitCallbacks(execute=True) as rappels:
+            try:
+                with transaction.atomic():
+                    order.debit_stock()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(rappels, [])
+        self.assertIsNone(self.valeur(ligne))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.debit_stock()
+        self.assertEqual(self.valeur(ligne), 1)
+
+
+@override_settings(PROFILAGE_VUES=[], PROFILAGE_ECHANTILLON=0, PROFILAGE_INTERVALLE=0.0005)
+class ProfilageTests(TestCase):
+    """Profilage à la demande et fusion des profils par la commande profils."""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = dossier.name
+        reglages = override_settings(PROFILAGE_DOSSIER=self.dossier)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def profils(self, vue):
+        chemin = os.path.join(self.dossier, vue)
+        return sorted(os.listdir(chemin)) if os.path.isdir(chemin) else []
+
+    @override_settings(PROFILAGE_VUES=['faq'], PROFILAGE_MODE='cprofile')
+    def test_vue_configuree(self):
+        self.client.get(reverse('faq'))
+        self.client.get(reverse('tickets'))
+        self.assertEqual(len(self.profils('faq')), 1)
+        self.assertTrue(self.profils('faq')[0].endswith('.prof'))
+        self.assertEqual(self.profils('tickets'), [])
+
+    def test_en_tete_reserve_au_staff(self):
+        user = User.objects.create_user('profil', 'profil@example.com')
+        self.client.force_login(user)
+        self.client.get(reverse('faq'), HTTP_X_PROFILAGE='1')
+        self.assertEqual(self.profils('faq'), [])
+        user.is_staff = True
+        user.save()
+        self.client.get(reverse('faq'), HTTP_X_PROFILAGE='echantillonneur')
+        self.assertTrue(self.profils('faq')[0].endswith('.folded'))
+
+    def test_fusion(self):
+        os.makedirs(os.path.join(self.dossier, 'accueil'))
+        for nom, contenu in (('a', 'vue;render;sql 3\nvue;render 1\n'), ('b', 'vue;render;sql 2\n')):
+            with open(os.path.join(self.dossier, 'accueil', f'{nom}.folded'), 'w') as f:
+                f.write(contenu)
+        sortie = io.StringIO()
+        call_command('profils', flamegraph=True, purger=True, stdout=sortie)
+        self.assertIn('6 échantillons', sortie.getvalue())
+        with open(os.path.join(self.dossier, 'accueil.folded')) as f:
+            self.assertEqual(f.read(), 'vue;render;sql 5\nvue;render 1\n')
+        self.assertTrue(os.path.exists(os.path.join(self.dossier, 'accueil.svg')))
+        self.assertEqual(self.profils('accueil'), [])
+        self.assertEqual(
+            fonctions_chaudes(Counter({'vue;render;sql': 5, 'vue;render': 1})),
+            [('sql', 5, 5), ('render', 1, 6)],
+        )
+
+
+class CacheVersionneTests(TestCase):
+    """Espaces de cache versionnés et context processors paresseux."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_versions(self):
+        self.assertEqual(get_version('essai'), 1)
+        self.assertEqual(bump_version('essai'), 2)
+        self.assertEqual(get_versions('essai', 'autre'), {'essai': 2, 'autre': 1})
+        # Cache vidé : la version repart au-delà de la valeur par défaut
+        cache.clear()
+        self.assertEqual(bump_version('essai'), 2)
+
+    def test_get_or_build(self):
+        construire = mock.Mock(return_value=['valeur'])
+        self.assertEqual(get_or_build('essai', 'liste', construire), ['valeur'])
+        self.assertEqual(get_or_build('essai', 'liste', construire), ['valeur'])
+        self.assertEqual(construire.call_count, 1)
+        bump_version('essai')
+        get_or_build('essai', 'liste', construire)
+        self.assertEqual(construire.call_count, 2)
+        # None est mis en cache lui aussi
+        vide = mock.Mock(return_value=None)
+        self.assertIsNone(get_or_build('essai', 'vide', vide))
+        self.assertIsNone(get_or_build('essai', 'vide', vide))
+        self.assertEqual(vide.call_count, 1)
+
+    def test_logo_invalide(self):
+        Logo.objects.create(image='logos/ancien.png', alt='Ancien')
+        self.assertEqual(logo_actif().alt, 'Ancien')
+        with self.assertNumQueries(0):
+            logo_actif()
+        Logo.objects.create(image='logos/nouveau.png', alt='Nouveau')
+        self.assertEqual(logo_actif().alt, 'Nouveau')
+
+    def test_menu_invalide(self):
+        request = RequestFactory().get('/')
+        categorie = Categorie.objects.create(nom='Equipement')
+        self.assertEqual(list(menu_categories(request)['equipement_categories']), [])
+        SousCategorie.objects.create(nom='Antennes', categorie=categorie)
+        self.assertEqual([sc.nom for sc in menu_categories(request)['equipement_categories']], ['Antennes'])
+        with self.assertNumQueries(0):
+            list(menu_categories(request)['equipement_categories'])
+        categorie.nom = 'Autre'
+        categorie.save()
+        self.assertEqual(list(menu_categories(request)['equipement_categories']), [])
+
+    def test_valeurs_paresseuses(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('paresse', 'paresse@example.com')
+        contexte = {**logo_context(request), **menu_categories(request), **panier_count(request)}
+        # Une page qui ne les affiche pas ne lance aucune requête
+        with self.assertNumQueries(0):
+            Template('<p>{{ titre }}</p>').render(Context({**contexte, 'titre': 'Sans menu'}))
+        with self.assertNumQueries(1):
+            self.assertEqual(Template('{{ panier_count }}').render(Context(contexte)), '0')
+
+    def test_erreur_sans_echec_de_page(self):
+        request = RequestFactory().get('/')
+        with mock.patch('core.context_processors.get_or_build', side_effect=RuntimeError("cache")), \
+                mock.patch('builtins.print'):
+            self.assertFalse(logo_context(request)['logo'])
+            self.assertEqual(list(menu_categories(request)['accessoire_categories']), [])
+
+
+class FragmentsTests(TestCase):
+    """Fragments partagés mis en cache et invalidés par les signaux des modèles."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_accueil_en_cache_et_invalide(self):
+        produit = Produit.objects.create(
+            nom='Routeur Promo', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=2, is_bon_plan=True,
+        )
+        self.client.get(reverse('accueil'))
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertContains(self.client.get(reverse('accueil')), 'Routeur Promo')
+        self.assertFalse(any('core_produit' in q['sql'] for q in requetes.captured_queries))
+
+        produit.nom = 'Routeur Soldé'
+        produit.save()
+        self.assertContains(self.client.get(reverse('accueil')), 'Routeur Soldé')
+
+        # Le débit de stock (UPDATE sans signal) invalide aussi les bons plans
+        order = Order.objects.create(reference='CMD-FRAGMENT')
+        OrderItem.objects.create(commande=order, produit=produit, quantite=2, prix_unitaire=produit.prix_ttc)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.debit_stock()
+        self.assertNotContains(self.client.get(reverse('accueil')), 'Routeur Soldé')
+
+    def test_menu_invalide(self):
+        categorie = Categorie.objects.create(nom='Equipement')
+        self.client.get(reverse('faq'))
+        SousCategorie.objects.create(nom='Antennes', categorie=categorie)
+        self.assertContains(self.client.get(reverse('faq')), 'Antennes')
+
+    def test_parties_par_utilisateur_hors_fragments(self):
+        user = User.objects.create_user('fragment', 'fragment@example.com')
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('faq')), 'fragment@example.com')
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse('faq')), 'fragment@example.com')
+
+
+@override_settings(PAGE_CACHE_TTL=300)
+class PageCacheTests(TestCase):
+    """Pages publiques servies depuis le cache aux visiteurs anonymes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zone = ZoneCouverture.objects.create(region='Conakry')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hit_et_invalidation(self):
+        self.assertEqual(self.client.get(reverse('zone_couverture'))['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            reponse = self.client.get(reverse('zone_couverture'))
+        self.assertEqual(reponse['X-Cache'], 'HIT')
+        self.assertContains(reponse, 'Conakry')
+
+        ZoneCouverture.objects.create(region='Kindia')
+        reponse = self.client.get(reverse('zone_couverture'))
+        self.assertEqual(reponse['X-Cache'], 'MISS')
+        self.assertContains(reponse, 'Kindia')
+
+    def test_visiteurs_personnalises_non_caches(self):
+        self.client.get(reverse('faq'))
+        self.client.cookies['panier'] = 'x'
+        self.assertNotIn('X-Cache', self.client.get(reverse('faq')))
+        user = User.objects.create_user('page', 'page@example.com')
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('faq')), 'page@example.com')
+
+    def test_jeton_csrf_par_visiteur(self):
+        client = Client(enforce_csrf_checks=True)
+        client.get(reverse('accueil'))
+        visiteur = Client(enforce_csrf_checks=True)
+        reponse = visiteur.get(reverse('accueil'))
+        self.assertEqual(reponse['X-Cache'], 'HIT')
+        jeton = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', reponse.content.decode()).group(1)
+        self.assertIn('csrftoken', reponse.cookies)
+        forfait = Forfait.objects.create(nom='Fibre', prix=Decimal('100000'), type='FH')
+        # Le formulaire du modal passe la vérification CSRF avec le jeton servi
+        reponse = visiteur.post(reverse('souscription_form', args=[forfait.pk]), {
+            'csrfmiddlewaretoken': jeton, 'region': self.zone.pk, 'forfait_id': forfait.pk,
+        })
+        self.assertNotEqual(reponse.status_code, 403)
+
+    def test_regeneration_unique(self):
+        appels = []
+
+        @page_anonyme_en_cache()
+        def vue(request):
+            appels.append(1)
+            time.sleep(0.2)
+            return HttpResponse('page')
+
+        requete = RequestFactory().get('/page-lente/')
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            reponses = list(pool.map(lambda _: vue(requete), range(4)))
+        self.assertEqual(len(appels), 1)
+        self.assertEqual(sorted(r['X-Cache'] for r in reponses), ['HIT', 'HIT', 'HIT', 'MISS'])
+
+
+class GetConditionnelTests(TestCase):
+    """ETag / Last-Modified tirés des horodatages, 304 sans exécuter la vue."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.section = FaqSection.objects.create(titre='Internet')
+        cls.produit = Produit.objects.create(nom='Routeur', prix=Decimal('1000'), taux_tva=Decimal('18'), quantite=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_304_sans_requete(self):
+        reponse = self.client.get(reverse('faq'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('Last-Modified', reponse)
+        self.assertIn('no-cache', reponse['Cache-Control'])
+        etag = reponse['ETag']
+        with self.assertNumQueries(0):
+            reponse = self.client.get(reverse('faq'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(reponse.content, b'')
+
+        Faq.objects.create(section=self.section, question='Quel débit ?')
+        reponse = self.client.get(reverse('faq'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], etag)
+
+    def test_lecture_en_une_requete(self):
+        Horodatage.marquer('logo', 'menu', 'produit')
+        with self.assertNumQueries(1):
+            horodatages = Horodatage.lire('logo', 'menu', 'produit')
+        self.assertEqual(set(horodatages), {'logo', 'menu', 'produit'})
+        with self.assertNumQueries(0):
+            self.assertEqual(Horodatage.lire('logo', 'menu', 'produit'), horodatages)
+
+    def test_etag_personnel(self):
+        url = reverse('produit_detail', args=[self.produit.pk])
+        anonyme = self.client.get(url)['ETag']
+        user = User.objects.create_user('cond', 'cond@example.com')
+        self.client.force_login(user)
+        # Première page connectée : elle pose le cookie CSRF (formulaire de déconnexion)
+        self.client.get(url)
+        reponse = self.client.get(url)
+        self.assertNotEqual(reponse['ETag'], anonyme)
+        # Last-Modified ignore le visiteur : absent des pages personnalisées
+        self.assertNotIn('Last-Modified', reponse)
+        self.assertIn('private', reponse['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=reponse['ETag']).status_code, 304)
+        self.client.get(reverse('ajouter_au_panier', args=[self.produit.pk]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=reponse['ETag']).status_code, 200)
+
+    def test_etag_suit_le_jeton_csrf(self):
+        # Connexion puis déconnexion : nouveau secret CSRF, la page au formulaire est renvoyée
+        url = reverse('forfaits')
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'b' * 32
+        reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotIn('Last-Modified', reponse)
+
+    def test_debit_de_stock(self):
+        url = reverse('produit_detail', args=[self.produit.pk])
+        etag = self.client.get(url)['ETag']
+        order = Order.objects.create(reference='CMD-COND-1')
+        OrderItem.objects.create(commande=order, produit=self.produit, quantite=1, prix_unitaire=Decimal('1180'))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.debit_stock()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CouvertureApiTests(TestCase):
+    """Communes servies par l'API de couverture et non plus écrites dans chaque page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.conakry = ZoneCouverture.objects.create(region='Conakry')
+        cls.kindia = ZoneCouverture.objects.create(region='Kindia')
+        cls.kaloum = Commune.objects.create(nom='Kaloum', zone=cls.conakry)
+        cls.dixinn = Commune.objects.create(nom='Dixinn', zone=cls.conakry)
+        cls.friguiagbe = Commune.objects.create(nom='Friguiagbé', zone=cls.kindia)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_document_et_cache(self):
+        reponse = self.client.get(reverse('api_couverture'))
+        self.assertEqual(reponse.json(), {'regions': [
+            {'id': self.conakry.pk, 'nom': 'Conakry', 'communes': [
+                [self.dixinn.pk, 'Dixinn'], [self.kaloum.pk, 'Kaloum'],
+            ]},
+            {'id': self.kindia.pk, 'nom': 'Kindia', 'communes': [[self.friguiagbe.pk, 'Friguiagbé']]},
+        ]})
+        self.assertIn('no-cache', reponse['Cache-Control'])
+        etag = reponse['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('api_couverture'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        url = self.client.get(reverse('forfaits')).context['url_couverture']
+        self.assertIn('immutable', self.client.get(url)['Cache-Control'])
+        Commune.objects.create(nom='Matam', zone=self.conakry)
+        nouvelle = self.client.get(reverse('forfaits')).context['url_couverture']
+        self.assertNotEqual(nouvelle, url)
+        self.assertContains(self.client.get(nouvelle), 'Matam')
+
+    def test_pages_sans_communes(self):
+        for nom in ('accueil', 'forfaits'):
+            reponse = self.client.get(reverse(nom))
+            self.assertContains(reponse, 'data-couverture="/api/couverture/?v=')
+            self.assertContains(reponse, '>Kindia</option>')
+            self.assertNotContains(reponse, 'Friguiagbé')
+
+
+class EligibiliteTests(TestCase):
+    """Éligibilité FO / FH tirée de l'index de couverture en mémoire."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.conakry = ZoneCouverture.objects.create(region='Conakry')
+        cls.kindia = ZoneCouverture.objects.create(region='Kindia')
+        cls.kaloum = Commune.objects.create(nom='Kaloum', zone=cls.conakry)
+        cls.fibre = Forfait.objects.create(nom='Fibre 50', prix=Decimal('500000'), type='FO')
+        cls.radio = Forfait.objects.create(nom='Radio 10', prix=Decimal('300000'), type='FH')
+
+    def setUp(self):
+        cache.clear()
+        # Index d'un test précédent : la base a été remise à zéro entre-temps
+        patch = mock.patch.object(couverture, '_index', None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_index(self):
+        index = couverture.index_couverture()
+        self.assertEqual(index.types_eligibles(self.conakry.pk, self.kaloum.pk), {'FO', 'FH'})
+        self.assertEqual(index.types_eligibles(str(self.kindia.pk), str(self.kaloum.pk)), {'FH'})
+        self.assertEqual(index.types_eligibles(None, 'x'), {'FH'})
+        self.assertEqual(index.forfaits_repli, (self.radio,))
+        with self.assertNumQueries(0):
+            self.assertIs(couverture.index_couverture(), index)
+
+        commune = Commune.objects.create(nom='Friguiagbé', zone=self.kindia)
+        self.assertTrue(couverture.index_couverture().est_eligible('FO', self.kindia.pk, commune.pk))
+
+    def test_souscription_non_couverte(self):
+        url = reverse('souscription_form', args=[self.fibre.pk])
+        reponse = self.client.post(url, {'region': self.kindia.pk, 'commune': self.kaloum.pk})
+        self.assertTemplateUsed(reponse, 'core/souscription_non_couverte.html')
+        self.assertContains(reponse, 'Radio 10')
+        reponse = self.client.post(url, {'region': self.conakry.pk, 'commune': self.kaloum.pk})
+        self.assertTemplateUsed(reponse, 'core/souscription_form.html')
+        self.assertContains(reponse, 'value="Kaloum"')
+
+    def test_api(self):
+        reponse = self.client.get(reverse('api_eligibilite'), {'zone': self.conakry.pk, 'commune': self.kaloum.pk})
+        self.assertEqual(reponse.json(), {
+            'zone': self.conakry.pk, 'commune': self.kaloum.pk, 'couverte': True, 'types': ['FH', 'FO'],
+        })
+        reponse = self.client.get(reverse('api_eligibilite'), {'zone': self.kindia.pk, 'commune': self.kaloum.pk})
+        self.assertEqual(reponse.json(), {'zone': self.kindia.pk, 'commune': None, 'couverte': False, 'types': ['FH']})
+
+
+class JetonsGoogleTests(TestCase):
+    """Jetons Google vérifiés localement, clés téléchargées une fois puis gardées en cache."""
+    CLIENT_ID = 'test.apps.googleusercontent.com'
+
+    def setUp(self):
+        self.google = ModeTest()
+        self.google.__enter__()
+        self.addCleanup(self.google.__exit__)
+        reglages = override_settings(GOOGLE_CERTS_URL=self.google.url)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        jetons_google.oublier_cles()
+
+    def test_cles_en_cache(self):
+        for _ in range(3):
+            contenu = jetons_google.verifier_jeton(self.google.jeton('a@example.com', self.CLIENT_ID), self.CLIENT_ID)
+        self.assertEqual(contenu['email'], 'a@example.com')
+        self.assertEqual(self.google.telechargements, 1)
+        # Autre worker : mémoire vide, clés lues dans le cache partagé
+        jetons_google._jeu = jetons_google.JeuDeCles()
+        jetons_google.verifier_jeton(self.google.jeton('a@example.com', self.CLIENT_ID), self.CLIENT_ID)
+        self.assertEqual(self.google.telechargements, 1)
+
+    def test_expiration_cache_control(self):
+        self.google.max_age = 0
+        for _ in range(2):
+            jetons_google.verifier_jeton(self.google.jeton('a@example.com', self.CLIENT_ID), self.CLIENT_ID)
+        self.assertEqual(self.google.telechargements, 2)
+
+    def test_jetons_refuses(self):
+        invalides = [
+            self.google.jeton('a@example.com', 'autre-client'),
+            self.google.jeton('a@example.com', self.CLIENT_ID, iss='https://pirate.example.com'),
+            self.google.jeton('a@example.com', self.CLIENT_ID, exp=int(time.time()) - 3600),
+            ModeTest().jeton('a@example.com', self.CLIENT_ID),  # clé inconnue
+            'pas-un-jeton',
+        ]
+        for jeton in invalides:
+            with self.subTest(jeton=jeton[:20]), self.assertRaises(ValueError):
+                jetons_google.verifier_jeton(jeton, self.CLIENT_ID)
+        # Une clé inconnue provoque un seul nouveau téléchargement, pas un par tentative
+        self.assertEqual(self.google.telechargements, 2)
+
+    def test_telechargement_hors_verrou(self):
+        # Un téléchargement lent ne bloque pas les connexions servies par les clés en mémoire
+        telecharger = jetons_google._telecharger
+
+        def verifier_verrou(url):
+            self.assertFalse(jetons_google._verrou.locked())
+            return telecharger(url)
+
+        with mock.patch.object(jetons_google, '_telecharger', side_effect=verifier_verrou) as appel:
+            jetons_google.verifier_jeton(self.google.jeton('a@example.com', self.CLIENT_ID), self.CLIENT_ID)
+        self.assertEqual(appel.call_count, 1)
+
+    def test_connexion(self):
+        with mock.patch.dict(os.environ, {'GOOGLE_OAUTH_CLIENT_ID': self.CLIENT_ID}):
+            reponse = self.client.post(reverse('auth_receiver'), {
+                'credential': self.google.jeton('nouveau@example.com', self.CLIENT_ID),
+            })
+        self.assertRedirects(reponse, reverse('accueil'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), User.objects.get(email='nouveau@example.com').pk)
+
+
+class ComptesTests(TestCase):
+    """Nom d'utilisateur unique sans compter la table, utilisateur retrouvé par email indexé."""
+
+    def test_nom_libre_puis_suffixe(self):
+        with CaptureQueriesContext(connection) as ctx:
+            premier = creer_utilisateur('jean.dupont@example.com', 'Jean', 'Dupont')
+        self.assertEqual(premier.username, 'jean.dupont')
+        self.assertFalse(premier.has_usable_password())
+        self.assertFalse(any('COUNT(' in q['sql'].upper() for q in ctx.captured_queries))
+        second = creer_utilisateur('jean.dupont@autre.example.com')
+        self.assertRegex(second.username, r'^jean\.dupont\d+$')
+
+    def test_collisions(self):
+        User.objects.create_user('marie')
+        User.objects.create_user('marie7')
+        with mock.patch('core.comptes.secrets.randbelow', side_effect=[7, 8]):
+            self.assertEqual(creer_utilisateur('marie@example.com').username, 'marie8')
+
+    def test_index_email(self):
+        with connection.cursor() as cursor:
+            contraintes = connection.introspection.get_constraints(cursor, User._meta.db_table)
+        self.assertEqual(contraintes['core_user_email_idx']['columns'], ['email'])
@@ -8,6 +8,8 @@ urlpatterns = [
     path('contact/', views.contact, name='contact'),
     path('qui-sommes-nous/', views.qui_sommes_nous, name='qui_sommes_nous'),
     path('zone-couverture/', views.zone_couverture, name='zone_couverture'),
+    path('api/couverture/', views.api_couverture, name='api_couverture'),
+    path('api/eligibilite/', views.api_eligibilite, name='api_eligibilite'),
     path('blog/', views.blog, name='blog'),
     path('mentions-legales/', views.mentions_legales, name='mentions_legales'),
     path('faq/', views.faq, name='faq'),
@@ -40,4 +42,8 @@ urlpatterns = [
     path('tickets/', views.tickets, name='tickets'),
     path('commandes/', views.mes_commandes, name='mes_commandes'),
     path('commande/<int:order_id>/', views.commande_detail, name='commande_detail'),
+
+    # Mesures de performance (staff)
+    path('_perf/', views.perf, name='perf'),
+    path('metrics', views.metriques_prometheus, name='metriques'),
 ]
\ No newline at end of file
@@ -1,31 +1,47 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse, HttpResponse
 from django.db import models
 from django.core.mail import send_mail
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.utils.crypto import constant_time_compare
 from django.utils.html import strip_tags
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import login
 from django.urls import reverse
-from django.db.models import Sum
+from django.db.models import Prefetch
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_safe
+from django.utils.cache import patch_cache_control
 
 import os
+import time
 
 from .forms import MessageContactForm, InfosClientForm
+from .catalogue import PRODUITS_PAR_PAGE, categories_avec_apercu, produits_carte
+from .couverture import couverture, formulaire_couverture, index_couverture
+from .comptes import creer_utilisateur
+from .fraicheur import get_conditionnel
+from .jetons_google import verifier_jeton
+from .pages import page_anonyme_en_cache
+from .pagination import paginer, reponse_paginee
+from . import metriques
+from .perf import mesures_tous_workers, statistiques
+from .emails import envoyer_email_avec_logo, mettre_en_file
+from .panier import (
+    appliquer_delta, montant_ligne, vider, charger_panier, charger_panier_anonyme, resume_tenu,
+    lire_panier_anonyme, ecrire_panier_anonyme, fusionner_panier_anonyme,
+)
 from .models import (
-    Actualite, QuickBlock, Faq, Forfait, Produit, Panier, PanierItem,
+    Actualite, ActualiteImage, QuickBlock, Faq, Forfait, Produit, Panier, PanierItem,
     Categorie, SousCategorie, ZoneCouverture, Commune, Agence,
     DemandeSouscription, Order, OrderItem, Logo, WifiTicketType, WifiTicket
 )
 
-from google.oauth2 import id_token
-from google.auth.transport import requests
-
 # ===== AUTHENTIFICATION - GOOGLE OAUTH UNIQUEMENT =====
 
 
@@ -41,14 +57,15 @@ def auth_receiver(request):
     client_id = os.environ.get('GOOGLE_OAUTH_CLIENT_ID')
     if not client_id:
         print("ERROR: GOOGLE_OAUTH_CLIENT_ID not found in environment variables")
+        metriques.connexions_google.inc(resultat='configuration')
         return HttpResponse(status=500)
 
     try:
-        user_data = id_token.verify_oauth2_token(
-            token, requests.Request(), client_id
-        )
+        # Vérification locale, clés de Google en cache (core/jetons_google.py)
+        user_data = verifier_jeton(token, client_id)
     except ValueError as e:
         print(f"ERROR: Token verification failed: {e}")
+        metriques.connexions_google.inc(resultat='jeton_invalide')
         return HttpResponse(status=403)
 
     # Extraire les informations de l'utilisateur Google
@@ -59,24 +76,19 @@ def auth_receiver(request):
 
     if not email:
         print("ERROR: No email in user_data")
+        metriques.connexions_google.inc(resultat='sans_email')
         return HttpResponse(status=400)
 
-    # Chercher ou créer l'utilisateur Django
-    user = User.objects.filter(email=email).first()
+    # Chercher ou créer l'utilisateur Django (index core_user_email_idx)
+    user = User.objects.filter(email=email).order_by('pk').first()
     if not user:
         # Créer un nouvel utilisateur à partir des données Google
-        user = User.objects.create_user(
-            username=email.split('@')[0] + str(User.objects.count() + 1),
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-            is_active=True
-        )
-        user.set_unusable_password()
-        user.save()
+        user = creer_utilisateur(email, first_name=first_name, last_name=last_name)
         print(f"✓ New user created: {user.username}")
+        metriques.connexions_google.inc(resultat='nouveau')
     else:
         print(f"✓ Existing user logged in: {user.username}")
+        metriques.connexions_google.inc(resultat='existant')
 
     # Authentifier l'utilisateur dans Django
     login(request, user, backend='django.contrib.auth.backends.ModelBackend')
@@ -84,8 +96,11 @@ def auth_receiver(request):
     # Stocker les données Google dans la session
     request.session['user_data'] = user_data
 
-    # Rediriger vers la page d'accueil
-    return redirect('accueil')
+    # Rediriger vers la page d'accueil, en reprenant le panier constitué hors connexion
+    response = redirect('accueil')
+    if fusionner_panier_anonyme(request, user):
+        ecrire_panier_anonyme(request, response, {})
+    return response
 
 
 def sign_out(request):
@@ -97,47 +112,94 @@ def sign_out(request):
     return redirect('account_login')
 
 
+@page_anonyme_en_cache('quickblock', 'forfait', 'produit', 'actualite', 'zone')
 def accueil(request):
     # Nettoyer le flag de session si présent
     if 'just_logged_in' in request.session:
         del request.session['just_logged_in']
 
     quick_blocks = QuickBlock.objects.all().order_by('ordre')
-    latest_news = Actualite.objects.order_by('-date_pub')[:6]
+    latest_news = Actualite.objects.order_by('-date_pub', '-pk').prefetch_related(
+        Prefetch('images', queryset=ActualiteImage.objects.order_by('pk')[:1], to_attr='premiere_image')
+    )[:6]
     bons_plans_forfaits = Forfait.objects.filter(is_bon_plan=True)[:3]
     bons_plans_equipements = Produit.objects.filter(is_bon_plan=True, quantite__gt=0)[:3] 
-    regions = ZoneCouverture.objects.all()
-    communes = Commune.objects.all()
     return render(request, 'core/accueil.html', {
         'quick_blocks': quick_blocks,
         'latest_news': latest_news,
         'bons_plans_forfaits': bons_plans_forfaits,
         'bons_plans_equipements': bons_plans_equipements,
-        "regions": regions,
-        "communes": communes,
+        **formulaire_couverture(),
     })
 
+ACTUALITES_PAR_PAGE = 10
+COMMANDES_PAR_PAGE = 20
+
+
+@get_conditionnel('actualite')
+@page_anonyme_en_cache('actualite')
 def blog(request):
-    actualites = Actualite.objects.all().order_by('-date_pub')
-    return render(request, 'core/blog.html', {'actualites': actualites})
+    # Toutes les images des actualités de la page en une requête (carrousel de chaque carte)
+    actualites = Actualite.objects.prefetch_related(
+        Prefetch('images', queryset=ActualiteImage.objects.order_by('pk'))
+    )
+    page = paginer(actualites, ('-date_pub', '-pk'), request.GET.get('curseur'), ACTUALITES_PAR_PAGE)
+    return reponse_paginee(request, 'core/blog.html', 'core/fragments/blog_actualites.html', page, {
+        'actualites': page.items,
+    })
 
+@get_conditionnel('zone')
+@page_anonyme_en_cache('zone')
 def zone_couverture(request):
     from .models import ZoneCouverture
     zones = ZoneCouverture.objects.prefetch_related('communes').all()
     return render(request, 'core/zone_couverture.html', {'zones': zones})
 
+@require_safe
+@condition(etag_func=lambda request: couverture()['empreinte'])
+def api_couverture(request):
+    """
+    Régions couvertes et leurs communes (JSON compact), chargées à la demande
+    par les formulaires. Appelée avec ?v=<empreinte courante>, la réponse est
+    immuable pour le navigateur ; sinon elle est revalidée par ETag.
+    """
+    donnees = couverture()
+    response = HttpResponse(donnees['json'], content_type='application/json')
+    if request.GET.get('v') == donnees['empreinte']:
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+@require_safe
+def api_eligibilite(request):
+    """
+    Types de forfait disponibles à une adresse, pour les applications terrain
+    des partenaires commerciaux : ?zone=<id>&commune=<id> (identifiants de
+    /api/couverture/). Réponse tirée de l'index en mémoire, sans requête SQL.
+    """
+    index = index_couverture()
+    zone_id, commune_id = request.GET.get('zone'), request.GET.get('commune')
+    zone, commune = index.localiser(zone_id, commune_id)
+    response = JsonResponse({
+        'zone': zone.pk if zone else None,
+        'commune': commune.pk if commune else None,
+        'couverte': commune is not None,
+        'types': sorted(index.types_eligibles(zone_id, commune_id)),
+    })
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
 def contact(request):
     if request.method == 'POST':
         form = MessageContactForm(request.POST)
         if form.is_valid():
             message = form.save()
-            # Envoi d’un email à l’admin
-            send_mail(
-                subject=f"Nouveau message de contact : {message.sujet}",
-                message=f"Nom : {message.nom}\nEmail : {message.email}\nMessage :\n{message.message}",
-                from_email=None,
-                recipient_list=['noc@skyconnect-sa.com'],  # Mets ici l’email à notifier
-                fail_silently=False,
+            # Envoi d’un email à l’admin (via la file d'envoi)
+            mettre_en_file(
+                sujet=f"Nouveau message de contact : {message.sujet}",
+                corps_texte=f"Nom : {message.nom}\nEmail : {message.email}\nMessage :\n{message.message}",
+                destinataires=['noc@skyconnect-sa.com'],  # Mets ici l’email à notifier
             )
             messages.success(request, "Votre message a bien été envoyé !")
             return redirect('contact')
@@ -145,21 +207,24 @@ def contact(request):
         form = MessageContactForm()
     return render(request, 'core/contact.html', {'form': form})
 
+@page_anonyme_en_cache()
 def qui_sommes_nous(request):
     return render(request, 'core/qui_sommes_nous.html')
 
+@page_anonyme_en_cache()
 def mentions_legales(request):
     return render(request, 'core/mentions_legales.html')
 
+@get_conditionnel('faq')
+@page_anonyme_en_cache('faq')
 def faq(request):
     faqs = Faq.objects.prefetch_related('steps__images').order_by('ordre')
     return render(request, 'core/faq.html', {'faqs': faqs})
 
 
-@login_required
 def ajouter_au_panier(request, produit_id):
     """
-    Ajoute une quantité au panier de l'utilisateur.
+    Ajoute une quantité au panier de l'utilisateur (cookie signé si anonyme).
     Accepte q en querystring (GET) ou POST.
     Valide et clamp la quantité entre 1 et produit.quantite.
     Retourne {'success': True, 'panier_count': <int>} ou {'success': False, 'error': ...}
@@ -175,63 +240,115 @@ def ajouter_au_panier(request, produit_id):
     if q < 1:
         q = 1
 
+    connecte = request.user.is_authenticated
     if produit.quantite <= 0:
+        metriques.ajouts_panier.inc(connecte=connecte, resultat='indisponible')
         return JsonResponse({'success': False, 'error': "Produit indisponible."}, status=400)
 
     q = min(q, produit.quantite)
 
-    panier, _ = Panier.objects.get_or_create(user=request.user)
-    panier_item, created = PanierItem.objects.get_or_create(panier=panier, produit=produit, defaults={'quantite': q})
-    if not created:
-        # additionne en respectant le stock max
-        new_qty = min(produit.quantite, panier_item.quantite + q)
-        panier_item.quantite = new_qty
-        panier_item.save(update_fields=['quantite'])
+    if not connecte:
+        contenu = lire_panier_anonyme(request)
+        contenu[produit.pk] = min(produit.quantite, contenu.get(produit.pk, 0) + q)
+        response = JsonResponse({'success': True, 'panier_count': sum(contenu.values())})
+        ecrire_panier_anonyme(request, response, contenu)
+        metriques.ajouts_panier.inc(connecte=connecte, resultat='ok')
+        return response
 
-    # Compte total d'articles (somme des quantités)
-    total_q = PanierItem.objects.filter(panier=panier).aggregate(total=Sum('quantite'))['total'] or 0
+    panier, _ = Panier.objects.get_or_create(user=request.user)
+    with resume_tenu():
+        panier_item, created = PanierItem.objects.get_or_create(panier=panier, produit=produit, defaults={'quantite': q})
+        ajout = q
+        if not created:
+            # additionne en respectant le stock max
+            new_qty = min(produit.quantite, panier_item.quantite + q)
+            ajout = new_qty - panier_item.quantite
+            panier_item.quantite = new_qty
+            panier_item.save(update_fields=['quantite'])
+
+    # Compte total d'articles, tenu à jour dans le résumé du panier
+    total_q = appliquer_delta(panier, ajout, montant_ligne(produit, ajout))
+    metriques.ajouts_panier.inc(connecte=connecte, resultat='ok')
 
     return JsonResponse({'success': True, 'panier_count': int(total_q)})
 
-@login_required
 def retirer_du_panier(request, item_id):
-    PanierItem.objects.filter(id=item_id, panier__user=request.user).delete()
+    if not request.user.is_authenticated:
+        # Panier anonyme : item_id est l'identifiant du produit
+        contenu = lire_panier_anonyme(request)
+        contenu.pop(item_id, None)
+        response = redirect('panier')
+        ecrire_panier_anonyme(request, response, contenu)
+        return response
+    item = PanierItem.objects.filter(id=item_id, panier__user=request.user).select_related('panier', 'produit').first()
+    if item:
+        with resume_tenu():
+            item.delete()
+        appliquer_delta(item.panier, -item.quantite, -montant_ligne(item.produit, item.quantite))
     return redirect('panier')
 
-@login_required
 def changer_quantite(request, item_id):
-    item = get_object_or_404(PanierItem, id=item_id, panier__user=request.user)
+    if not request.user.is_authenticated:
+        return changer_quantite_anonyme(request, item_id)
+    item = get_object_or_404(PanierItem.objects.select_related('panier', 'produit'), id=item_id, panier__user=request.user)
     produit = item.produit
     if request.method == "POST":
-        quantite = int(request.POST.get("quantite", 1))
+        quantite = _quantite_postee(request)
+        if quantite is None:
+            return redirect('panier')
         if quantite > produit.quantite:
             quantite = produit.quantite
+        ancienne = item.quantite
+        with resume_tenu():
+            if quantite > 0:
+                item.quantite = quantite
+                item.save(update_fields=['quantite'])
+            else:
+                quantite = 0
+                item.delete()
+        appliquer_delta(
+            item.panier,
+            quantite - ancienne,
+            montant_ligne(produit, quantite) - montant_ligne(produit, ancienne),
+        )
+    return redirect('panier')
+
+def _quantite_postee(request):
+    # Saisie libre du visiteur : une valeur illisible laisse le panier inchangé
+    try:
+        return int(request.POST.get("quantite", 1))
+    except (TypeError, ValueError):
+        return None
+
+def changer_quantite_anonyme(request, produit_id):
+    contenu = lire_panier_anonyme(request)
+    response = redirect('panier')
+    quantite = _quantite_postee(request) if request.method == "POST" else None
+    if quantite is not None and produit_id in contenu:
+        stock = Produit.objects.filter(pk=produit_id).values_list('quantite', flat=True).first() or 0
+        quantite = min(quantite, stock)
         if quantite > 0:
-            item.quantite = quantite
-            item.save()
+            contenu[produit_id] = quantite
         else:
-            item.delete()
-    return redirect('panier')
+            del contenu[produit_id]
+        ecrire_panier_anonyme(request, response, contenu)
+    return response
 
-@login_required
 def vider_panier(request):
+    if not request.user.is_authenticated:
+        response = redirect('panier')
+        ecrire_panier_anonyme(request, response, {})
+        return response
     panier, _ = Panier.objects.get_or_create(user=request.user)
-    panier.items.all().delete()
+    vider(panier)
     return redirect('panier')
 
-@login_required
 def voir_panier(request):
-    panier, created = Panier.objects.get_or_create(user=request.user)
-    items = []
-    for item in panier.items.all():
-        items.append({
-            'id': item.id,
-            'produit': item.produit,
-            'quantite': item.quantite,
-            'total_ligne': item.produit.prix_ttc * item.quantite,
-        })
-    total = sum(i['total_ligne'] for i in items)
-    return render(request, 'core/panier.html', {'items': items, 'total': total, 'panier': panier})
+    if request.user.is_authenticated:
+        items = charger_panier(request.user)
+    else:
+        items = charger_panier_anonyme(lire_panier_anonyme(request))
+    return render(request, 'core/panier.html', {'items': items, 'total': items.total})
 
 @login_required
 def mes_commandes(request):
@@ -239,29 +356,34 @@ def mes_commandes(request):
     commandes = Order.objects.filter(
         models.Q(client=request.user) | 
         (models.Q(client__isnull=True) & models.Q(email=request.user.email))
-    ).order_by('-date_commande')
-    return render(request, 'core/mes_commandes.html', {'commandes': commandes})
+    )
+    page = paginer(commandes, ('-date_commande', '-pk'), request.GET.get('curseur'), COMMANDES_PAR_PAGE)
+    return reponse_paginee(request, 'core/mes_commandes.html', 'core/fragments/commandes_lignes.html', page, {
+        'commandes': page.items,
+    })
 
+@get_conditionnel('forfait', 'zone')
+@page_anonyme_en_cache('forfait', 'zone')
 def forfaits(request):
     forfaits = Forfait.objects.all()
-    regions = ZoneCouverture.objects.all()  # On récupère toutes les régions
-    communes = Commune.objects.all()
     return render(request, "core/forfaits.html", {
         "forfaits": forfaits,
-        "regions": regions,
-        "communes": communes,
+        **formulaire_couverture(),
     })
 # Exemple dans views.py
+@page_anonyme_en_cache('produit')
 def equipements(request):
-    categories = Categorie.objects.prefetch_related('sous_categories__produits').all()
+    categories = categories_avec_apercu()
     return render(request, 'core/equipements.html', {'categories': categories})
 
+@get_conditionnel('produit')
 def sous_categorie_detail(request, id):
-    sous_categorie = SousCategorie.objects.prefetch_related('produits').get(id=id)
-    produits = sous_categorie.produits.all()
-    return render(request, 'core/sous_categorie_detail.html', {
+    sous_categorie = get_object_or_404(SousCategorie, id=id)
+    produits = produits_carte(longueur_resume=121).filter(sous_categorie=sous_categorie)
+    page = paginer(produits, ('pk',), request.GET.get('curseur'), PRODUITS_PAR_PAGE)
+    return reponse_paginee(request, 'core/sous_categorie_detail.html', 'core/fragments/produits_cartes.html', page, {
         'sous_categorie': sous_categorie,
-        'produits': produits,
+        'produits': page.items,
     })
 
 def menu_categories(request):
@@ -272,6 +394,7 @@ def menu_categories(request):
         'accessoire_categories': accessoire_categories.sous_categories.all() if accessoire_categories else [],
     }
 
+@get_conditionnel('produit')
 def produit_detail(request, id):
     produit = Produit.objects.get(id=id)
     # Traitement des caractéristiques
@@ -301,33 +424,23 @@ def souscription_form(request, forfait_id):
         # accepte region OR region_id pour compatibilité
         region_id = request.POST.get("region") or request.POST.get("region_id")
         commune_id = request.POST.get("commune") or request.POST.get("commune_id")
-        zone = ZoneCouverture.objects.filter(id=region_id).first() if region_id else None
-        commune = Commune.objects.filter(id=commune_id, zone_id=region_id).first() if commune_id else None
-        # Afficher "zone non couverte" uniquement pour FO
-        if (not zone or not commune) and forfait.type == "FO":
-            autres_forfaits = Forfait.objects.filter(type="FH")
+        index = index_couverture()
+        zone, commune = index.localiser(region_id, commune_id)
+        # Afficher "zone non couverte" quand le forfait n'est pas disponible dans la commune (FO)
+        if not index.est_eligible(forfait.type, region_id, commune_id):
             return render(request, "core/souscription_non_couverte.html", {
-                "autres_forfaits": autres_forfaits,
+                "autres_forfaits": index.forfaits_repli,
                 "forfait": forfait,
             })
         if zone and commune:
-            # rendre le formulaire avec les context utiles (regions/communes si nécessaires)
-            regions = ZoneCouverture.objects.all()
-            communes = Commune.objects.all()
             return render(request, "core/souscription_form.html", {
                 "forfait": forfait,
                 "zone": zone,
                 "commune": commune,
-                "regions": regions,
-                "communes": communes,
             })
       # GET
-    regions = ZoneCouverture.objects.all()
-    communes = Commune.objects.all()
     return render(request, "core/souscription_form.html", {
         "forfait": forfait,
-        "regions": regions,
-        "communes": communes,
     })
 import re
 from django.core.validators import validate_email
@@ -361,14 +474,10 @@ def finaliser_souscription(request):
         erreurs.append("Identifiant de commune invalide.")
 
     if erreurs:
-        regions = ZoneCouverture.objects.all()
-        communes = Commune.objects.all()
         forfait = Forfait.objects.filter(id=int(forfait_id)).first() if forfait_id.isdigit() else None
         return render(request, "core/souscription_form.html", {
             "erreurs": erreurs,
             "forfait": forfait,
-            "regions": regions,
-            "communes": communes,
         })
 
     # Récupération sécurisée des objets
@@ -377,24 +486,16 @@ def finaliser_souscription(request):
     except (Forfait.DoesNotExist, ValueError):
         erreurs.append("Forfait introuvable.")
 
-    try:
-        zone = ZoneCouverture.objects.get(id=int(region_id))
-    except (ZoneCouverture.DoesNotExist, ValueError):
+    zone, commune = index_couverture().localiser(region_id, commune_id)
+    if zone is None:
         erreurs.append("Zone introuvable.")
-
-    try:
-        commune = Commune.objects.get(id=int(commune_id), zone_id=int(region_id))
-    except (Commune.DoesNotExist, ValueError):
+    if commune is None:
         erreurs.append("Commune introuvable pour la région sélectionnée.")
 
     if erreurs:
-        regions = ZoneCouverture.objects.all()
-        communes = Commune.objects.all()
         return render(request, "core/souscription_form.html", {
             "erreurs": erreurs,
             "forfait": forfait if 'forfait' in locals() else None,
-            "regions": regions,
-            "communes": communes,
         })
 
     # Validation téléphone et email
@@ -425,12 +526,10 @@ def finaliser_souscription(request):
         commune=commune,
     )
 
-    send_mail(
-        subject=f"Nouvelle souscription : {forfait.nom}",
-        message=f"Nom : {nom}\nTéléphone : {telephone}\nEmail : {email}\nForfait : {forfait.nom}\nRégion : {zone.region}\nCommune : {commune.nom}",
-        from_email=None,
-        recipient_list=os.environ['EMAIL_COMMERCIAL'],
-        fail_silently=False,
+    mettre_en_file(
+        sujet=f"Nouvelle souscription : {forfait.nom}",
+        corps_texte=f"Nom : {nom}\nTéléphone : {telephone}\nEmail : {email}\nForfait : {forfait.nom}\nRégion : {zone.region}\nCommune : {commune.nom}",
+        destinataires=[os.environ['EMAIL_COMMERCIAL']],
     )
 
     return render(request, "core/souscription_confirmation.html", {
@@ -443,12 +542,8 @@ from django.utils.crypto import get_random_string
 
 @login_required
 def commande_infos_client(request):
-    panier, _ = Panier.objects.get_or_create(user=request.user)
-    items = PanierItem.objects.filter(panier=panier)
-    total = sum(item.produit.prix_ttc * item.quantite for item in items)
-
-    regions = ZoneCouverture.objects.all()
-    communes = Commune.objects.all()
+    items = charger_panier(request.user)
+    total = items.total
 
     if request.method == "POST":
         form = InfosClientForm(request.POST)
@@ -493,22 +588,18 @@ def commande_infos_client(request):
         "form": form,
         "items": items,
         "total": total,
-        "regions": regions,
-        "communes": communes,
+        **formulaire_couverture(),
     })
 
 from django.db import transaction
 from django.core.mail import send_mail
 from django.utils.crypto import get_random_string
-from django.template.loader import render_to_string
-from django.utils import timezone
 
 @login_required
 def commande_confirmation(request):
     # Récupération du panier et vérification
-    panier, _ = Panier.objects.get_or_create(user=request.user)
-    items = PanierItem.objects.filter(panier=panier)
-    total = sum(item.produit.prix_ttc * item.quantite for item in items)
+    items = charger_panier(request.user)
+    total = items.total
     infos = request.session.get('commande_infos')
     
     if not infos:
@@ -518,15 +609,14 @@ def commande_confirmation(request):
     agences = Agence.objects.all() if infos.get('choix_retrait') == 'agence' else None
 
     if request.method == "POST":
+        debut = time.perf_counter()
         try:
-            with transaction.atomic():
-                # Génération référence
-                date_str = timezone.now().strftime('%Y%m%d')
-                count = Order.objects.filter(
-                    date_commande__date=timezone.now().date()
-                ).count() + 1
-                reference = f"CMD-{date_str}-{count:04d}"
+            # Référence allouée et validée hors de la transaction de la commande :
+            # le compteur du jour n'est pas verrouillé pendant la création de la
+            # commande et des emails (une commande en échec laisse un numéro inutilisé)
+            reference = Order.nouvelle_reference()
 
+            with transaction.atomic():
                 # Création commande
                 order = Order.objects.create(
                     reference=reference,
@@ -543,19 +633,21 @@ def commande_confirmation(request):
                 )
 
                 # Création items sans toucher au stock
-                for item in items:
-                    OrderItem.objects.create(
+                OrderItem.objects.bulk_create([
+                    OrderItem(
                         commande=order,
                         produit=item.produit,
                         quantite=item.quantite,
-                        prix_unitaire=item.produit.prix_ttc,
-                        total_ligne=item.produit.prix_ttc * item.quantite
+                        prix_unitaire=item.prix_ttc,
+                        total_ligne=item.total_ligne,
                     )
+                    for item in items
+                ])
 
                 # Emails
                 context = {
                     'order': order,
-                    'items': order.items.all(),
+                    'items': order.items.select_related('produit'),
                     'infos': infos,
                 }
                 
@@ -579,7 +671,8 @@ def commande_confirmation(request):
                     )
 
                 # Vider panier
-                panier.items.all().delete()
+                for panier in Panier.objects.filter(user=request.user):
+                    vider(panier)
                 if 'commande_infos' in request.session:
                     del request.session['commande_infos']
 
@@ -590,10 +683,16 @@ def commande_confirmation(request):
                     'agence_nom': order.agence.nom if order.agence else None,
                 }
 
+                # Commande comptée une fois la transaction validée
+                def commande_validee(mode=order.mode_reception):
+                    metriques.commandes.inc(mode=mode, resultat='ok')
+                    metriques.duree_commandes.observer(time.perf_counter() - debut, mode=mode)
+                transaction.on_commit(commande_validee)
                 return redirect('commande_succes')
 
         except Exception as e:
             print(f"Erreur : {str(e)}")
+            metriques.commandes.inc(mode=infos.get('choix_retrait'), resultat='erreur')
             erreurs.append(f"Erreur : {str(e)}")
             return render(request, "core/commande_confirmation.html", {
                 "infos": infos,
@@ -650,54 +749,6 @@ def changer_statut_commande(request, order_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from email.mime.image import MIMEImage
-from django.conf import settings
-import os
-from .models import Logo  # Assurez-vous que c'est le bon modèle
-
-from django.core.mail import EmailMultiAlternatives
-from email.mime.image import MIMEImage
-from django.conf import settings
-import os
-
-def envoyer_email_avec_logo(request, sujet, template_html, template_txt, context, destinataire):
-    # Récupérer le dernier logo
-    logo = Logo.objects.last()
-    
-    # Créer le message
-    msg = EmailMultiAlternatives(
-        subject=sujet,
-        body=render_to_string(template_txt, context),
-        from_email=None,
-        to=[destinataire]
-    )
-    
-    # Si un logo existe, l'intégrer dans l'email
-    if logo and logo.image:
-        # Lire le fichier image
-        image_path = logo.image.path
-        with open(image_path, 'rb') as f:
-            logo_data = f.read()
-        
-        # Créer l'image attachée avec un Content-ID
-        logo_img = MIMEImage(logo_data)
-        logo_img.add_header('Content-ID', '<logo>')
-        msg.attach(logo_img)
-        
-        # Ajouter l'URL CID au contexte
-        context['logo_cid'] = 'cid:logo'
-    
-    # Ajouter la version HTML
-    html_content = render_to_string(template_html, context)
-    msg.attach_alternative(html_content, "text/html")
-    
-    # Envoyer
-    msg.send()
-
-
 def tickets(request):
     """Page d'achat de tickets WiFi hotspot.
 
@@ -713,4 +764,35 @@ def tickets(request):
         'ticket_types': ticket_types,
     }
 
-    return render(request, 'core/tickets.html', context)
\ No newline at end of file
+    return render(request, 'core/tickets.html', context)
+
+@staff_member_required
+def perf(request):
+    """Centiles de durée par vue sur la fenêtre glissante (mesures de PerfMiddleware, tous workers)."""
+    # Fenêtre bornée à ]0, PERF_FENETRE] : au-delà, les mesures ne sont plus conservées
+    try:
+        fenetre = int(request.GET.get('fenetre', settings.PERF_FENETRE))
+    except (TypeError, ValueError):
+        fenetre = settings.PERF_FENETRE
+    fenetre = max(1, min(fenetre, settings.PERF_FENETRE))
+    mesures, pids = mesures_tous_workers(fenetre)
+    return render(request, 'core/perf.html', {
+        'lignes': statistiques(fenetre, mesures),
+        'fenetre': fenetre,
+        'echantillon': settings.PERF_ECHANTILLON,
+        'export': settings.PERF_EXPORT,
+        'tampon': len(mesures),
+        'pids': sorted(pids),
+        'pid': os.getpid(),
+    })
+
+
+def metriques_prometheus(request):
+    """Métriques de tous les workers au format texte Prometheus."""
+    jeton = settings.METRIQUES_JETON
+    if not jeton:
+        # Sans jeton configuré, l'endpoint n'existe pas
+        raise Http404()
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {jeton}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metriques.exposer(), content_type='text/plain; version=0.0.4; charset=utf-8')
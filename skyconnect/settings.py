@@ -13,6 +13,12 @@ load_dotenv(dotenv_path, encoding='utf-8')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads adressés par contenu (core/storage.py) : pas de copies en double
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.StockageDedupe'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-change-me-in-production')
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1,web').split(',')
@@ -35,6 +41,9 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    # En premier pour mesurer toute la chaîne (désactivé si PERF_ECHANTILLON = 0)
+    'core.perf.PerfMiddleware',
+    'core.metriques.MetriquesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,6 +52,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    # En dernier : appelle lui-même la vue quand la requête est profilée
+    'core.profilage.ProfilageMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -80,6 +91,9 @@ if DB_ENGINE == 'sqlite':
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Base de test sur disque : les tests multi-threads échouent sur la
+            # base en mémoire partagée ("database table is locked")
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 else:
@@ -94,6 +108,51 @@ else:
         }
     }
 
+# Cache partagé entre les workers gunicorn (l'invalidation par version doit
+# être vue par tous les processus, ce que LocMemCache ne permet pas)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'TIMEOUT': 300,
+    }
+}
+
+# Vérifie le résumé dénormalisé du panier contre l'agrégat réel après chaque
+# modification (coûteux, à activer pour le débogage uniquement)
+PANIER_VERIFY_SUMMARY = os.environ.get('PANIER_VERIFY_SUMMARY', 'False') == 'True'
+
+# Durée de fraîcheur (s) des pages publiques mises en cache pour les visiteurs
+# anonymes (core/pages.py), en plus de l'invalidation par signaux. 0 = désactivé
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', '300'))
+
+# Mesures par requête (core/perf.py, page /_perf/) : fraction des requêtes
+# mesurées (0 = désactivé, 1 = toutes), taille du tampon par worker et
+# fenêtre glissante des centiles en secondes. Chaque worker recopie ses mesures
+# toutes les PERF_EXPORT secondes dans PERF_DOSSIER, que /_perf/ agrège
+PERF_ECHANTILLON = float(os.environ.get('PERF_ECHANTILLON', '0.1'))
+PERF_TAMPON = int(os.environ.get('PERF_TAMPON', '5000'))
+PERF_FENETRE = int(os.environ.get('PERF_FENETRE', '900'))
+PERF_EXPORT = int(os.environ.get('PERF_EXPORT', '10'))
+PERF_DOSSIER = os.environ.get('PERF_DOSSIER', str(BASE_DIR / 'logs' / 'perf'))
+
+# Métriques Prometheus (core/metriques.py, /metrics) : un fichier par processus
+# dans ce dossier, partagé par les workers gunicorn et le worker d'emails.
+# /metrics exige "Authorization: Bearer <METRIQUES_JETON>" et répond 404 si aucun
+# jeton n'est défini.
+METRIQUES_DOSSIER = os.environ.get('METRIQUES_DOSSIER', str(BASE_DIR / 'logs' / 'metriques'))
+METRIQUES_JETON = os.environ.get('METRIQUES_JETON', '')
+
+# Profilage à la demande (core/profilage.py, commande "profils") : en-tête
+# X-Profilage pour le staff, vues toujours profilées, fraction des autres
+# requêtes. Mode "echantillonneur" (pile relevée toutes les
+# PROFILAGE_INTERVALLE secondes, .folded) ou "cprofile" (.prof).
+PROFILAGE_MODE = os.environ.get('PROFILAGE_MODE', 'echantillonneur')
+PROFILAGE_VUES = [v for v in os.environ.get('PROFILAGE_VUES', '').split(',') if v]
+PROFILAGE_ECHANTILLON = float(os.environ.get('PROFILAGE_ECHANTILLON', '0'))
+PROFILAGE_INTERVALLE = float(os.environ.get('PROFILAGE_INTERVALLE', '0.001'))
+PROFILAGE_DOSSIER = os.environ.get('PROFILAGE_DOSSIER', str(BASE_DIR / 'logs' / 'profils'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -110,7 +169,13 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Les emails passent par la file EmailSortant (manage.py envoyer_emails).
+# En local : EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+# avec EMAIL_FILE_PATH, ou le backend console/locmem.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'logs' / 'emails'))
+# Largeur (px) du logo joint aux emails, affiché à 150px (0 = fichier d'origine)
+EMAIL_LOGO_LARGEUR = int(os.environ.get('EMAIL_LOGO_LARGEUR', '300'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -140,4 +205,7 @@ SESSION_COOKIE_SECURE = False  # Pas HTTPS en local
 CSRF_COOKIE_SECURE = False
 
 # OAuth Google uniquement - via auth-receiver (pas de formulaires allauth)
-# Voir core/views.py pour la logique OAuth personnalisée
\ No newline at end of file
+# Voir core/views.py pour la logique OAuth personnalisée
+# Clés publiques (JWKS) de vérification des jetons, gardées en cache selon
+# leur Cache-Control (core/jetons_google.py). Hors ligne : URL d'un ModeTest.
+GOOGLE_CERTS_URL = os.environ.get('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')